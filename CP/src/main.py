@@ -1,35 +1,36 @@
 from datetime import timedelta
-import time
-from minizinc import Solver, Instance, Model
+from functools import partial
+from minizinc import Solver, Instance, Model, Status
 from instance import Instance as ins
+from solution_cache import SolutionCache
+from verifier import check_placement, verify_placement
 import numpy as np
-from tqdm import tqdm
+from renderer import RENDERERS
+from results import ResultsStore
+from phases import PhaseTimer
 from utils import *
 import argparse
 
 solvers = ["chuffed", "gecode"]
 
-if __name__ == '__main__':
-    # Create an argument parser
-    parser = argparse.ArgumentParser(description='CP argument parsing')
+# folder of the solved instances
+SOLUTION_CACHE_PATH = './solution_cache/'
 
-    # Add arguments
-    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instance folder name')
-    parser.add_argument('--rotation', action='store_true', help='Set circuit rotation to True')
-    parser.add_argument('--simmetry_breaking', action='store_true', help='Set solving simmetry breaking to True')
-    args = parser.parse_args()
-    
-    folder_name = args.folder_name
-    rotation = args.rotation
-    simmetry_breaking = args.simmetry_breaking
-    output_txt_path, output_img_path, output_failure_path, model_name = set_environment(rotation, simmetry_breaking)
-    
-    instances = import_instances(folder_name)
+# results store and timing.csv exported from it
+RESULTS_PATH = './results.db'
+TIMING_PATH = './timing.csv'
 
-    for i in tqdm(range(len(instances))):
-        name_instance = f'{i}_instance'
-        instance = ins(instances[i], name_instance, rotation, simmetry_breaking)
-                
+
+def solve_instance(instance, model_name, time_limit=300, timer=None):
+    '''
+    Solving an instance with the MiniZinc model "model_name", returning the MiniZinc result.
+    If a PhaseTimer is given, loading the model and its data is timed as its 'encode' phase and the solving
+    (with the flattening of the model by MiniZinc) as its 'solve' phase.
+    '''
+    if timer is None:
+        timer = PhaseTimer()
+
+    with timer.phase('encode'):
         model = Model(model_name)
         solver = Solver.lookup(solvers[0])
         inst = Instance(solver, model)
@@ -37,22 +38,140 @@ if __name__ == '__main__':
         inst["n"] = instance.get_n_circuits()
         inst["widths"] = np.array(instance.get_circuit_widths())
         inst["heights"] = np.array(instance.get_circuit_heights())
+        inst["min_h"] = instance.get_min_height()
+        inst["max_h"] = instance.get_max_height()
+
+    with timer.phase('solve'):
+        return inst.solve(timeout=timedelta(seconds=time_limit), free_search=True)
+
+
+def get_placement(instance, time_limit=300):
+    '''
+    Solving an instance and returning (circuits, height, optimal), with the circuits placed as [width, height, x, y].
+    optimal is True when the solver proved the height minimal. It returns None if no solution is found.
+    '''
+    out = solve_instance(instance, get_model_name(instance.get_rotation(), instance.get_simmetry_breaking()), time_limit)
+    if out.solution is None:
+        return None
+
+    circuits = []
+    for h in range(instance.get_n_circuits()):
+        width, height = instance.get_circuit_widths()[h], instance.get_circuit_heights()[h]
+        if instance.get_rotation() and out['rotate'][h]:
+            width, height = height, width
+        circuits.append([width, height, out['X'][h], out['Y'][h]])
+    return circuits, out['objective'], out.status == Status.OPTIMAL_SOLUTION
+
+
+def run_instance(i, raw_instance, rotation, simmetry_breaking, output_paths, model_name, solution_cache=None, refresh=False, renderer='matplotlib',
+                 results=None):
+    '''
+    Solving the i-th instance and writing its solution, returning the time needed to solve it.
+    output_paths is the tuple (output_txt_path, output_img_path, output_failure_path).
+    If a solution cache is given, a verified cached solution is written without solving the instance,
+    unless refresh is True. New solutions are stored in the cache.
+    renderer is the renderer of the solution image (see renderer.RENDERERS), None to write only the textual solution.
+    If a results store is given, the run is appended to it, with the times of its phases (see phases.PhaseTimer).
+    The time needed to solve the instance is the time of the encode, solve and decode phases.
+    '''
+    output_txt_path, output_img_path, output_failure_path = output_paths
+    timer = PhaseTimer()
+
+    name_instance = f'{i}_instance'
+    with timer.phase('parse'):
+        instance = ins(raw_instance, name_instance, rotation, simmetry_breaking)
+
+    if solution_cache is not None:
+        key = solution_cache.get_key(instance, 'CP', {'rotation': rotation, 'simmetry_breaking': simmetry_breaking})
+        entry = None if refresh else solution_cache.load(key)
+        if entry is not None and verify_placement(instance, entry['circuits'], entry['height']):
+            # the cached circuits are already rotated
+            circuits = [circuit + [0] for circuit in entry['circuits']] if rotation else entry['circuits']
+            decode_circuits(instance, entry['height'], output_txt_path, output_img_path, circuits, renderer, timer)
+            print(f"\nCached solution for instance {i + 1}")
+            print(f"minimum height found is: {entry['height']}")
+            print(f"The time requested for this instance was: {entry['solve_time']}")
+            if results is not None:
+                results.append('CP', i, instance, entry['height'], entry['optimal'], entry['solve_time'],
+                               timer.get_times(), {'cached': True})
+            return entry['solve_time']
             
-        # starting timing operation
-        start_time = time.time()
-        out = inst.solve(timeout=timedelta(seconds=300), free_search=True) 
-        run_time = time.time() - start_time
-        
+    out = solve_instance(instance, model_name, time_limit=300, timer=timer)
+    statistics = dict(out.statistics, status=str(out.status))
+    
+    with timer.phase('decode'):
         height = out['objective']
-        
+
         if rotation:
             circuits = [[instance.get_circuit_widths()[h],instance.get_circuit_heights()[h],out['X'][h],out['Y'][h], out['rotate'][h]] for h in range(instance.get_n_circuits())]
         else:
             circuits = [[instance.get_circuit_widths()[h],instance.get_circuit_heights()[h],out['X'][h],out['Y'][h]] for h in range(instance.get_n_circuits())]
-        decode_circuits(instance, height, output_txt_path, output_img_path, circuits)
-        print(f"\nSolution found for instance {i + 1}")
-        print(f"optimum height is: {instance.get_min_height()}")
-        print(f"minimum height found is: {height}")
-        print(f"The time requested for this instance was: {run_time}")
-        save_times_to_csv(rotation, simmetry_breaking, run_time, i)
-        
\ No newline at end of file
+        placed = [[c[1], c[0], c[2], c[3]] if rotation and c[4] else c[:4] for c in circuits]
+
+    # the solution is timed without checking, writing it and drawing its image
+    run_time = timer.get_solve_time()
+
+    # the placement is checked before it is written and cached
+    with timer.phase('verify'):
+        problems = check_placement(instance, placed, height)
+    if problems:
+        with open(output_failure_path, 'a') as output:
+            output.write(f'Instance {i + 1} failed verification: {"; ".join(problems)}')
+            output.write('\n')
+        print(f"\nWrong solution for instance {i + 1}: {'; '.join(problems)}")
+        if results is not None:
+            results.append('CP', i, instance, times=timer.get_times(), statistics=dict(statistics, problems=problems))
+        return '-'
+
+    decode_circuits(instance, height, output_txt_path, output_img_path, circuits, renderer, timer)
+
+    if solution_cache is not None:
+        solution_cache.store(key, placed, height, out.status == Status.OPTIMAL_SOLUTION, run_time)
+
+    print(f"\nSolution found for instance {i + 1}")
+    print(f"lower bound of the height is: {instance.get_min_height()} ({instance.get_lower_bound_name()} bound{', tight' if height == instance.get_min_height() else ''})")
+    print(f"minimum height found is: {height}")
+    print(f"The time requested for this instance was: {run_time}")
+    print(f"phases: {timer.summary()}")
+
+    if results is not None:
+        results.append('CP', i, instance, height, out.status == Status.OPTIMAL_SOLUTION, run_time, timer.get_times(), statistics)
+    return run_time
+
+
+if __name__ == '__main__':
+    # Create an argument parser
+    parser = argparse.ArgumentParser(description='CP argument parsing')
+
+    # Add arguments
+    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instances: a folder, a glob pattern, a bundle file or - for the standard input')
+    parser.add_argument('--rotation', action='store_true', help='Set circuit rotation to True')
+    parser.add_argument('--simmetry_breaking', action='store_true', help='Set solving simmetry breaking to True')
+    parser.add_argument('--no_cache', '--no-cache', action='store_true', help='Do not use the solution cache')
+    parser.add_argument('--refresh', action='store_true', help='Solve again the instances in the solution cache, updating it')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes solving the instances in parallel')
+    parser.add_argument('--renderer', type=str, default='matplotlib', choices=RENDERERS, help='Renderer of the solution images: matplotlib, fast (numpy PNG) or svg')
+    parser.add_argument('--no_render', '--no-render', action='store_true', help='Do not draw the solution images, they can be drawn later by render.py')
+    parser.add_argument('--results', type=str, default=RESULTS_PATH, help='SQLite database where every run is appended')
+    parser.add_argument('--export_timing', '--export-timing', action='store_true', help='Export timing.csv from the results store after the run')
+    args = parser.parse_args()
+    
+    folder_name = args.folder_name
+    rotation = args.rotation
+    simmetry_breaking = args.simmetry_breaking
+    solution_cache = SolutionCache(SOLUTION_CACHE_PATH) if not args.no_cache else None
+    results = ResultsStore(args.results)
+    output_txt_path, output_img_path, output_failure_path, model_name = set_environment(rotation, simmetry_breaking)
+    
+    instances = iter_instances(folder_name)
+
+    # the instances are solved in parallel by "jobs" processes, the timings are saved in instance order
+    solve = partial(run_instance, rotation=rotation, simmetry_breaking=simmetry_breaking,
+                    output_paths=(output_txt_path, output_img_path, output_failure_path), model_name=model_name,
+                    solution_cache=solution_cache, refresh=args.refresh, renderer=None if args.no_render else args.renderer,
+                    results=results)
+    timings = run_instances(solve, instances, args.jobs)
+
+    # Exporting the latest time of every instance and configuration into 'timing.csv' file
+    if args.export_timing:
+        results.export_timing_csv(TIMING_PATH, 'CP', len(timings))
@@ -0,0 +1,58 @@
+import hashlib
+import json
+import os
+import tempfile
+
+
+class SolutionCache():
+    '''
+    Persistent store of the solved instances. Every entry is a JSON file holding the placement
+    (circuits as [width, height, x, y]), the plate height, the optimality flag and the solve time.
+    Entries are keyed by the instance (sorted circuit multiset and plate width), the approach and its flags.
+    '''
+
+    def __init__(self, folder):
+        self._folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def get_key(self, instance, approach, flags):
+        '''
+        Returning the canonical key of an instance solved by an approach with the given flags (a dictionary)
+        '''
+        description = {
+            'circuits': sorted(list(instance.get_circuit(c)) for c in range(instance.get_n_circuits())),
+            'plate_width': instance.get_plate_width(),
+            'approach': approach,
+            'flags': flags,
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self._folder, f'{key}.json')
+
+    def load(self, key):
+        '''
+        Returning the entry stored with the given key, None if it is not in the cache
+        '''
+        try:
+            with open(self._path(key)) as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def store(self, key, circuits, height, optimal, solve_time):
+        '''
+        Storing the solution of an instance
+        '''
+        entry = {
+            'circuits': [[int(value) for value in circuit] for circuit in circuits],
+            'height': int(height),
+            'optimal': bool(optimal),
+            'solve_time': solve_time,
+        }
+        # the entry is written to a temporary file and renamed, so that a concurrent run never reads half of it
+        descriptor, temporary_path = tempfile.mkstemp(dir=self._folder, suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump(entry, file)
+        os.replace(temporary_path, self._path(key))
+
@@ -1,7 +1,21 @@
 import os
 import re
-import matplotlib.pyplot as plt
-import pandas as pd
+from renderer import render_solution
+from phases import PhaseTimer
+import glob
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from tqdm import tqdm
+
+def get_model_name(rotation, simmetry_breaking):
+    '''
+    Returning the MiniZinc model to use, depending on the rotation flag and the simmetry_breaking flag
+    '''
+    if rotation:
+        return "./cp_rot_sb.mzn" if simmetry_breaking else "./cp_rot.mzn"
+    return './cp_norot_sb.mzn' if simmetry_breaking else "./cp_norot.mzn"
+
 
 def set_environment(rotation, simmetry_breaking):
     '''
@@ -10,14 +24,14 @@ def set_environment(rotation, simmetry_breaking):
     which contains all the failed instances according to the parameters passed. It also
     returns the model_name
     '''
+    model_name = get_model_name(rotation, simmetry_breaking)
+
     if rotation:
 
         if simmetry_breaking:
             subfolder = '/simmetry_breaking/'
-            model_name = "./cp_rot_sb.mzn"
         else:
             subfolder = '/no_simmetry_breaking/'
-            model_name = "./cp_rot.mzn"
 
         output_txt_path = './outRot/txt' + subfolder
         output_img_path = './outRot/img' + subfolder
@@ -28,10 +42,8 @@ def set_environment(rotation, simmetry_breaking):
 
         if simmetry_breaking:
             subfolder = '/simmetry_breaking/'
-            model_name ='./cp_norot_sb.mzn'
         else:
             subfolder = '/no_simmetry_breaking/'
-            model_name = "./cp_norot.mzn"
             
         output_txt_path = './out/txt' + subfolder
         output_img_path = './out/img' + subfolder
@@ -45,11 +57,21 @@ def set_environment(rotation, simmetry_breaking):
 
 # Method used to plot the solution
 def plot_solution(instance, height, circuits, file=None):
+    # matplotlib is only loaded when an image is drawn with it
+    if file is not None:
+        # the image is drawn without pyplot, whose global state is shared by all the threads (see run_instances)
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure()
+        FigureCanvasAgg(fig)
+    else:
+        import matplotlib.pyplot as plt
+        fig = plt.figure()
         
     rotation = instance.get_rotation()
     width = instance.get_plate_width()
     SIZE = 10
-    fig, ax = plt.subplots()
+    ax = fig.subplots()
 
     fig.set_size_inches(SIZE, SIZE * height / width)
     colors = ['tab:red','tab:orange', 'yellow', 'tab:green','tab:blue','tab:purple','tab:brown', 'tab:grey']
@@ -76,8 +98,7 @@ def plot_solution(instance, height, circuits, file=None):
     ax.grid(color='b', linewidth = 1)
 
     if file is not None:
-        plt.savefig(file)
-        plt.close()
+        fig.savefig(file)
     else:
         plt.show()
 
@@ -108,19 +129,30 @@ def output_solution(instance, plate_height, circuits, output_path):
             output.write(item)
             output.write('\n')
 
-def decode_circuits(instance, height, output_txt_path, output_img_path, circuits):
+def decode_circuits(instance, height, output_txt_path, output_img_path, circuits, renderer='matplotlib', timer=None):
     '''
     Decoding circuits positions, setting up width and height depending on rotation. 
     It plots the solutions in the correct folder, writing a txt file containing the textual solution.
+    The image is drawn by matplotlib or by one of the fast renderers (see renderer.RENDERERS), and skipped if renderer is None.
+    If a PhaseTimer is given, drawing and writing are timed as its 'render' and 'write' phases.
     '''
+    if timer is None:
+        timer = PhaseTimer()
     
     #circuits = [[widths[h], heights[h], start_x[h], start_y[h]] for h in range(instance.get_n_circuits())]
 
     # file name
     filename = instance.get_name().split('_')[0]
 
-    plot_solution(instance, height, circuits, output_img_path+f'out-{int(filename) + 1}.png')
-    output_solution(instance, height, circuits, output_txt_path+f'out-{int(filename) + 1}.txt')
+    with timer.phase('render'):
+        if renderer == 'matplotlib':
+            plot_solution(instance, height, circuits, output_img_path+f'out-{int(filename) + 1}.png')
+        elif renderer is not None:
+            # the rotated circuits (flag set) have width and height swapped
+            placed = [[c[1], c[0], c[2], c[3]] if instance.get_rotation() and c[4] else c[:4] for c in circuits]
+            render_solution(instance.get_plate_width(), height, placed, output_img_path+f'out-{int(filename) + 1}.png', renderer)
+    with timer.phase('write'):
+        output_solution(instance, height, circuits, output_txt_path+f'out-{int(filename) + 1}.txt')
 
 def sorted_alphanumeric(data):
     '''
@@ -131,63 +163,90 @@ def sorted_alphanumeric(data):
 
     return sorted(data, key=alphanumeric_key)
 
-def import_instances(folder):
+# Compact record of an instance: the plate width and the (width, height) pairs of the circuits
+InstanceRecord = namedtuple('InstanceRecord', ['plate_width', 'circuits'])
+
+
+def parse_instance(lines, source='<instance>'):
     '''
-    import instances, file by file
+    Parsing the lines of an instance (plate width, number of circuits, one "width height" line per circuit)
+    into an InstanceRecord. The number of circuits declared in the header must match the circuits listed.
     '''
-    # list of files, ordered by name
-    files = [file for file in sorted_alphanumeric(os.listdir(folder))]
-    # list of instances, splitted line by line each instance
-    instances = [open(folder + file).read().splitlines() for file in files]
-    return instances
+    try:
+        values = [int(value) for line in lines for value in line.split()]
+    except ValueError as error:
+        raise ValueError(f"{source}: {error}") from None
+    if len(values) < 2 or len(values) % 2 != 0:
+        raise ValueError(f"{source}: expected the plate width, the number of circuits and a width and a height per circuit")
+
+    plate_width, n_circuits = values[0], values[1]
+    circuits = tuple(zip(values[2::2], values[3::2]))
+    if len(circuits) != n_circuits:
+        raise ValueError(f"{source}: {n_circuits} circuits declared, {len(circuits)} found")
+    return InstanceRecord(plate_width, circuits)
+
 
-def save_times_to_csv(rotation, simmetry_breaking, timing, ind):
+def read_instances(file, source):
     '''
-    Saving time needed to solve the instances into 'timing.csv' file
+    Yielding the instances of an open file one at a time. A bundle file holds several instances separated by blank lines.
     '''
-    # Path to the existing CSV file
-    timings_csv = './timing.csv'
+    lines = []
+    for number, line in enumerate(file, 1):
+        if line.strip():
+            lines.append(line)
+        elif lines:
+            yield parse_instance(lines, f'{source}:{number - len(lines)}')
+            lines = []
+    if lines:
+        yield parse_instance(lines, f'{source}:{number - len(lines) + 1}')
+
+
+def get_instance_files(source):
+    '''
+    Listing the files of a source: the files of a folder or the matches of a glob pattern, in alphanumeric order,
+    or a single (possibly bundle) file
+    '''
+    if os.path.isdir(source):
+        return [os.path.join(source, file) for file in sorted_alphanumeric(os.listdir(source)) if os.path.isfile(os.path.join(source, file))]
+    if any(character in source for character in '*?['):
+        return sorted_alphanumeric(glob.glob(source))
+    return [source]
 
-    try:
-        # Read the CSV file into a DataFrame
-        df = pd.read_csv(timings_csv)
-    
-        # If the csv file is empty, add all the instances as the first column
-        if df.empty:
-            first_column = [f'Instance {i+1}' for i in range(40)]
-            # Add the new column to the DataFrame
-            df['Instances'] = first_column
-            df.to_csv(timings_csv, index=False)  # Write the updated DataFrame back to the CSV file
-
-    except:
-        
-        # If here, the dataframe is empty and causes some problems to be imported into pandas
-        df = pd.DataFrame()
-        first_column = [f'Instance {i+1}' for i in range(40)]
-        # Add the new column to the DataFrame
-        df['Instances'] = first_column
-        df.to_csv(timings_csv, index=False)  # Write the updated DataFrame back to the CSV file
-    
 
-    # Setting new column name
-    if rotation:
+def iter_instances(source):
+    '''
+    import instances lazily, one at a time, from a folder, a glob pattern (e.g. "input/ins-1*.txt"), a bundle file
+    or the standard input ("-"). Every file is closed before the next one is opened.
+    '''
+    if source == '-':
+        yield from read_instances(sys.stdin, '<stdin>')
+        return
 
-        column_name = 'Rotation '
-        if simmetry_breaking:
-            column_name += 'SB'
-        else:
-            column_name += 'No SB'
-    else:
-        column_name = 'No Rotation '
-        if simmetry_breaking:
-            column_name += 'SB'
-        else:
-            column_name += 'No SB'
+    for path in get_instance_files(source):
+        with open(path) as file:
+            yield from read_instances(file, path)
+
+
+def run_instances(solve, instances, jobs=1, threads=False):
+    '''
+    Calling solve(index, record) on every instance and returning the results in instance order.
+    instances can be any iterable of InstanceRecord, e.g. the iter_instances generator, read while solving.
+    If jobs > 1, the instances are spread over a pool of processes, each one with its own solver state;
+    at most 2 * jobs instances are waiting in the pool at any time.
+    If threads is True, the pool is made of threads of this process instead, with no process start and no import
+    of the modules per worker: solve must keep the state of every instance apart (e.g. its own z3 context).
+    '''
+    if jobs <= 1:
+        return [solve(i, record) for i, record in enumerate(tqdm(instances))]
 
-    # Add the new column to the DataFrame
-    df.at[ind, column_name] = timing
+    results = []
+    with (ThreadPoolExecutor if threads else ProcessPoolExecutor)(max_workers=jobs) as executor:
+        pending = deque()
+        for i, record in enumerate(tqdm(instances)):
+            pending.append(executor.submit(solve, i, record))
+            if len(pending) >= 2 * jobs:
+                results.append(pending.popleft().result())
+        results.extend(future.result() for future in pending)
+    return results
 
-    # Write the updated DataFrame back to the CSV file
-    df.to_csv(timings_csv, index=False)
 
-    print("CSV file up-to-date")
\ No newline at end of file
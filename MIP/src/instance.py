@@ -1,5 +1,7 @@
 import math
 from typing import List, Tuple
+from heuristic import skyline_heuristic
+from bounds import lower_bound
 
 # Custom sorting function based on the product of each pair
 def sorting_key(pair):
@@ -17,16 +19,15 @@ class Instance():
 
     def __init__(self, raw_instance, name_instance, rotation=False, simmetry_breaking=True):
         
-        # getting the width of the silicon plate
-        self._plate_width = int(raw_instance[0])
+        # getting the width of the silicon plate and the circuits from the instance record (see utils.iter_instances)
+        plate_width, circuits = raw_instance
+        self._plate_width = int(plate_width)
 
         # getting the number of circuits to place inside the plate
-        self._n_circuits = int(raw_instance[1])
+        self._n_circuits = len(circuits)
 
         # Getting circuits width and height
-        values = raw_instance[2:]
-
-        circuits = [(int(width), int(height)) for value in values for width, height in [value.rstrip().split(' ')]]
+        circuits = [(int(width), int(height)) for width, height in circuits]
         self._circuits = sorted(circuits, key=sorting_key, reverse=True)
 
         # Getting instance name
@@ -43,6 +44,13 @@ class Instance():
             self._max_height += circuit[1]
         self._min_height = int(math.ceil(self._min_height / self._plate_width))
 
+        # Best lower bound of the plate height (area, tallest circuit, wide circuits, dual feasible functions, bar relaxation)
+        self._min_height, self._lower_bound_name = lower_bound(self)
+
+        # Upper bound of the plate height given by the skyline heuristic. Its placement is used as a solution hint
+        self._hint_circuits, hint_height = skyline_heuristic(self)
+        self._max_height = min(self._max_height, hint_height)
+
         # Circuit width and height
         if rotation:
             self._widths = [self._circuits[index][0] for index in range(len(self._circuits))]
@@ -90,11 +98,23 @@ class Instance():
         '''
         return self._min_height
     
+    def get_lower_bound_name(self):
+        '''
+        Returning the name of the bound giving the minimum height (see bounds.LOWER_BOUNDS)
+        '''
+        return self._lower_bound_name
+    
     def get_max_height(self):
         '''
         Returning the maximum height
         '''
         return self._max_height
+
+    def get_hint(self):
+        '''
+        Returning the circuits placed by the skyline heuristic, as [width, height, x, y]
+        '''
+        return self._hint_circuits
     
     ####################################
     # Get Rotation / Simmetry_Breaking #
@@ -1,52 +1,50 @@
 import gurobipy as gp
 from gurobipy import GRB, quicksum
-import time
+from functools import partial
+from renderer import RENDERERS
+from results import ResultsStore
+from phases import PhaseTimer
 from utils import *
-from tqdm import tqdm
 import argparse
 from instance import Instance as ins
-        
-if __name__ == '__main__':
-    # Create an argument parser
-    parser = argparse.ArgumentParser(description='MIP argument parsing')
+from verifier import check_placement
 
-    # Add arguments
-    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instance folder name')
-    parser.add_argument('--rotation', action='store_true', help='Set circuit rotation to True')
-    parser.add_argument('--simmetry_breaking', action='store_true', help='Set solving simmetry breaking to True')
-    args = parser.parse_args()
-    
-    folder_name = args.folder_name
-    rotation = args.rotation
-    simmetry_breaking = args.simmetry_breaking
-    output_txt_path, output_img_path, output_failure_path = set_environment(rotation, simmetry_breaking)
-    
-    instances = import_instances(folder_name)
 
-    for i in tqdm(range(len(instances))):
-        name_instance = f'{i}_instance'
-        instance = ins(instances[i], name_instance, rotation, simmetry_breaking)
+# results store and timing.csv exported from it
+RESULTS_PATH = './results.db'
+TIMING_PATH = './timing.csv'
+
+
+def solve_instance(instance, time_limit=300, timer=None):
+    '''
+    Building the MIP model of an instance and optimizing it, returning the gurobi model.
+    If a PhaseTimer is given, the model building is timed as its 'encode' phase and the optimization as its 'solve' phase.
+    '''
+    if timer is None:
+        timer = PhaseTimer()
+
+    with timer.phase('encode'):
         n = instance.get_n_circuits()
         w = instance.get_plate_width()
         x = instance.get_circuit_widths()
         y = instance.get_circuit_heights()
-        
-        m = gp.Model()
-        m.Params.TimeLimit = 5*60
+
+        m = gp.Model(env=get_gurobi_env())
+        m.Params.TimeLimit = time_limit
         m.Params.LogToConsole = 0
         h = m.addVar(lb=instance.get_min_height(),ub=instance.get_max_height(),vtype=GRB.INTEGER, name='h')
         X = m.addVars(n, lb=0,ub=w-min(x),vtype=GRB.INTEGER ,name='X')
         Y = m.addVars(n, lb=0,ub=instance.get_max_height()-min(y),vtype=GRB.INTEGER, name='Y')
         b = m.addVars(n, n, 4, vtype = GRB.BINARY, name = 'b')
         m.setObjective(h, GRB.MINIMIZE)
-        
-        if simmetry_breaking:
+
+        if instance.get_simmetry_breaking():
             m.addConstr(X[0] == 0, 'biggest_circuit_0_width_constr')
             m.addConstr(Y[0] == 0, 'biggest_circuit_0_height_constr')
-        
+
         m.addConstrs(((X[i] + x[i] <= w) for i in range(n)), "max_width_constr")
         m.addConstrs(((Y[i] + y[i] <= h) for i in range(n)), "max_height_constr")
-        
+
         M1=w
         M2=instance.get_max_height()
         m.addConstrs(((X[i] + x[i] <= X[j]+M1*b[i,j,0]) for i in range(n) for j in range(i+1, n)), "hor1_constr")
@@ -54,33 +52,131 @@ if __name__ == '__main__':
         m.addConstrs(((Y[i] + y[i] <= Y[j]+M2*b[i,j,2]) for i in range(n) for j in range(i+1, n)), "ver1_constr")  
         m.addConstrs(((Y[j] + y[j] <= Y[i]+M2*b[i,j,3]) for i in range(n) for j in range(i+1, n)), "ver2_constr")
         m.addConstrs((quicksum(b[i,j,k] for k in range(4)) <= 3 for i in range(n) for j in range(i+1,n)),"b_constr")
-                
-        start_time = time.time()
+
+
+        # MIP start from the placement of the skyline heuristic, which also gives the upper bound of h
+        m.update()
+        m.getVarByName('h').Start = instance.get_max_height()
+        for j, circuit in enumerate(instance.get_hint()):
+            X[j].Start = circuit[2]
+            Y[j].Start = circuit[3]
+
+    with timer.phase('solve'):
         m.optimize()
-        run_time = time.time() - start_time
-            
-        try:
-            height = int(m.ObjVal)
-        except:
-            with open(output_failure_path, 'a') as output:
-                output.write(f'Instance {i + 1} failed')
-                output.write('\n')
-            print("\nFailed to solve instance %i" % (i + 1))
-            save_times_to_csv(rotation, simmetry_breaking, '-', i)
-            continue
+    return m
+
+
+def get_placement(instance, time_limit=300):
+    '''
+    Solving an instance and returning (circuits, height, optimal), with the circuits placed as [width, height, x, y].
+    optimal is True when gurobi proved the height minimal. It returns None if no solution is found.
+    '''
+    m = solve_instance(instance, time_limit)
+    if m.SolCount == 0:
+        return None
 
+    circuits = []
+    for j in range(instance.get_n_circuits()):
+        width, height = instance.get_circuit_widths()[j], instance.get_circuit_heights()[j]
+        circuits.append([width, height, round(m.getVarByName(f'X[{j}]').X), round(m.getVarByName(f'Y[{j}]').X)])
+    return circuits, round(m.ObjVal), m.Status == GRB.OPTIMAL
+
+
+def run_instance(i, raw_instance, rotation, simmetry_breaking, output_paths, renderer='matplotlib', results=None):
+    '''
+    Solving the i-th instance and writing its solution, returning the time needed to solve it ('-' if it failed).
+    output_paths is the tuple (output_txt_path, output_img_path, output_failure_path).
+    renderer is the renderer of the solution image (see renderer.RENDERERS), None to write only the textual solution.
+    If a results store is given, the run is appended to it, with the times of its phases (see phases.PhaseTimer).
+    The time needed to solve the instance is the time of the encode, solve and decode phases.
+    '''
+    output_txt_path, output_img_path, output_failure_path = output_paths
+    timer = PhaseTimer()
+
+    name_instance = f'{i}_instance'
+    with timer.phase('parse'):
+        instance = ins(raw_instance, name_instance, rotation, simmetry_breaking)
+    n = instance.get_n_circuits()
+
+    m = solve_instance(instance, time_limit=5*60, timer=timer)
+    statistics = get_statistics(m)
+        
+    try:
+        height = int(m.ObjVal)
+    except:
+        with open(output_failure_path, 'a') as output:
+            output.write(f'Instance {i + 1} failed')
+            output.write('\n')
+        print("\nFailed to solve instance %i" % (i + 1))
+        if results is not None:
+            results.append('MIP', i, instance, times=timer.get_times(), statistics=statistics)
+        return '-'
+
+    with timer.phase('decode'):
         X = []
         Y = []
         for j in range(n):
             X.append(int(m.getVarByName(f'X[{j}]').X))
             Y.append(int(m.getVarByName(f'Y[{j}]').X))
-        
+
         circuits = [[instance.get_circuit_widths()[h],instance.get_circuit_heights()[h],X[h],Y[h]] for h in range(instance.get_n_circuits())]
-        decode_circuits(instance, height, output_txt_path, output_img_path, circuits)
-        print(f"\nSolution found for instance {i + 1}")
-        print(f"optimum height is: {instance.get_min_height()}")
-        print(f"minimum height found is: {height}")
-        print(f"The time requested for this instance was: {run_time}")
-        save_times_to_csv(rotation, simmetry_breaking, run_time, i)
-        
 
+    # the solution is timed without checking, writing it and drawing its image
+    run_time = timer.get_solve_time()
+
+    # the placement is checked before it is written
+    with timer.phase('verify'):
+        problems = check_placement(instance, circuits, height)
+    if problems:
+        with open(output_failure_path, 'a') as output:
+            output.write(f'Instance {i + 1} failed verification: {"; ".join(problems)}')
+            output.write('\n')
+        print(f"\nWrong solution for instance {i + 1}: {'; '.join(problems)}")
+        if results is not None:
+            results.append('MIP', i, instance, times=timer.get_times(), statistics=dict(statistics, problems=problems))
+        return '-'
+
+    decode_circuits(instance, height, output_txt_path, output_img_path, circuits, renderer, timer)
+    print(f"\nSolution found for instance {i + 1}")
+    print(f"lower bound of the height is: {instance.get_min_height()} ({instance.get_lower_bound_name()} bound{', tight' if height == instance.get_min_height() else ''})")
+    print(f"minimum height found is: {height}")
+    print(f"The time requested for this instance was: {run_time}")
+    print(f"phases: {timer.summary()}")
+
+    if results is not None:
+        results.append('MIP', i, instance, height, m.Status == GRB.OPTIMAL, run_time, timer.get_times(), statistics)
+    return run_time
+
+
+if __name__ == '__main__':
+    # Create an argument parser
+    parser = argparse.ArgumentParser(description='MIP argument parsing')
+
+    # Add arguments
+    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instances: a folder, a glob pattern, a bundle file or - for the standard input')
+    parser.add_argument('--rotation', action='store_true', help='Set circuit rotation to True')
+    parser.add_argument('--simmetry_breaking', action='store_true', help='Set solving simmetry breaking to True')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes solving the instances in parallel')
+    parser.add_argument('--renderer', type=str, default='matplotlib', choices=RENDERERS, help='Renderer of the solution images: matplotlib, fast (numpy PNG) or svg')
+    parser.add_argument('--no_render', '--no-render', action='store_true', help='Do not draw the solution images, they can be drawn later by render.py')
+    parser.add_argument('--results', type=str, default=RESULTS_PATH, help='SQLite database where every run is appended')
+    parser.add_argument('--export_timing', '--export-timing', action='store_true', help='Export timing.csv from the results store after the run')
+    args = parser.parse_args()
+    
+    folder_name = args.folder_name
+    rotation = args.rotation
+    simmetry_breaking = args.simmetry_breaking
+    results = ResultsStore(args.results)
+    output_txt_path, output_img_path, output_failure_path = set_environment(rotation, simmetry_breaking)
+    
+    instances = iter_instances(folder_name)
+
+    # the instances are solved in parallel by "jobs" processes, the timings are saved in instance order
+    solve = partial(run_instance, rotation=rotation, simmetry_breaking=simmetry_breaking,
+                    output_paths=(output_txt_path, output_img_path, output_failure_path), renderer=None if args.no_render else args.renderer,
+                    results=results)
+    timings = run_instances(solve, instances, args.jobs)
+
+    # Exporting the latest time of every instance and configuration into 'timing.csv' file
+    if args.export_timing:
+        results.export_timing_csv(TIMING_PATH, 'MIP', len(timings))
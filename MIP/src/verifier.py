@@ -0,0 +1,137 @@
+import argparse
+import os
+import re
+import time
+import numpy as np
+
+
+def read_instance(path):
+    '''
+    Reading an ins-N.txt file, returning (plate_width, sizes) with the sizes of the circuits as a (n, 2) array
+    '''
+    with open(path) as file:
+        values = np.array(file.read().split(), dtype=np.int64)
+    plate_width, n = int(values[0]), int(values[1])
+    sizes = values[2:].reshape(-1, 2)
+    if len(sizes) != n:
+        raise ValueError(f"{path}: {n} circuits declared, {len(sizes)} found")
+    return plate_width, sizes
+
+
+def read_solution(path):
+    '''
+    Reading an out-N.txt file, returning (plate_width, height, circuits) with the circuits as a (n, 4) array
+    of [width, height, x, y]
+    '''
+    with open(path) as file:
+        values = np.array(file.read().split(), dtype=np.int64)
+    plate_width, height, n = int(values[0]), int(values[1]), int(values[2])
+    circuits = values[3:].reshape(-1, 4)
+    if len(circuits) != n:
+        raise ValueError(f"{path}: {n} circuits declared, {len(circuits)} found")
+    return plate_width, height, circuits
+
+
+def check_solution(plate_width, height, circuits, sizes, rotation=False):
+    '''
+    Checking a placement of circuits ([width, height, x, y]) on a plate of the given width and height.
+    sizes are the [width, height] of the circuits of the instance, whose multiset must match the placed circuits
+    (up to the rotation of every circuit, if rotation is True). It returns the list of the problems found, empty if
+    the placement is a solution. The overlaps are found on an occupancy raster of the plate, built in one pass
+    from the corners of the circuits (2D difference array).
+    '''
+    circuits = np.asarray(circuits, dtype=np.int64).reshape(-1, 4)
+    sizes = np.asarray(sizes, dtype=np.int64).reshape(-1, 2)
+    widths, heights, x, y = circuits.T
+
+    problems = []
+
+    placed = circuits[:, :2]
+    expected = sizes
+    if rotation:
+        placed, expected = np.sort(placed, axis=1), np.sort(expected, axis=1)
+    if len(placed) != len(expected) or not np.array_equal(placed[np.lexsort(placed.T)], expected[np.lexsort(expected.T)]):
+        problems.append(f"the placed circuits {placed.tolist()} are not the ones of the instance")
+
+    outside = np.flatnonzero((widths <= 0) | (heights <= 0) | (x < 0) | (y < 0) | (x + widths > plate_width) | (y + heights > height))
+    if len(outside) > 0:
+        problems.append(f"circuits {outside.tolist()} are not inside the {plate_width}x{height} plate")
+        return problems
+
+    # +1 on the bottom-left and top-right corners, -1 on the other two: the prefix sums give the occupancy of every cell
+    occupancy = np.zeros((height + 1, plate_width + 1), dtype=np.int32)
+    np.add.at(occupancy, (y, x), 1)
+    np.add.at(occupancy, (y, x + widths), -1)
+    np.add.at(occupancy, (y + heights, x), -1)
+    np.add.at(occupancy, (y + heights, x + widths), 1)
+    occupancy = occupancy.cumsum(axis=0).cumsum(axis=1)
+
+    overlapping = np.count_nonzero(occupancy > 1)
+    if overlapping > 0:
+        problems.append(f"circuits overlap on {overlapping} cells")
+    return problems
+
+
+def get_sizes(instance):
+    return [instance.get_circuit(c) for c in range(instance.get_n_circuits())]
+
+
+def check_placement(instance, circuits, height):
+    '''
+    Checking the circuits ([width, height, x, y]) placed by an approach on an instance, see check_solution
+    '''
+    return check_solution(instance.get_plate_width(), height, circuits, get_sizes(instance), instance.get_rotation())
+
+
+def verify_placement(instance, circuits, height):
+    '''
+    Returning True if the circuits ([width, height, x, y]) placed on a plate of the given height are a solution of the instance
+    '''
+    return not check_placement(instance, circuits, height)
+
+
+def verify_folder(input_folder, output_folder, rotation=False):
+    '''
+    Checking every out-N.txt file of an output folder against the ins-N.txt file of the input folder.
+    It returns a dictionary from the output file names to their problems, empty lists for the valid solutions.
+    '''
+    results = {}
+    for name in sorted(os.listdir(output_folder)):
+        match = re.fullmatch(r'out-(\d+)\.txt', name)
+        if match is None:
+            continue
+        try:
+            plate_width, sizes = read_instance(os.path.join(input_folder, f'ins-{match.group(1)}.txt'))
+            solution_width, height, circuits = read_solution(os.path.join(output_folder, name))
+            problems = check_solution(plate_width, height, circuits, sizes, rotation)
+            if solution_width != plate_width:
+                problems.insert(0, f"the plate width is {solution_width} instead of {plate_width}")
+        except (OSError, ValueError) as error:
+            problems = [str(error)]
+        results[name] = problems
+    return results
+
+
+if __name__ == '__main__':
+
+    # Create an argument parser
+    parser = argparse.ArgumentParser(description='Solution verifier argument parsing')
+
+    # Add arguments
+    parser.add_argument('output_folder', type=str, help='Folder of the out-N.txt solutions')
+    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instance folder name')
+    parser.add_argument('--rotation', action='store_true', help='Allow rotated circuits')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    results = verify_folder(args.folder_name, args.output_folder, args.rotation)
+    end_time = time.time()
+
+    for name, problems in results.items():
+        for problem in problems:
+            print(f"{name}: {problem}")
+
+    n_invalid = sum(1 for problems in results.values() if problems)
+    print(f"{len(results) - n_invalid}/{len(results)} valid solutions, checked in {end_time - start_time:.3f} s")
+    if n_invalid > 0:
+        raise SystemExit(1)
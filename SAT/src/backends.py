@@ -0,0 +1,290 @@
+from abc import ABC, abstractmethod
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+import numpy as np
+from z3 import SimpleSolver, BoolVal, sat, unsat, unknown, is_true
+
+# Available SAT backends. z3 is the default one
+BACKENDS = ['z3', 'pysat', 'external']
+
+
+def clauses_to_dimacs(clauses):
+    '''
+    Translating a matrix of clauses (padded with 0) into DIMACS clause lines
+    '''
+    lines = [' '.join(str(literal) for literal in row if literal != 0) + ' 0\n' for row in clauses.tolist()]
+    return ''.join(lines).encode()
+
+
+def clauses_to_smt2(variables, clauses, declared=()):
+    '''
+    Translating a matrix of clauses into an SMT-LIB2 script. Every row is a clause and every value is
+    the number of a variable (negative if the literal is negated). 0 is used as padding.
+    The variables whose number is in "declared" are not declared again.
+    '''
+    n_variables = len(variables)
+    names = [f'|{v}|' for v in variables]
+
+    # literal strings, indexed by literal + n_variables
+    literals = np.array([f'(not {name})' for name in reversed(names)] + [''] + names, dtype=object)
+
+    used = np.unique(np.abs(clauses))
+    script = [f'(declare-const {names[v - 1]} Bool)' for v in used.tolist() if v != 0 and v not in declared]
+    for row in literals[clauses + n_variables].tolist():
+        script.append('(assert (or ' + ' '.join(row) + '))')
+    return '\n'.join(script)
+
+
+class DimacsStream():
+    '''
+    Clauses written in DIMACS format to a temporary file as soon as they are added,
+    so that the whole formula can be replayed without encoding it again
+    '''
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self.n_clauses = 0
+
+    def write(self, clauses):
+        self._file.write(clauses_to_dimacs(clauses))
+        self.n_clauses += len(clauses)
+
+    def copy_to(self, output, n_variables, units=(), comments=()):
+        '''
+        Writing the complete DIMACS formula (header, clauses and the additional unit clauses) to a binary file object
+        '''
+        for comment in comments:
+            output.write(f'c {comment}\n'.encode())
+        output.write(f'p cnf {n_variables} {self.n_clauses + len(units)}\n'.encode())
+        self._file.flush()
+        self._file.seek(0)
+        shutil.copyfileobj(self._file, output)
+        self._file.seek(0, os.SEEK_END)
+        for unit in units:
+            output.write(f'{unit} 0\n'.encode())
+
+
+class ClauseList():
+    '''
+    Collecting the clauses produced by the constraint builders, without solving them
+    '''
+
+    def __init__(self):
+        self._clauses = []
+
+    def add_clauses(self, clauses):
+        if len(clauses) > 0:
+            self._clauses.append(clauses)
+
+    def get_clauses(self):
+        '''
+        Returning all the collected clauses as a single matrix
+        '''
+        width = max((clauses.shape[1] for clauses in self._clauses), default=1)
+        return np.concatenate([np.zeros((0, width), dtype=np.int32)] +
+                              [np.pad(clauses, ((0, 0), (0, width - clauses.shape[1]))) for clauses in self._clauses])
+
+
+class Backend(ABC):
+    '''
+    Common interface of the SAT backends. The formula is given as matrices of literal numbers,
+    the numbering is the one of Instance.get_literal_table. A backend implements solve and _add_clauses.
+    '''
+
+    def __init__(self, variables, keep_dimacs=False):
+        self._variables = variables
+        self._stream = DimacsStream() if keep_dimacs else None
+
+    def add_clauses(self, clauses):
+        '''
+        Adding a matrix of clauses to the formula
+        '''
+        if len(clauses) == 0:
+            return
+        if self._stream is not None:
+            self._stream.write(clauses)
+        self._add_clauses(clauses)
+
+    @abstractmethod
+    def solve(self, assumptions, timeout):
+        '''
+        Solving the formula under the given assumption literals, within timeout seconds.
+        It returns (result, assignment): result is sat, unsat or unknown, assignment is a numpy
+        boolean array indexed by variable number (None if the result is not sat).
+        '''
+
+    def set_phases(self, literals):
+        '''
+        Suggesting to the solver the polarity of some variables (e.g. a known placement), as signed literal numbers.
+        It is only a hint for the branching, backends not supporting it ignore it
+        '''
+        pass
+
+    def write_dimacs(self, output, comments=()):
+        '''
+        Writing the clauses added so far in DIMACS format to a binary file object
+        '''
+        if self._stream is None:
+            raise ValueError('The backend was created without keeping the DIMACS formula')
+        self._stream.copy_to(output, len(self._variables), comments=comments)
+
+    @abstractmethod
+    def _add_clauses(self, clauses):
+        '''
+        Adding a matrix of clauses to the solver
+        '''
+
+
+class Z3Backend(Backend):
+    '''
+    z3 solver. Clauses are parsed in bulk from SMT-LIB2 scripts and assumptions are passed to check.
+    The solver lives in the z3 context of the variables (ctx, None for the global one). It is the SMT core of z3
+    (SimpleSolver), the one accepting initial values, which the default combined solver rejects.
+    '''
+
+    def __init__(self, variables, keep_dimacs=False, ctx=None):
+        super().__init__(variables, keep_dimacs)
+        self._solver = SimpleSolver(ctx=ctx)
+        self._numbers = {}
+        # variables already declared to the SMT-LIB2 parser of the solver
+        self._declared = set()
+
+    def _add_clauses(self, clauses):
+        self._solver.from_string(clauses_to_smt2(self._variables, clauses, self._declared))
+        self._declared.update(np.abs(clauses).ravel().tolist())
+
+    def set_phases(self, literals):
+        for literal in literals:
+            self._solver.set_initial_value(self._variables[abs(literal) - 1], BoolVal(literal > 0, self._solver.ctx))
+
+    def solve(self, assumptions, timeout):
+        self._solver.set(timeout = int(timeout * 1000))
+        result = self._solver.check([self._variables[a - 1] for a in assumptions])
+        if result != sat:
+            return result, None
+
+        # the variables created after the last solve (activation literals) are numbered here
+        for v in range(len(self._numbers), len(self._variables)):
+            self._numbers[str(self._variables[v])] = v + 1
+
+        # reading the assignment in one pass over the model. Variables missing from the model are False
+        model = self._solver.model()
+        assignment = np.zeros(len(self._variables) + 1, dtype=bool)
+        for declaration in model.decls():
+            number = self._numbers.get(declaration.name())
+            if number is not None:
+                assignment[number] = is_true(model[declaration])
+        return result, assignment
+
+
+class PySATBackend(Backend):
+    '''
+    Incremental CDCL solver of the python-sat library (e.g. glucose4, minisat22, cadical153).
+    The timeout relies on interrupting the solver, solvers not supporting it (cadical) run without time limit
+    '''
+
+    def __init__(self, variables, solver_name='glucose4', keep_dimacs=False):
+        super().__init__(variables, keep_dimacs)
+        try:
+            from pysat.solvers import Solver as PySATSolver
+        except ImportError:
+            raise ImportError("The pysat backend requires the python-sat package: pip install python-sat")
+        self._solver = PySATSolver(name=solver_name)
+        self._interruptible = not solver_name.startswith('cadical')
+
+    def _add_clauses(self, clauses):
+        self._solver.append_formula([[literal for literal in row if literal != 0] for row in clauses.tolist()])
+
+    def set_phases(self, literals):
+        self._solver.set_phases([int(literal) for literal in literals])
+
+    def solve(self, assumptions, timeout):
+        assumptions = [int(a) for a in assumptions]
+        if self._interruptible:
+            timer = threading.Timer(timeout, self._solver.interrupt)
+            timer.start()
+            try:
+                outcome = self._solver.solve_limited(assumptions=assumptions, expect_interrupt=True)
+            finally:
+                timer.cancel()
+                self._solver.clear_interrupt()
+        else:
+            outcome = self._solver.solve(assumptions=assumptions)
+
+        if outcome is None:
+            return unknown, None
+        if not outcome:
+            return unsat, None
+
+        assignment = np.zeros(len(self._variables) + 1, dtype=bool)
+        model = np.array(self._solver.get_model(), dtype=np.int64)
+        model = model[(model > 0) & (model <= len(self._variables))]
+        assignment[model] = True
+        return sat, assignment
+
+
+class ExternalBackend(Backend):
+    '''
+    Any CDCL binary reading a DIMACS file and printing the result in the SAT competition format
+    ("s SATISFIABLE", "v ..." lines), e.g. kissat, cadical or glucose -model.
+    The formula is streamed to a temporary file, and the assumptions are appended as unit clauses
+    '''
+
+    def __init__(self, variables, command='kissat'):
+        super().__init__(variables, keep_dimacs=True)
+        self._command = shlex.split(command)
+        if shutil.which(self._command[0]) is None:
+            raise FileNotFoundError(f"SAT solver '{self._command[0]}' not found")
+
+    def _add_clauses(self, clauses):
+        # the clauses are already streamed to the DIMACS file
+        pass
+
+    def solve(self, assumptions, timeout):
+        with tempfile.NamedTemporaryFile(suffix='.cnf') as cnf:
+            self._stream.copy_to(cnf, len(self._variables), units=[int(a) for a in assumptions])
+            cnf.flush()
+            try:
+                process = subprocess.run(self._command + [cnf.name], capture_output=True, text=True, timeout=max(timeout, 0))
+            except subprocess.TimeoutExpired:
+                return unknown, None
+
+        result = unknown
+        literals = []
+        for line in process.stdout.splitlines():
+            if line.startswith('s '):
+                status = line[2:].strip()
+                result = sat if status == 'SATISFIABLE' else unsat if status == 'UNSATISFIABLE' else unknown
+            elif line.startswith('v '):
+                literals.extend(int(literal) for literal in line[2:].split())
+
+        # fallback on the standard exit codes
+        if result == unknown and process.returncode in (10, 20):
+            result = sat if process.returncode == 10 else unsat
+
+        if result != sat:
+            return result, None
+
+        assignment = np.zeros(len(self._variables) + 1, dtype=bool)
+        literals = np.array(literals, dtype=np.int64)
+        literals = literals[(literals > 0) & (literals <= len(self._variables))]
+        assignment[literals] = True
+        return result, assignment
+
+
+def make_backend(name, variables, sat_solver=None, keep_dimacs=False, ctx=None):
+    '''
+    Creating the SAT backend "name". sat_solver is the python-sat solver name for the pysat backend,
+    or the command line of the binary for the external backend. ctx is the z3 context of the variables.
+    '''
+    if name == 'z3':
+        return Z3Backend(variables, keep_dimacs, ctx)
+    if name == 'pysat':
+        return PySATBackend(variables, sat_solver or 'glucose4', keep_dimacs)
+    if name == 'external':
+        return ExternalBackend(variables, sat_solver or 'kissat')
+    raise ValueError(f"Unknown backend '{name}', choose one of {BACKENDS}")
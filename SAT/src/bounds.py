@@ -0,0 +1,133 @@
+import numpy as np
+
+# a contribution larger than any bound, given to the orientations that do not fit the plate
+_EXCLUDED = np.iinfo(np.int64).max // 4
+
+# maximum parameter k of the u^(k) dual feasible functions
+DFF_MAX_K = 10
+
+
+def ceil_div(a, b):
+    return -(-a // b)
+
+
+def get_orientations(instance):
+    '''
+    Returning the widths and heights of the circuits in every orientation they can take, as arrays of shape
+    (orientations, n_circuits), and the mask of the orientations fitting the plate width.
+    Without rotation there is only one orientation, with rotation the second one has width and height swapped.
+    '''
+    sizes = np.array([instance.get_circuit(c) for c in range(instance.get_n_circuits())], dtype=np.int64).reshape(-1, 2)
+    widths, heights = sizes[:, 0], sizes[:, 1]
+    if instance.get_rotation():
+        widths, heights = np.stack([widths, heights]), np.stack([heights, widths])
+    else:
+        widths, heights = widths[None, :], heights[None, :]
+    return widths, heights, widths <= instance.get_plate_width()
+
+
+def cheapest(contributions, valid):
+    '''
+    Returning the contribution of every circuit to a bound in its cheapest orientation.
+    Since a placement fixes one orientation per circuit, the bound still holds with rotation.
+    '''
+    return np.where(valid, contributions, _EXCLUDED).min(axis=0)
+
+
+def area_bound(plate_width, widths, heights, valid):
+    '''
+    The area of the circuits divided by the plate width
+    '''
+    return int(ceil_div(int((widths[0] * heights[0]).sum()), plate_width))
+
+
+def tallest_bound(plate_width, widths, heights, valid):
+    '''
+    The height of the tallest circuit, in the lowest orientation fitting the plate
+    '''
+    return int(cheapest(heights, valid).max(initial=0))
+
+
+def wide_bound(plate_width, widths, heights, valid):
+    '''
+    The circuits wider than half of the plate can not be placed side by side, so they are stacked
+    '''
+    return int(cheapest(np.where(2 * widths > plate_width, heights, 0), valid).sum())
+
+
+def dff_bound(plate_width, widths, heights, valid):
+    '''
+    Bounds given by the dual feasible functions of Fekete and Schepers: if f maps the widths to widths so that
+    the circuits fitting side by side still do, the area of the mapped circuits divided by the plate width
+    is a lower bound. Two families are used, the best bound over their parameters is returned:
+        -) f0 with k <= W/2: widths larger than W - k become W, widths smaller than k become 0;
+        -) u^(k) with k <= DFF_MAX_K: w becomes w if (k + 1) w / W is integer, floor((k + 1) w / W) W / k otherwise.
+    '''
+    best = 0
+
+    # f0, one row per parameter k
+    k = np.arange(1, plate_width // 2 + 1, dtype=np.int64)[:, None, None]
+    mapped = np.where(widths > plate_width - k, plate_width, np.where(widths < k, 0, widths))
+    if len(k) > 0:
+        areas = cheapest(np.moveaxis(mapped * heights, 0, 1), valid[:, None]).sum(axis=-1)
+        best = max(best, int(ceil_div(areas, plate_width).max()))
+
+    # u^(k), the mapped widths are multiplied by k to keep integer values
+    k = np.arange(1, DFF_MAX_K + 1, dtype=np.int64)[:, None, None]
+    mapped = np.where((k + 1) * widths % plate_width == 0, widths * k, (k + 1) * widths // plate_width * plate_width)
+    areas = cheapest(np.moveaxis(mapped * heights, 0, 1), valid[:, None]).sum(axis=-1)
+    best = max(best, int(ceil_div(areas, k[:, 0, 0] * plate_width).max()))
+
+    return best
+
+
+def relaxation_bound(plate_width, widths, heights, valid):
+    '''
+    Bound of the continuous (bar) relaxation of Martello, Monaci and Vigo: every circuit is cut into slices of
+    height 1 that can be placed independently, so every row of the plate holds at most one circuit wider than W/2.
+    Given a parameter a <= W/2, the circuits wider than W - a fill their rows alone, the ones wider than W/2 leave
+    some room in their rows, and the circuits at least a wide fill that room or take new rows.
+    Without rotation only, since the circuit classes depend on the orientation.
+    '''
+    if widths.shape[0] > 1:
+        return 0
+
+    widths, heights = widths[0], heights[0]
+    a = np.arange(1, plate_width // 2 + 1, dtype=np.int64)[:, None]
+    if len(a) == 0:
+        return 0
+
+    large = widths > plate_width - a
+    medium = (2 * widths > plate_width) & ~large
+    small = (2 * widths <= plate_width) & (widths >= a)
+
+    areas = widths * heights
+    free_area = (np.where(medium, plate_width * heights - areas, 0)).sum(axis=1)
+    small_area = np.where(small, areas, 0).sum(axis=1)
+    bounds = np.where(large | medium, heights, 0).sum(axis=1) + ceil_div(np.maximum(small_area - free_area, 0), plate_width)
+    return int(bounds.max())
+
+
+# the bounds in order of complexity. In case of ties the simplest one is reported
+LOWER_BOUNDS = {
+    'area': area_bound,
+    'tallest': tallest_bound,
+    'wide': wide_bound,
+    'dff': dff_bound,
+    'relaxation': relaxation_bound,
+}
+
+
+def lower_bound(instance):
+    '''
+    Returning (height, name): the best lower bound of the plate height of the instance and the name of the bound giving it
+    '''
+    widths, heights, valid = get_orientations(instance)
+    plate_width = instance.get_plate_width()
+
+    best = None
+    for name, bound in LOWER_BOUNDS.items():
+        height = bound(plate_width, widths, heights, valid)
+        if best is None or height > best[0]:
+            best = (height, name)
+    return best
@@ -1,20 +1,54 @@
-from z3 import *
 import numpy as np
 
+# Every clause is a row of literal numbers (negative if the literal is negated), padded with 0
+CLAUSE_WIDTH = 4
 
 
-def set_domain_constraints(instance, s, plate_height):
+def clause_matrix(rows):
     '''
-    Set domain constraint. Because of these constraints, it is sure the circuits are going to suit the plate, by width and by height.
+    Building the clause matrix of a list of clauses, padding them with 0
+    '''
+    clauses = np.zeros((len(rows), CLAUSE_WIDTH), dtype=np.int32)
+    for r, row in enumerate(rows):
+        clauses[r, :len(row)] = row
+    return clauses
+
+
+def position_at_most(positions, value):
+    '''
+    Returning the order-encoded literal "position <= value". Values outside the encoded domain are folded into
+    constants: None if the literal is always True, 0 if it is always False.
+    '''
+    if value < 0:
+        return 0
+    if value >= len(positions):
+        return None
+    return int(positions[value])
+
+
+def guarded(guards, literal):
+    '''
+    Returning the clause "guards -> literal", where guards is a list of literals. None if the clause is always True.
+    '''
+    if literal is None:
+        return None
+    return [-g for g in guards] + ([literal] if literal != 0 else [])
+
+
+def set_domain_constraints(instance, s):
+    '''
+    Set domain constraint. Because of these constraints, it is sure the circuits are going to suit the plate by width.
+    The constraints that depend on the plate height are set by "set_height_constraints".
     '''
     plate_width = instance.get_plate_width()
     rotation = instance.get_rotation()
     simmetry_breaking = instance.get_simmetry_breaking()
 
-    x_positions = instance.get_x_positions()
-    y_positions = instance.get_y_positions()
+    _, indexes = instance.get_literal_table()
+    x_positions = indexes['px']
+    rot_flags = indexes['rot']
 
-    rot_flags = instance.get_rotation_flags()
+    rows = []
 
     # if rotation is enabled
     if rotation:
@@ -22,217 +56,250 @@ def set_domain_constraints(instance, s, plate_height):
         for cir in range(instance.get_n_circuits()):
 
             # the "cir" circuit has the flag "rotation" set to False
-            for e in range(plate_width - instance.get_circuit(cir)[0], plate_width):
-                s.add(Implies(Not(rot_flags[cir]), x_positions[cir][e]))
-            
-            for f in range(plate_height - instance.get_circuit(cir)[1], plate_height):
-                s.add(Implies(Not(rot_flags[cir]), y_positions[cir][f]))
+            for e in range(max(plate_width - instance.get_circuit(cir)[0], 0), plate_width):
+                rows.append([rot_flags[cir], x_positions[cir][e]])
 
             # the "cir" circuit has the flag "rotation" set to True
-            for e in range(plate_width - instance.get_circuit(cir)[1], plate_width):
-                s.add(Implies(rot_flags[cir], x_positions[cir][e]))
-            
-            for f in range(plate_height - instance.get_circuit(cir)[0], plate_height):
-                s.add(Implies(rot_flags[cir], y_positions[cir][f]))
-            
-            # If we are applying simmetry breaking
-            if simmetry_breaking:
-
-                # Biggest circuit by Area
-                widest_idx = np.argmax([instance.get_circuit(r)[0] * instance.get_circuit(r)[1] for r in range(instance.get_n_circuits())])
-
-                # ---> the widest circuit has the flag "rotation" set to False. <---
-
-                # We are setting to True the x-position of a circuit in order to allow it to "slide" horizontallly
-                for e in range((plate_width - instance.get_circuit(widest_idx)[0]) // 2, plate_width - instance.get_circuit(widest_idx)[0]):
-                    s.add(Implies(Not(rot_flags[widest_idx]), x_positions[widest_idx][e]))
-
-                # We are setting to True the y-position of a circuit in order to allow it to "slide" vertically
-                for f in range((plate_height - instance.get_circuit(widest_idx)[1]) // 2, plate_height - instance.get_circuit(widest_idx)[1]):
-                    s.add(Implies(Not(rot_flags[widest_idx]), y_positions[widest_idx][f]))
-                    
-                # ---> the widest circuit has the flag "rotation" set to True. <---
-
-                # We are setting to True the x-position of a circuit in order to allow it to "slide" horizontallly
-                for e in range((plate_width - instance.get_circuit(widest_idx)[1]) // 2, plate_width - instance.get_circuit(widest_idx)[1]):
-                    s.add(Implies(rot_flags[widest_idx], x_positions[widest_idx][e]))
-
-                # We are setting to True the y-position of a circuit in order to allow it to "slide" vertically
-                for f in range((plate_height - instance.get_circuit(widest_idx)[0]) // 2, plate_height - instance.get_circuit(widest_idx)[0]):
-                    s.add(Implies(rot_flags[widest_idx], y_positions[widest_idx][f]))
+            for e in range(max(plate_width - instance.get_circuit(cir)[1], 0), plate_width):
+                rows.append([-rot_flags[cir], x_positions[cir][e]])
+
+        # If we are applying simmetry breaking
+        if simmetry_breaking:
+
+            # Biggest circuit by Area
+            widest_idx = np.argmax([instance.get_circuit(r)[0] * instance.get_circuit(r)[1] for r in range(instance.get_n_circuits())])
+
+            # ---> the widest circuit has the flag "rotation" set to False. <---
+
+            # We are setting to True the x-position of a circuit in order to allow it to "slide" horizontallly
+            for e in range(max((plate_width - instance.get_circuit(widest_idx)[0]) // 2, 0), plate_width - instance.get_circuit(widest_idx)[0]):
+                rows.append([rot_flags[widest_idx], x_positions[widest_idx][e]])
+
+            # ---> the widest circuit has the flag "rotation" set to True. <---
+
+            # We are setting to True the x-position of a circuit in order to allow it to "slide" horizontallly
+            for e in range(max((plate_width - instance.get_circuit(widest_idx)[1]) // 2, 0), plate_width - instance.get_circuit(widest_idx)[1]):
+                rows.append([-rot_flags[widest_idx], x_positions[widest_idx][e]])
     else:
         # If rotation is not enabled
         for cir in range(instance.get_n_circuits()):
-            for e in range(plate_width - instance.get_circuit(cir)[0], plate_width):
-                s.add(x_positions[cir][e])
-            
-            for f in range(plate_height - instance.get_circuit(cir)[1], plate_height):
-                s.add(y_positions[cir][f])
-
-            # If we are applying simmetry breaking
-            if simmetry_breaking:
-                widest_idx = np.argmax([instance.get_circuit(r)[0] * instance.get_circuit(r)[1] for r in range(instance.get_n_circuits())])
-                for e in range((plate_width - instance.get_circuit(widest_idx)[0]) // 2, plate_width - instance.get_circuit(widest_idx)[0]):
-                    s.add(x_positions[widest_idx][e])
-                
-                for f in range((plate_height - instance.get_circuit(widest_idx)[1]) // 2, plate_height - instance.get_circuit(widest_idx)[1]):
-                    s.add(y_positions[widest_idx][f])
-
-def ordering_constraints(instance, s, plate_height):
+            for e in range(max(plate_width - instance.get_circuit(cir)[0], 0), plate_width):
+                rows.append([x_positions[cir][e]])
+
+        # If we are applying simmetry breaking
+        if simmetry_breaking:
+            widest_idx = np.argmax([instance.get_circuit(r)[0] * instance.get_circuit(r)[1] for r in range(instance.get_n_circuits())])
+            for e in range(max((plate_width - instance.get_circuit(widest_idx)[0]) // 2, 0), plate_width - instance.get_circuit(widest_idx)[0]):
+                rows.append([x_positions[widest_idx][e]])
+
+    s.add_clauses(clause_matrix(rows))
+
+
+def set_height_constraints(instance, s, plate_height):
+    '''
+    Set the constraints that depend on the plate height: the y-domain of every circuit and the height-related simmetry breaking.
+    Each of them is guarded by the activation literal of the height, which is returned and must be passed to the solver as an
+    assumption. The rest of the encoding (and the clauses learned on it) is shared by all the heights.
+    '''
+    if instance.has_height_flag(plate_height):
+        return instance.get_height_flag(plate_height)
+
+    height_flag = instance.get_height_flag(plate_height)
+
     plate_width = instance.get_plate_width()
+    rotation = instance.get_rotation()
+    simmetry_breaking = instance.get_simmetry_breaking()
+
+    _, indexes = instance.get_literal_table()
+    y_positions = indexes['py']
+    rot_flags = indexes['rot']
+    ud = indexes['ud']
 
-    x_positions = instance.get_x_positions()
-    y_positions = instance.get_y_positions()
+    rows = []
 
+    # y-domain: y + h <= plate_height. Thanks to the ordering constraints a single literal is enough
     for cir in range(instance.get_n_circuits()):
-        for e in range(plate_width - 1):
-            s.add(Implies(x_positions[cir][e], x_positions[cir][e + 1]))
-
-        for f in range(plate_height - 1):
-            s.add(Implies(y_positions[cir][f], y_positions[cir][f + 1]))
-
-
-def add_3l_clause(instance, lrud, pxy, circuit_idx_1, circuit_idx_2, direction, plate_height, s):
-        """
-        Add the normal 3-literal clause.
-        I.e.
-        - For the x-coordinate:
-            ~lr[i][j] \/ px[i][e] \/ ~px[j][e + w_i].
-
-        - For the y-coordinate:
-            ~ud[i][j] \/ py[i][f] \/ ~py[j][f + h_i].
-
-        Parameters
-        ----------
-        s : z3.Solver
-            solver on which to add the clauses
-        direction : string
-            either 'x' or 'y'.
-        circuit_idx_1 : int
-            index of the first rectangle.
-        circuit_idx_2 : int
-            index of the second rectangle.
-        """
-
-        rotation = instance.get_rotation()
-        rot_flags = instance.get_rotation_flags()
-
-        if direction == 'x':
-            rectangle_measure = instance.get_circuit(circuit_idx_1)[0]
-            other_rectangle_measure = instance.get_circuit(circuit_idx_1)[1]
-            strip_measure = instance.get_plate_width()
-        elif direction == 'y':
-            rectangle_measure = instance.get_circuit(circuit_idx_1)[1]
-            other_rectangle_measure = instance.get_circuit(circuit_idx_1)[0]
-            strip_measure = plate_height
+        if rotation:
+            rows.append(guarded([height_flag, -rot_flags[cir]], position_at_most(y_positions[cir], plate_height - instance.get_circuit(cir)[1])))
+            rows.append(guarded([height_flag, rot_flags[cir]], position_at_most(y_positions[cir], plate_height - instance.get_circuit(cir)[0])))
         else:
-            print("The direction must be either 'x' or 'y'")
-            return
+            rows.append(guarded([height_flag], position_at_most(y_positions[cir], plate_height - instance.get_circuit(cir)[1])))
 
-        if rotation:
-            
-            # do not allow rotation if rectangle height (width) is larger than strip width (height)
-            if other_rectangle_measure > strip_measure:
-                s.add(Not(rot_flags[circuit_idx_1]))
+    if simmetry_breaking:
 
-            # force rotation if rectangle width (height) is larger than strip width (height)
-            if rectangle_measure > strip_measure:
-                s.add(rot_flags[circuit_idx_1])
+        # Biggest circuit by Area
+        widest_idx = np.argmax([instance.get_circuit(r)[0] * instance.get_circuit(r)[1] for r in range(instance.get_n_circuits())])
+        widest_width = instance.get_circuit(widest_idx)[0]
+        widest_height = instance.get_circuit(widest_idx)[1]
 
-            # no rotation
-            for k in range(min(rectangle_measure, strip_measure)):
-                
-                s.add(Implies(Not(rot_flags[circuit_idx_1]),
-                                    Or(Not(lrud[circuit_idx_1][circuit_idx_2]), Not(pxy[circuit_idx_2][k]))))
-                
-            for k in range(strip_measure - rectangle_measure):
-                k1 = k + rectangle_measure
-                s.add(Implies(Not(rot_flags[circuit_idx_1]),
-                                    Or(Not(lrud[circuit_idx_1][circuit_idx_2]), pxy[circuit_idx_1][k], Not(pxy[circuit_idx_2][k1]))))
-            
-            # rotation
-            for k in range(min(other_rectangle_measure, strip_measure)):
-                s.add(Implies(rot_flags[circuit_idx_1],
-                                    Or(Not(lrud[circuit_idx_1][circuit_idx_2]), Not(pxy[circuit_idx_2][k]))))
-            for k in range(strip_measure - other_rectangle_measure):
-                k1 = k + other_rectangle_measure
-                s.add(Implies(rot_flags[circuit_idx_1],
-                                    Or(Not(lrud[circuit_idx_1][circuit_idx_2]), pxy[circuit_idx_1][k], Not(pxy[circuit_idx_2][k1]))))
-                
+        # The biggest circuit can only "slide" vertically in the bottom half of the plate
+        if rotation:
+            rows.append(guarded([height_flag, -rot_flags[widest_idx]], position_at_most(y_positions[widest_idx], (plate_height - widest_height) // 2)))
+            rows.append(guarded([height_flag, rot_flags[widest_idx]], position_at_most(y_positions[widest_idx], (plate_height - widest_width) // 2)))
         else:
-            #if rectangle 1 is left of rectangle 2, rectangle 2 cannot be at the left of the right edge of rectangle 1.
-            for k in range(rectangle_measure):
-                s.add(Or(Not(lrud[circuit_idx_1][circuit_idx_2]), Not(pxy[circuit_idx_2][k])))
+            rows.append(guarded([height_flag], position_at_most(y_positions[widest_idx], (plate_height - widest_height) // 2)))
 
-            for k in range(strip_measure - rectangle_measure):
-                k1 = k + rectangle_measure
-                s.add(Or(Not(lrud[circuit_idx_1][circuit_idx_2]), pxy[circuit_idx_1][k], Not(pxy[circuit_idx_2][k1])))
+        # Pairs that cannot be placed one below the other at this height
+        for c in range(instance.get_n_circuits()):
+            for j in range(c+1, instance.get_n_circuits()):
 
-def add_non_overlapping_constraint(instance, c, j, s, plate_height, to_add = [True, True, True, True]):
+                if j == widest_idx:
+                    if instance.get_circuit(c)[1] > (plate_height - widest_height)//2:
+                        rows.append([-height_flag, -ud[c][j]])
 
-    lr = instance.lr
-    ud = instance.ud
+                elif instance.get_circuit(c)[0] == instance.get_circuit(j)[0] and instance.get_circuit(c)[1] == instance.get_circuit(j)[1]:
+                    continue
 
-    x_positions = instance.get_x_positions()
-    y_positions = instance.get_y_positions()
+                elif instance.get_circuit(c)[0] + instance.get_circuit(j)[0] > plate_width:
+                    continue
 
-    # non-overlapping constraint
-    literals_4l = []
-    if to_add[0]:
-        literals_4l.append(lr[c][j])
-        add_3l_clause(instance, lr, x_positions, c, j, 'x', plate_height, s)
-    if to_add[1]:
-        literals_4l.append(lr[j][c])
-        add_3l_clause(instance, lr, x_positions, j, c, 'x', plate_height, s)
-    if to_add[2]:
-        literals_4l.append(ud[c][j])
-        add_3l_clause(instance, ud, y_positions, c, j, 'y', plate_height, s)
-    if to_add[3]:
-        literals_4l.append(ud[j][c])
-        add_3l_clause(instance, ud, y_positions, j, c, 'y', plate_height, s)
+                # Large Rectangles (vertical)
+                elif instance.get_circuit(c)[1] + instance.get_circuit(j)[1] > plate_height:
+                    rows.append([-height_flag, -ud[c][j]])
+                    rows.append([-height_flag, -ud[j][c]])
 
-    s.add(Or(literals_4l))
+    s.add_clauses(clause_matrix([row for row in rows if row is not None]))
 
+    return height_flag
 
-def set_non_overlap_constraints(instance, s, plate_height):
 
+def ordering_constraints(instance, s):
+    '''
+    Set the order encoding constraints: p[e] -> p[e + 1], for every x and y position
+    '''
+    _, indexes = instance.get_literal_table()
+
+    clauses = []
+    for positions in [indexes['px'], indexes['py']]:
+        pairs = np.stack([-positions[:, :-1], positions[:, 1:]], axis=-1).reshape(-1, 2)
+        clauses.append(np.pad(pairs, ((0, 0), (0, CLAUSE_WIDTH - 2))))
+
+    s.add_clauses(np.concatenate(clauses).astype(np.int32))
+
+
+def relative_position_clauses(first, second, relation, positions, measure, strip_measure, guard):
+    '''
+    Building the normal 3-literal clauses for all the pairs (first[p], second[p]) at once.
+    I.e. for the x-coordinate, where measure is the width of the first rectangle:
+        - ~lr[i][j] \/ ~px[j][k]                     for k < min(w_i, W)
+        - ~lr[i][j] \/ px[i][k] \/ ~px[j][k + w_i]    for k < W - w_i
+
+    Parameters
+    ----------
+    first, second : numpy arrays
+        indexes of the rectangles of every pair.
+    relation : numpy array
+        literal numbers of lr (or ud).
+    positions : numpy array
+        literal numbers of px (or py).
+    measure : numpy array
+        size of the first rectangle along the direction, for every pair.
+    strip_measure : int
+        size of the plate along the direction.
+    guard : numpy array
+        literal added to every clause of the pair (0 if the clause is not guarded).
+    '''
+    offsets = np.arange(strip_measure, dtype=np.int32)[None, :]
+    measure = measure[:, None]
+
+    relation = -relation[first, second][:, None]
+    guard = guard[:, None]
+    padding = np.zeros(1, dtype=np.int32)[:, None]
+
+    # the second rectangle cannot start before the end of the first one
+    mask = offsets < np.minimum(measure, strip_measure)
+    before = np.stack(np.broadcast_arrays(relation, -positions[second[:, None], offsets], guard, padding), axis=-1)[mask]
+
+    # if the first rectangle starts at most at k, the second one starts after k + measure
+    mask = offsets < strip_measure - measure
+    shifted = np.minimum(offsets + measure, strip_measure - 1)
+    after = np.stack(np.broadcast_arrays(relation, positions[first[:, None], offsets], -positions[second[:, None], shifted], guard), axis=-1)[mask]
+
+    return np.concatenate([before, after])
+
+
+def set_non_overlap_constraints(instance, s):
+    '''
+    Set the non-overlapping constraints. The literal numbers of all the clauses are computed at once with numpy
+    and the clauses are added to the backend in bulk. It returns the number of clauses added.
+    '''
+    n = instance.get_n_circuits()
     plate_width = instance.get_plate_width()
+    rotation = instance.get_rotation()
     simmetry_breaking = instance.get_simmetry_breaking()
 
-    # non-overlap constraints
+    # The clauses are built for the maximum height, they are valid for every smaller height as well.
+    # Pair incompatibilities that depend on the height are set by "set_height_constraints"
+    plate_height = instance.get_max_height()
+
+    _, indexes = instance.get_literal_table()
+    lr = indexes['lr']
+    ud = indexes['ud']
+    rot_flags = indexes['rot']
+
+    widths = np.array([instance.get_circuit(c)[0] for c in range(n)], dtype=np.int32)
+    heights = np.array([instance.get_circuit(c)[1] for c in range(n)], dtype=np.int32)
+
+    # all the pairs c < j
+    first, second = np.triu_indices(n, 1)
+
+    # For every pair, which one of lr[c][j], lr[j][c], ud[c][j], ud[j][c] is allowed
+    to_add = np.ones((len(first), 4), dtype=bool)
+
     if simmetry_breaking:
-        widest_idx = np.argmax([instance.get_circuit(r)[0] * instance.get_circuit(r)[1] for r in range(instance.get_n_circuits())])
+        widest_idx = np.argmax(widths * heights)
+        is_widest = second == widest_idx
 
-        for c in range(instance.get_n_circuits()):
-            for j in range(c+1, instance.get_n_circuits()):
+        # Reducing the domain for the largest rectangle
+        large_width = is_widest & (widths[first] > (plate_width - widths[widest_idx]) // 2)
+        to_add[large_width, 0] = False
 
-                # Reducing the domain for the largest rectangle
-                if j == widest_idx:
-                    large_width = instance.get_circuit(c)[0] > (plate_width - instance.get_circuit(widest_idx)[0])//2
-                    large_height = instance.get_circuit(c)[1] > (plate_height - instance.get_circuit(widest_idx)[1])//2
-                    if large_width and large_height:
-                        add_non_overlapping_constraint(instance, c, j, s, plate_height, to_add=[False, True, False, True])
-                    elif large_width:
-                        add_non_overlapping_constraint(instance, c, j, s, plate_height, to_add=[False, True, True, True])
-                    elif large_height:
-                        add_non_overlapping_constraint(instance, c, j, s, plate_height, to_add=[True, True, False, True])
-                    else:
-                        add_non_overlapping_constraint(instance, c, j, s, plate_height)
-
-                # Breaking symmetries for same-sized rectangles
-                elif instance.get_circuit(c)[0] == instance.get_circuit(j)[0] and instance.get_circuit(c)[1] == instance.get_circuit(j)[1]:
-                    add_non_overlapping_constraint(instance, c, j, s, plate_height, to_add=[True, False, True, False])
+        # Breaking symmetries for same-sized rectangles
+        same_size = ~is_widest & (widths[first] == widths[second]) & (heights[first] == heights[second])
+        to_add[same_size, 1] = False
+        to_add[same_size, 3] = False
 
-                # Large Rectangles (horizontal)
-                elif instance.get_circuit(c)[0] + instance.get_circuit(j)[0] > plate_width:
-                    add_non_overlapping_constraint(instance, c, j, s, plate_height, to_add=[False, False, True, True])
+        # Large Rectangles (horizontal)
+        horizontal = ~is_widest & ~same_size & (widths[first] + widths[second] > plate_width)
+        to_add[horizontal, 0] = False
+        to_add[horizontal, 1] = False
 
-                # Large Rectangles (vertical)
-                elif instance.get_circuit(c)[1] + instance.get_circuit(j)[1] > plate_height:
-                    add_non_overlapping_constraint(instance, c, j, s, plate_height, to_add=[True, True, False, False])
-                else:
-                    add_non_overlapping_constraint(instance, c, j, s, plate_height)
-    else:
-        for c in range(instance.get_n_circuits()):
-            for j in range(c+1, instance.get_n_circuits()):
-                add_non_overlapping_constraint(instance, c, j, s, plate_height)
\ No newline at end of file
+    clauses = []
+
+    # 4-literal clause: at least one relative position holds
+    four_literals = np.stack([lr[first, second], lr[second, first], ud[first, second], ud[second, first]], axis=-1)
+    clauses.append(np.where(to_add, four_literals, 0).astype(np.int32))
+
+    # (relation, positions, strip measure, index of the first and second rectangle, allowed pairs) for every direction
+    directions = [
+        (lr, indexes['px'], plate_width, first, second, to_add[:, 0], widths, heights),
+        (lr, indexes['px'], plate_width, second, first, to_add[:, 1], widths, heights),
+        (ud, indexes['py'], plate_height, first, second, to_add[:, 2], heights, widths),
+        (ud, indexes['py'], plate_height, second, first, to_add[:, 3], heights, widths),
+    ]
+
+    for relation, positions, strip_measure, i, j, allowed, measure, other_measure in directions:
+        i = i[allowed]
+        j = j[allowed]
+
+        if rotation:
+            # no rotation
+            clauses.append(relative_position_clauses(i, j, relation, positions, measure[i], strip_measure, rot_flags[i]))
+            # rotation
+            clauses.append(relative_position_clauses(i, j, relation, positions, other_measure[i], strip_measure, -rot_flags[i]))
+        else:
+            clauses.append(relative_position_clauses(i, j, relation, positions, measure[i], strip_measure, np.zeros(len(i), dtype=np.int32)))
+
+    if rotation:
+        for strip_measure, measure, other_measure in [(plate_width, widths, heights), (plate_height, heights, widths)]:
+            units = np.zeros((n, 4), dtype=np.int32)
+            # do not allow rotation if rectangle height (width) is larger than strip width (height)
+            units[:, 0] = np.where(other_measure > strip_measure, -rot_flags, 0)
+            clauses.append(units[units[:, 0] != 0])
+            # force rotation if rectangle width (height) is larger than strip width (height)
+            units[:, 0] = np.where(measure > strip_measure, rot_flags, 0)
+            clauses.append(units[units[:, 0] != 0])
+
+    clauses = np.concatenate(clauses)
+    s.add_clauses(clauses)
+    return len(clauses)
@@ -0,0 +1,93 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+# Default size cap of the cache folder, in MB
+DEFAULT_CACHE_SIZE = 512
+
+
+class FormulaCache():
+    '''
+    Content-addressed on-disk cache of encoded formulas (clause matrices or SMT-LIB2 scripts).
+    Every entry is a gzip file named after the hash of the instance and of the encoding configuration.
+    When the folder grows over the size cap, the least recently used entries are removed.
+    '''
+
+    def __init__(self, folder, max_size=DEFAULT_CACHE_SIZE):
+        self._folder = folder
+        self._max_size = int(max_size * 2**20)
+        os.makedirs(folder, exist_ok=True)
+
+    def get_key(self, instance, approach, sources=()):
+        '''
+        Returning the key of an instance: the circuit multiset, the plate width and maximum height,
+        the rotation and simmetry breaking flags, the approach and the content of the "sources" files
+        (the modules building the encoding, so that any change of the constraints invalidates the entries)
+        '''
+        description = {
+            'approach': approach,
+            'circuits': sorted(instance.get_circuit(c) for c in range(instance.get_n_circuits())),
+            'plate_width': instance.get_plate_width(),
+            'max_height': instance.get_max_height(),
+            'rotation': instance.get_rotation(),
+            'simmetry_breaking': instance.get_simmetry_breaking(),
+        }
+        digest = hashlib.sha256(json.dumps(description, sort_keys=True).encode())
+        for source in sources:
+            with open(source, 'rb') as file:
+                digest.update(file.read())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self._folder, f'{key}.gz')
+
+    def load(self, key):
+        '''
+        Returning the formula stored with the given key, None if it is not in the cache
+        '''
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rb') as file:
+                data = file.read()
+        except (FileNotFoundError, EOFError, OSError):
+            return None
+        # the modification time marks the last use of the entry
+        os.utime(path)
+        return data
+
+    def store(self, key, data):
+        '''
+        Storing a formula (bytes) with the given key, then evicting the least recently used entries over the size cap
+        '''
+        # the entry is written to a temporary file and renamed, so that a concurrent run never reads half of it
+        descriptor, temporary_path = tempfile.mkstemp(dir=self._folder, suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1) as file:
+            file.write(data)
+        os.replace(temporary_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        '''
+        Removing the least recently used entries until the cache fits its size cap
+        '''
+        entries = []
+        for name in os.listdir(self._folder):
+            if not name.endswith('.gz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self._folder, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total_size = sum(entry[1] for entry in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self._max_size:
+                break
+            try:
+                os.remove(os.path.join(self._folder, name))
+            except FileNotFoundError:
+                pass
+            total_size -= size
@@ -1,7 +1,10 @@
 import math
 from pathlib import Path
 from typing import List, Tuple
+from heuristic import skyline_heuristic
+from bounds import lower_bound
 from z3 import *
+import numpy as np
 
 class Instance():
 
@@ -13,18 +16,20 @@ class Instance():
     _name : str
     _rotation: bool
 
-    def __init__(self, raw_instance, name_instance, rotation=False, simmetry_breaking=True):
+    def __init__(self, raw_instance, name_instance, rotation=False, simmetry_breaking=True, ctx=None):
         
-        # getting the width of the silicon plate
-        self._plate_width = int(raw_instance[0])
+        # z3 context of the variables, None for the global one. Instances solved on different threads need their own context
+        self._ctx = ctx
+
+        # getting the width of the silicon plate and the circuits from the instance record (see utils.iter_instances)
+        plate_width, circuits = raw_instance
+        self._plate_width = int(plate_width)
 
         # getting the number of circuits to place inside the plate
-        self._n_circuits = int(raw_instance[1])
+        self._n_circuits = len(circuits)
 
         # Getting circuits width and height
-        values = raw_instance[2:]
-
-        circuits = [(int(width), int(height)) for value in values for width, height in [value.split(' ')]]
+        circuits = [(int(width), int(height)) for width, height in circuits]
         self._circuits = sorted(circuits, reverse=True)
 
         # Getting instance name
@@ -44,20 +49,34 @@ class Instance():
 
         self._simmetry_breaking = simmetry_breaking
 
+        # Best lower bound of the plate height (area, tallest circuit, wide circuits, dual feasible functions, bar relaxation)
+        self._min_height, self._lower_bound_name = lower_bound(self)
+
+        # Upper bound of the plate height given by the skyline heuristic. Its placement is used as a solution hint
+        self._hint_circuits, hint_height = skyline_heuristic(self)
+        self._max_height = min(self._max_height, hint_height)
+
 
         # list of booleans. If True, the circuit that is looping can be placed at that specific x-position, False otherwise
-        self._x_positions = [[Bool(f"px_{circuit_index+1}_{w}") for w in range(self._plate_width)] for circuit_index in range(self.get_n_circuits())]
+        self._x_positions = [[Bool(f"px_{circuit_index+1}_{w}", self._ctx) for w in range(self._plate_width)] for circuit_index in range(self.get_n_circuits())]
         
-        # list of booleans. If True, the circuit that is looping can be placed at that specific y-position, False otherwise
-        self._y_positions = [[Bool(f"py_{circuit_index+1}_{h}") for h in range(self._min_height)] for circuit_index in range(self.get_n_circuits())]
+        # list of booleans. If True, the circuit that is looping can be placed at that specific y-position, False otherwise.
+        # The encoding is built once up to the maximum height, so that every candidate height can reuse it
+        self._y_positions = [[Bool(f"py_{circuit_index+1}_{h}", self._ctx) for h in range(self._max_height)] for circuit_index in range(self.get_n_circuits())]
 
         # List of boolean flags, in order to understand if a specific circuit is rotated or not.
-        self._rot_flags = [Bool(str(circuit_index)+"_rotation") for circuit_index in range(self.get_n_circuits())]
+        self._rot_flags = [Bool(str(circuit_index)+"_rotation", self._ctx) for circuit_index in range(self.get_n_circuits())]
 
         # list of booleans. If True, the circuit at index 1 is placed at the left of the circuit at index 2. False otherwise.
-        self.lr = [[Bool(f"LeftRight_{circuit_index_1+1}_{circuit_index_2+1}") if circuit_index_1 != circuit_index_2 else 0 for circuit_index_2 in range(self.get_n_circuits())] for circuit_index_1 in range(self.get_n_circuits())]
+        self.lr = [[Bool(f"LeftRight_{circuit_index_1+1}_{circuit_index_2+1}", self._ctx) if circuit_index_1 != circuit_index_2 else 0 for circuit_index_2 in range(self.get_n_circuits())] for circuit_index_1 in range(self.get_n_circuits())]
         # list of booleans. If True, the circuit at index 1 is placed at the bottom of the circuit at index 2. False otherwise
-        self.ud = [[Bool(f"DownUp_{circuit_index_1+1}_{circuit_index_2+1}") if circuit_index_1 != circuit_index_2 else 0 for circuit_index_2 in range(self.get_n_circuits())] for circuit_index_1 in range(self.get_n_circuits())]
+        self.ud = [[Bool(f"DownUp_{circuit_index_1+1}_{circuit_index_2+1}", self._ctx) if circuit_index_1 != circuit_index_2 else 0 for circuit_index_2 in range(self.get_n_circuits())] for circuit_index_1 in range(self.get_n_circuits())]
+
+        # Dictionary of activation literals. The key is a plate height, the value is the number of the boolean that enables its constraints
+        self._height_flags = {}
+
+        # Integer numbering of the boolean variables, built the first time it is requested
+        self._literal_table = None
 
     def get_plate_width(self):
         '''
@@ -83,12 +102,30 @@ class Instance():
         '''
         return self._min_height
     
+    def get_lower_bound_name(self):
+        '''
+        Returning the name of the bound giving the minimum height (see bounds.LOWER_BOUNDS)
+        '''
+        return self._lower_bound_name
+    
     def get_max_height(self):
         '''
         Returning the maximum height
         '''
         return self._max_height
 
+    def get_hint(self):
+        '''
+        Returning the circuits placed by the skyline heuristic, as [width, height, x, y]
+        '''
+        return self._hint_circuits
+
+    def get_context(self):
+        '''
+        Returning the z3 context of the variables (None for the global context)
+        '''
+        return self._ctx
+
     def get_name(self):
         '''
         Returning the instance name
@@ -131,4 +168,49 @@ class Instance():
         '''
         Returning rotation flags
         '''
-        return self._rot_flags
\ No newline at end of file
+        return self._rot_flags
+    
+    def get_height_flag(self, plate_height):
+        '''
+        Returning the number of the activation literal of a plate height, creating it the first time it is requested
+        '''
+        if plate_height not in self._height_flags:
+            variables, _ = self.get_literal_table()
+            variables.append(Bool(f"height_{plate_height}", self._ctx))
+            self._height_flags[plate_height] = len(variables)
+        return self._height_flags[plate_height]
+    
+    def has_height_flag(self, plate_height):
+        '''
+        Returning True if the constraints of a plate height have already been encoded
+        '''
+        return plate_height in self._height_flags
+    
+    def get_literal_table(self):
+        '''
+        Returning the integer numbering of the boolean variables, as a tuple (variables, indexes):
+            -) variables is the list of all the z3 booleans, the number v identifies variables[v - 1];
+            -) indexes is a dictionary of numpy arrays ('px', 'py', 'rot', 'lr', 'ud') with the same shape
+               of the encoded variables, containing their numbers. The diagonal of 'lr' and 'ud' is 0.
+        '''
+        if self._literal_table is None:
+            n = self.get_n_circuits()
+            variables = []
+
+            def number(booleans):
+                start = len(variables) + 1
+                variables.extend(booleans)
+                return np.arange(start, len(variables) + 1, dtype=np.int32)
+
+            indexes = {}
+            indexes['px'] = number([p for row in self._x_positions for p in row]).reshape(n, self._plate_width)
+            indexes['py'] = number([p for row in self._y_positions for p in row]).reshape(n, self._max_height)
+            indexes['rot'] = number(self._rot_flags)
+
+            off_diagonal = ~np.eye(n, dtype=bool)
+            for key, booleans in [('lr', self.lr), ('ud', self.ud)]:
+                indexes[key] = np.zeros((n, n), dtype=np.int32)
+                indexes[key][off_diagonal] = number([booleans[i][j] for i in range(n) for j in range(n) if i != j])
+
+            self._literal_table = (variables, indexes)
+        return self._literal_table
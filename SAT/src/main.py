@@ -1,112 +1,286 @@
 import argparse
-from tqdm import tqdm
+from functools import partial
+import io
+import os
+import numpy as np
 import time
 from instance import Instance
 from z3 import *
-from constraints import set_domain_constraints, set_non_overlap_constraints, ordering_constraints
+from constraints import set_domain_constraints, set_non_overlap_constraints, ordering_constraints, set_height_constraints, clause_matrix
+from backends import make_backend, BACKENDS, ClauseList
+from formula_cache import FormulaCache, DEFAULT_CACHE_SIZE
+from solution_cache import SolutionCache
+from verifier import check_placement, verify_placement
+from search import search_height, SEARCH_STRATEGIES
+from renderer import RENDERERS
+from results import ResultsStore
+from phases import PhaseTimer
 from utils import *
 
 
-def solve_instance(instance, solver, plate_height, add_constraints=True):
+def probe_height(instance, solver, plate_height, deadline):
+    '''
+    Checking if the circuits fit a plate of the given height. The height is enabled through its
+    activation literal, so the solver keeps the clauses learned while checking the other heights.
+    '''
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        return unknown, None
 
-    # It enters here only if it is the first call. Otherwise, it is useless, because
-    # the constraints are already added to the solver.
-    if add_constraints:
-        set_domain_constraints(instance, solver, plate_height)
-        ordering_constraints(instance, solver, plate_height)
-        set_non_overlap_constraints(instance, solver, plate_height)
+    height_flag = set_height_constraints(instance, solver, plate_height)
 
-    result = solver.check()
+    result, assignment = solver.solve([height_flag], remaining)
 
-    # check if the solving time is higher than 300 seconds
-    if result == unknown:
-        return "Time Expired"
-    
-    # Check if the solution exists
-    elif result == sat:
-        model = s.model()
-        return model, plate_height
-    else:
-        plate_height += 1
-        if plate_height < instance.get_max_height():
-            return solve_instance(instance, solver, plate_height, add_constraints=False)
-        else:
-            return "Maximum Height exceeded"
+    # The height is unsatisfiable, its activation literal can be permanently disabled
+    if result == unsat:
+        solver.add_clauses(clause_matrix([[-height_flag]]))
+    return result, assignment
 
 
+# folder of the solved instances
+SOLUTION_CACHE_PATH = './SAT/solution_cache/'
 
-if __name__ == '__main__':
+# results store and timing.csv exported from it
+RESULTS_PATH = './SAT/results.db'
+TIMING_PATH = './SAT/timing.csv'
 
-    # Create an argument parser
-    parser = argparse.ArgumentParser(description='SAT argument parsing')
+# modules building the encoding, part of the formula cache keys
+ENCODING_SOURCES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), module) for module in ['constraints.py', 'instance.py']]
 
-    # Add arguments
-    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instance folder name')
-    parser.add_argument('--rotation', action='store_true', help='Set circuit rotation to True')
-    parser.add_argument('--simmetry_breaking', action='store_true', help='Set solving simmetry breaking to True')
-    args = parser.parse_args()
 
-    folder_name = args.folder_name
-    rotation = args.rotation
-    simmetry_breaking = args.simmetry_breaking
-    output_txt_path, output_img_path, output_failure_path = set_environment(rotation, simmetry_breaking, 'SAT')
-    
-    instances = import_instances(folder_name)
+def encode_instance(instance, solver, formula_cache=None):
+    '''
+    Adding the constraints independent from the plate height to the solver. They are built up to the maximum height,
+    so they hold for every candidate height. If a formula cache is given, the clauses are read from it when possible.
+    '''
+    if formula_cache is not None:
+        key = formula_cache.get_key(instance, 'SAT', ENCODING_SOURCES)
+        data = formula_cache.load(key)
+        if data is not None:
+            clauses = np.load(io.BytesIO(data))
+            solver.add_clauses(clauses)
+            print(f"formula cache hit: {len(clauses)} clauses")
+            return
 
-    # list of all timing measures for each instance
-    timings = []
+    clause_list = ClauseList()
+    set_domain_constraints(instance, clause_list)
+    ordering_constraints(instance, clause_list)
 
-    for i in tqdm(range(len(instances))):
-    
-        name_instance = f'{i}_instance'
-        instance = Instance(instances[i], name_instance, rotation, simmetry_breaking)
+    encoding_start = time.time()
+    n_clauses = set_non_overlap_constraints(instance, clause_list)
+    encoding_time = time.time() - encoding_start
+    print(f"non-overlap encoding: {n_clauses} clauses in {encoding_time:.3f} s ({n_clauses / max(encoding_time, 1e-9):.0f} clauses/s)")
+
+    clauses = clause_list.get_clauses()
+    solver.add_clauses(clauses)
+
+    if formula_cache is not None:
+        # the clause matrix is stored in binary form, reading it back is faster than parsing DIMACS text
+        data = io.BytesIO()
+        np.save(data, clauses)
+        formula_cache.store(key, data.getvalue())
+
+
+def hint_literals(instance):
+    '''
+    Returning the literals of the order encoding of the skyline heuristic placement (Instance.get_hint):
+    px[c][e] is true iff x_c <= e, py[c][e] iff y_c <= e, and rot[c] iff the circuit is rotated
+    '''
+    _, indexes = instance.get_literal_table()
+    hint = np.array(instance.get_hint(), dtype=np.int64).reshape(-1, 4)
+    widths = np.array([instance.get_circuit(c)[0] for c in range(instance.get_n_circuits())], dtype=np.int64)
+
+    literals = []
+    for key, position, size in [('px', hint[:, 2], indexes['px'].shape[1]), ('py', hint[:, 3], indexes['py'].shape[1])]:
+        signs = np.where(position[:, None] <= np.arange(size)[None, :], 1, -1)
+        literals.append((indexes[key] * signs).ravel())
+    if instance.get_rotation():
+        literals.append(indexes['rot'] * np.where(hint[:, 0] != widths, 1, -1))
+    return np.concatenate(literals)
+
+
+def solve_instance(instance, solver, strategy='linear-up', time_limit=300, formula_cache=None, timer=None):
+    '''
+    Encoding the instance and looking for the minimum height. If a PhaseTimer is given, the encoding is timed as
+    its 'encode' phase and every height probe as a lap of its 'solve' phase.
+    '''
+    if timer is None:
+        timer = PhaseTimer()
+
+    deadline = time.time() + time_limit
+
+    with timer.phase('encode'):
+        encode_instance(instance, solver, formula_cache)
+        # the search starts from the placement of the skyline heuristic
+        solver.set_phases(hint_literals(instance))
+
+    return search_height(lambda plate_height: probe_height(instance, solver, plate_height, deadline),
+                         instance.get_min_height(), instance.get_max_height(), strategy,
+                         model_height=lambda model: get_model_height(instance, model), timer=timer)
+
+
+def get_placement(instance, time_limit=300, strategy='linear-up', backend='z3', sat_solver=None):
+    '''
+    Solving an instance and returning (circuits, height, optimal), with the circuits placed as [width, height, x, y].
+    The height search is exact, so the solution is optimal unless the time expired before the search completed,
+    in which case the lowest placement found is returned as not proven optimal. It returns None if no solution is found.
+    '''
+    variables, _ = instance.get_literal_table()
+    solver = make_backend(backend, variables, sat_solver, ctx=instance.get_context())
 
-        plate_height = instance.get_min_height()
-        
-        plate_width = instance.get_plate_width()
+    output, _ = solve_instance(instance, solver, strategy, time_limit)
+    if type(output) == str:
+        return None
+    return get_circuits(instance, output[0]), output[1], output[2]
 
-        # starting timing operation
-        start_time = time.time()
 
-        if rotation:
-            # List of boolean flags, in order to understand if a specific circuit at a certain position is rotated or not.
-            rot_flags = [Bool(str(circuit_index)+"_rotation") for circuit_index in range(instance.get_n_circuits())]
+def run_instance(i, raw_instance, rotation, simmetry_breaking, output_paths, strategy='linear-up', backend='z3',
+                 sat_solver=None, dimacs_path=None, formula_cache=None, solution_cache=None, refresh=False, renderer='matplotlib',
+                 results=None):
+    '''
+    Solving the i-th instance and writing its solution, returning the time needed to solve it ('-' if it failed).
+    output_paths is the tuple (output_txt_path, output_img_path, output_failure_path).
+    If a solution cache is given, a verified cached solution is written without solving the instance,
+    unless refresh is True. New solutions are stored in the cache.
+    renderer is the renderer of the solution image (see renderer.RENDERERS), None to write only the textual solution.
+    If a results store is given, the run is appended to it, with the times of its phases (see phases.PhaseTimer).
+    The time needed to solve the instance is the time of the encode, solve and decode phases.
+    '''
+    output_txt_path, output_img_path, output_failure_path = output_paths
+    timer = PhaseTimer()
 
-        # Solver initialization
-        s = Solver()
-        # 5 minutes (300 sec) time limit for each instance to be solved
-        tmout = 300 * 1000
-        s.set(timeout = tmout)
+    name_instance = f'{i}_instance'
+    # every instance has its own z3 context, so that instances can be solved on threads (see utils.run_instances)
+    with timer.phase('parse'):
+        instance = Instance(raw_instance, name_instance, rotation, simmetry_breaking, Context())
+    statistics = {'backend': backend, 'sat_solver': sat_solver, 'strategy': strategy}
 
-        output = solve_instance(instance, s, plate_height)
+    if solution_cache is not None:
+        key = solution_cache.get_key(instance, 'SAT', {'rotation': rotation, 'simmetry_breaking': simmetry_breaking})
+        entry = None if refresh else solution_cache.load(key)
+        if entry is not None and verify_placement(instance, entry['circuits'], entry['height']):
+            write_solution(instance, entry['circuits'], entry['height'], output_txt_path, output_img_path, renderer, timer)
+            print(f"Cached solution for instance {i + 1}")
+            print(f"minimum height found is: {entry['height']}")
+            print(f"The time requested for this instance was: {entry['solve_time']}")
+            if results is not None:
+                results.append('SAT', i, instance, entry['height'], entry['optimal'], entry['solve_time'],
+                               timer.get_times(), dict(statistics, cached=True))
+            return entry['solve_time']
 
-        if type(output) == str:
+    # Solver initialization
+    with timer.phase('encode'):
+        variables, _ = instance.get_literal_table()
+        s = make_backend(backend, variables, sat_solver, keep_dimacs=dimacs_path is not None, ctx=instance.get_context())
 
-            end_time = time.time()
-            timings.append('-')
+    # 5 minutes (300 sec) time limit for each instance to be solved, shared by all the height probes
+    output, probes = solve_instance(instance, s, strategy, time_limit=300, formula_cache=formula_cache, timer=timer)
 
-            # write the instance in failures file
-            with open(output_failure_path, 'a') as output:
-                output.write(f'Instance {i + 1} failed')
-                output.write('\n')
-            print("\nFailed to solve instance %i" % (i + 1))
+    for probe in probes:
+        print(f"height {probe[0]}: {probe[1]} ({probe[2]:.3f} s)")
+    statistics['probes'] = [[probe[0], str(probe[1]), probe[2]] for probe in probes]
 
-        else:
+    if dimacs_path is not None:
+        write_dimacs(instance, s, dimacs_path, i)
 
-            m = output[0]
-            height = output[1]
+    if type(output) == str:
 
-            decode_circuits(instance, m, height, output_txt_path, output_img_path)
+        # write the instance in failures file
+        with open(output_failure_path, 'a') as output:
+            output.write(f'Instance {i + 1} failed')
+            output.write('\n')
+        print("\nFailed to solve instance %i" % (i + 1))
+        if results is not None:
+            results.append('SAT', i, instance, times=timer.get_times(), statistics=statistics)
+        return '-'
 
-            end_time = time.time()
+    m, height, optimal = output
 
-            timings.append(end_time - start_time)
+    with timer.phase('decode'):
+        circuits = get_circuits(instance, m)
+
+    # the solution is timed without checking, writing it and drawing its image
+    solve_time = timer.get_solve_time()
+
+    # the placement is checked before it is written and cached
+    with timer.phase('verify'):
+        problems = check_placement(instance, circuits, height)
+    if problems:
+
+        # write the instance in failures file
+        with open(output_failure_path, 'a') as output:
+            output.write(f'Instance {i + 1} failed verification: {"; ".join(problems)}')
+            output.write('\n')
+        print(f"\nWrong solution for instance {i + 1}: {'; '.join(problems)}")
+        if results is not None:
+            results.append('SAT', i, instance, times=timer.get_times(), statistics=dict(statistics, problems=problems))
+        return '-'
+
+    write_solution(instance, circuits, height, output_txt_path, output_img_path, renderer, timer)
+
+    if solution_cache is not None:
+        solution_cache.store(key, circuits, height, optimal, solve_time)
+
+    print(f"Solution found for instance {i + 1}")
+    print(f"lower bound of the height is: {instance.get_min_height()} ({instance.get_lower_bound_name()} bound{', tight' if height == instance.get_min_height() else ''})")
+    print(f"minimum height found is: {height}{'' if optimal else ' (not proven optimal)'}")
+    print(f"The time requested for this instance was: {solve_time}")
+    print(f"phases: {timer.summary()}")
+    print("\n\n\n\n\n")
+
+    if results is not None:
+        results.append('SAT', i, instance, height, optimal, solve_time, timer.get_times(), statistics)
+
+    return solve_time
+
+
+if __name__ == '__main__':
+
+    # Create an argument parser
+    parser = argparse.ArgumentParser(description='SAT argument parsing')
+
+    # Add arguments
+    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instances: a folder, a glob pattern, a bundle file or - for the standard input')
+    parser.add_argument('--rotation', action='store_true', help='Set circuit rotation to True')
+    parser.add_argument('--simmetry_breaking', action='store_true', help='Set solving simmetry breaking to True')
+    parser.add_argument('--search', type=str, default='linear-up', choices=SEARCH_STRATEGIES, help='Strategy used to look for the minimum height')
+    parser.add_argument('--backend', type=str, default='z3', choices=BACKENDS, help='SAT solver used to solve the encoding')
+    parser.add_argument('--sat_solver', type=str, default=None, help='python-sat solver name (pysat backend) or command line of the SAT binary (external backend)')
+    parser.add_argument('--formula_cache', type=str, default=None, help='Folder of the cache of encoded formulas, disabled if not given')
+    parser.add_argument('--formula_cache_size', type=float, default=DEFAULT_CACHE_SIZE, help='Size cap of the formula cache, in MB')
+    parser.add_argument('--no_cache', '--no-cache', action='store_true', help='Do not use the solution cache')
+    parser.add_argument('--refresh', action='store_true', help='Solve again the instances in the solution cache, updating it')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes solving the instances in parallel')
+    parser.add_argument('--threads', action='store_true', help='Solve the jobs on threads of this process instead of processes')
+    parser.add_argument('--renderer', type=str, default='matplotlib', choices=RENDERERS, help='Renderer of the solution images: matplotlib, fast (numpy PNG) or svg')
+    parser.add_argument('--no_render', '--no-render', action='store_true', help='Do not draw the solution images, they can be drawn later by render.py')
+    parser.add_argument('--results', type=str, default=RESULTS_PATH, help='SQLite database where every run is appended')
+    parser.add_argument('--export_timing', '--export-timing', action='store_true', help='Export timing.csv from the results store after the run')
+    parser.add_argument('--dimacs', type=str, default=None, help='Folder where the DIMACS encoding of every instance is written, "-" for the standard output')
+    args = parser.parse_args()
+
+    folder_name = args.folder_name
+    rotation = args.rotation
+    simmetry_breaking = args.simmetry_breaking
+    strategy = args.search
+    backend = args.backend
+    sat_solver = args.sat_solver
+    dimacs_path = args.dimacs
+    formula_cache = FormulaCache(args.formula_cache, args.formula_cache_size) if args.formula_cache is not None else None
+    solution_cache = SolutionCache(SOLUTION_CACHE_PATH) if not args.no_cache else None
+    results = ResultsStore(args.results)
+    output_txt_path, output_img_path, output_failure_path = set_environment(rotation, simmetry_breaking, 'SAT')
+    
+    instances = iter_instances(folder_name)
 
-            print(f"Solution found for instance {i + 1}")
-            print(f"optimum height is: {instance.get_min_height()}")
-            print(f"minimum height found is: {height}")
-            print(f"The time requested for this instance was: {end_time - start_time}")
-            print("\n\n\n\n\n")
+    # the instances are solved in parallel by "jobs" processes (or threads), the timings are collected in instance order
+    solve = partial(run_instance, rotation=rotation, simmetry_breaking=simmetry_breaking,
+                    output_paths=(output_txt_path, output_img_path, output_failure_path), strategy=strategy,
+                    backend=backend, sat_solver=sat_solver, dimacs_path=dimacs_path, formula_cache=formula_cache,
+                    solution_cache=solution_cache, refresh=args.refresh, renderer=None if args.no_render else args.renderer,
+                    results=results)
+    timings = run_instances(solve, instances, args.jobs, args.threads)
 
-    # Saving time needed to solve the instances into 'timing.csv' file
-    save_times_to_csv(rotation, simmetry_breaking, timings, len(instances))
+    # Exporting the latest time of every instance and configuration into 'timing.csv' file
+    if args.export_timing:
+        results.export_timing_csv(TIMING_PATH, 'SAT', len(timings))
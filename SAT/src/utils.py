@@ -1,7 +1,13 @@
 import re
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
+import sys
+import glob
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from tqdm import tqdm
+from renderer import render_solution
+from phases import PhaseTimer
 
 def set_environment(rotation, simmetry_breaking, approach):
     '''
@@ -46,21 +52,103 @@ def sorted_alphanumeric(data):
 
     return sorted(data, key=alphanumeric_key)
 
-def import_instances(folder):
+# Compact record of an instance: the plate width and the (width, height) pairs of the circuits
+InstanceRecord = namedtuple('InstanceRecord', ['plate_width', 'circuits'])
+
+
+def parse_instance(lines, source='<instance>'):
+    '''
+    Parsing the lines of an instance (plate width, number of circuits, one "width height" line per circuit)
+    into an InstanceRecord. The number of circuits declared in the header must match the circuits listed.
+    '''
+    try:
+        values = [int(value) for line in lines for value in line.split()]
+    except ValueError as error:
+        raise ValueError(f"{source}: {error}") from None
+    if len(values) < 2 or len(values) % 2 != 0:
+        raise ValueError(f"{source}: expected the plate width, the number of circuits and a width and a height per circuit")
+
+    plate_width, n_circuits = values[0], values[1]
+    circuits = tuple(zip(values[2::2], values[3::2]))
+    if len(circuits) != n_circuits:
+        raise ValueError(f"{source}: {n_circuits} circuits declared, {len(circuits)} found")
+    return InstanceRecord(plate_width, circuits)
+
+
+def read_instances(file, source):
+    '''
+    Yielding the instances of an open file one at a time. A bundle file holds several instances separated by blank lines.
+    '''
+    lines = []
+    for number, line in enumerate(file, 1):
+        if line.strip():
+            lines.append(line)
+        elif lines:
+            yield parse_instance(lines, f'{source}:{number - len(lines)}')
+            lines = []
+    if lines:
+        yield parse_instance(lines, f'{source}:{number - len(lines) + 1}')
+
+
+def get_instance_files(source):
     '''
-    import instances, file by file
+    Listing the files of a source: the files of a folder or the matches of a glob pattern, in alphanumeric order,
+    or a single (possibly bundle) file
     '''
-    # list of files, ordered by name
-    files = [file for file in sorted_alphanumeric(os.listdir(folder))]
-    # list of instances, splitted line by line each instance
-    instances = [open(folder + file).read().splitlines() for file in files]
-    return instances
+    if os.path.isdir(source):
+        return [os.path.join(source, file) for file in sorted_alphanumeric(os.listdir(source)) if os.path.isfile(os.path.join(source, file))]
+    if any(character in source for character in '*?['):
+        return sorted_alphanumeric(glob.glob(source))
+    return [source]
+
+
+def iter_instances(source):
+    '''
+    import instances lazily, one at a time, from a folder, a glob pattern (e.g. "input/ins-1*.txt"), a bundle file
+    or the standard input ("-"). Every file is closed before the next one is opened.
+    '''
+    if source == '-':
+        yield from read_instances(sys.stdin, '<stdin>')
+        return
+
+    for path in get_instance_files(source):
+        with open(path) as file:
+            yield from read_instances(file, path)
+
+
+def run_instances(solve, instances, jobs=1, threads=False):
+    '''
+    Calling solve(index, record) on every instance and returning the results in instance order.
+    instances can be any iterable of InstanceRecord, e.g. the iter_instances generator, read while solving.
+    If jobs > 1, the instances are spread over a pool of processes, each one with its own solver state;
+    at most 2 * jobs instances are waiting in the pool at any time.
+    If threads is True, the pool is made of threads of this process instead, with no process start and no import
+    of the modules per worker: solve must keep the state of every instance apart (e.g. its own z3 context).
+    '''
+    if jobs <= 1:
+        return [solve(i, record) for i, record in enumerate(tqdm(instances))]
+
+    results = []
+    with (ThreadPoolExecutor if threads else ProcessPoolExecutor)(max_workers=jobs) as executor:
+        pending = deque()
+        for i, record in enumerate(tqdm(instances)):
+            pending.append(executor.submit(solve, i, record))
+            if len(pending) >= 2 * jobs:
+                results.append(pending.popleft().result())
+        results.extend(future.result() for future in pending)
+    return results
+
+
+
 
 def decode_positions(encoding, min_value=0):
         
         """
         Decode an encoded position.
 
+        The order encoding is monotone (once a value is True all the following ones are True), so the first True
+        value is found by bisection, with O(log n) reads of the encoding.
+
         Args:
             encoding (list of bool): Order-encoded value in the form [False, ..., False, True, True, ...]
             min_value (int, optional): Starting value of the domain of the encoded value. Default is 0.
@@ -69,58 +157,135 @@ def decode_positions(encoding, min_value=0):
             int: The decoded position
         """
 
-        decoded_position = next((i + min_value for i, val in enumerate(encoding) if val), len(encoding) + min_value)
-        return decoded_position
+        low, high = 0, len(encoding)
+        while low < high:
+            middle = (low + high) // 2
+            if encoding[middle]:
+                high = middle
+            else:
+                low = middle + 1
+        return low + min_value
+
+
+def decode_order_encoding(assignment, table):
+    '''
+    Decoding all the order-encoded values of a table of literal numbers (one row per value, e.g. the 'px' or 'py'
+    indexes of the literal table), returning the numpy array of the values.
+    Every row is bisected as in decode_positions, all the rows at once: the assignment is read log2 of the row
+    length times, n values every time, instead of reading the whole table.
+    '''
+    n, size = table.shape
+    rows = np.arange(n)
+    low = np.zeros(n, dtype=np.int64)
+    high = np.full(n, size, dtype=np.int64)
+    for _ in range(size.bit_length()):
+        middle = (low + high) // 2
+        # the rows already decoded have low == high == size at most, their middle is clipped to a valid column
+        value = assignment[table[rows, np.minimum(middle, size - 1)]]
+        searching = low < high
+        high = np.where(searching & value, middle, high)
+        low = np.where(searching & ~value, middle + 1, low)
+    return low
+
+
+def get_circuits(instance, assignment):
+    '''
+    Returning the placed circuits as [width, height, x, y], with width and height swapped for the rotated circuits.
+    The assignment is a boolean array indexed by the numbers of the instance literal table.
+    '''
+    _, indexes = instance.get_literal_table()
+    widths, heights = np.array([instance.get_circuit(h) for h in range(instance.get_n_circuits())]).T
+
+    # decode the circuits position
+    x_decoded = decode_order_encoding(assignment, indexes['px'])
+    y_decoded = decode_order_encoding(assignment, indexes['py'])
+
+    # Setting circuits width and height, swapped for the rotated circuits
+    if instance.get_rotation():
+        rotated = assignment[indexes['rot']]
+        widths, heights = np.where(rotated, heights, widths), np.where(rotated, widths, heights)
+
+    return [[int(w), int(h), int(x), int(y)] for w, h, x, y in zip(widths, heights, x_decoded, y_decoded)]
 
 
-def decode_circuits(instance, m, height, output_txt_path, output_img_path):
+def decode_circuits(instance, assignment, height, output_txt_path, output_img_path):
     '''
     Decoding circuits positions, setting up width and height depending on rotation. 
     It plots the solutions in the correct folder, writing a txt file containing the textual solution.
+    The assignment is a boolean array indexed by the numbers of the instance literal table. It returns the placed circuits.
     '''
-    rotation = instance.get_rotation()
-    rot_flags = instance.get_rotation_flags()
-    x_positions = instance.get_x_positions()
-    y_positions = instance.get_y_positions()
-    
-    # decode the X circuits position
-    px_eval = [[m.evaluate(x_positions[c][j], model_completion = True) for j in range(len(x_positions[c]))] for c in range(len(x_positions))]
-    x_decoded = [decode_positions(p) for p in px_eval]
+    circuits = get_circuits(instance, assignment)
+    write_solution(instance, circuits, height, output_txt_path, output_img_path)
+    return circuits
 
-    # decode the Y circuits position
-    py_eval = [[m.evaluate(y_positions[c][j], model_completion = True) for j in range(len(y_positions[c]))] for c in range(len(y_positions))]
-    y_decoded = [decode_positions(p) for p in py_eval]
+
+def write_solution(instance, circuits, height, output_txt_path, output_img_path, renderer='matplotlib', timer=None):
+    '''
+    Plotting the placed circuits ([width, height, x, y]) in the correct folder and writing the textual solution.
+    The image is drawn by matplotlib or by one of the fast renderers (see renderer.RENDERERS), and skipped if renderer is None.
+    If a PhaseTimer is given, drawing and writing are timed as its 'render' and 'write' phases.
+    '''
+    if timer is None:
+        timer = PhaseTimer()
 
     # file name
     filename = instance.get_name().split('_')[0]
 
-    # Setting circuits width and height
-    if rotation:
+    with timer.phase('render'):
+        if renderer == 'matplotlib':
+            plot_solution(instance.get_plate_width(), height, circuits, output_img_path+f'out-{int(filename) + 1}.png')
+        elif renderer is not None:
+            render_solution(instance.get_plate_width(), height, circuits, output_img_path+f'out-{int(filename) + 1}.png', renderer)
+    with timer.phase('write'):
+        output_solution(circuits, instance.get_plate_width(), height, output_txt_path+f'out-{int(filename) + 1}.txt')
 
-        circuits = []
-        for h in range(instance.get_n_circuits()):
-            rotation_flag = m.evaluate(rot_flags[h], model_completion = True)
-            if rotation_flag:
-                rectangle_width = instance.get_circuit(h)[1]
-                rectangle_height = instance.get_circuit(h)[0]
-            else:
-                rectangle_width = instance.get_circuit(h)[0]
-                rectangle_height = instance.get_circuit(h)[1]
-        
-            circuits.append([rectangle_width, rectangle_height, x_decoded[h], y_decoded[h]])
-    else:
-        circuits = [[instance.get_circuit(h)[0], instance.get_circuit(h)[1], x_decoded[h], y_decoded[h]] for h in range(instance.get_n_circuits())]
 
-    plot_solution(instance.get_plate_width(), height, circuits, output_img_path+f'out-{int(filename) + 1}.png')
-    output_solution(circuits, instance.get_plate_width(), height, output_txt_path+f'out-{int(filename) + 1}.txt')
+def get_model_height(instance, assignment):
+    '''
+    Returning the height of the plate actually used by the circuits placed by an assignment
+    '''
+    _, indexes = instance.get_literal_table()
+    widths, heights = np.array([instance.get_circuit(h) for h in range(instance.get_n_circuits())]).T
+    if instance.get_rotation():
+        heights = np.where(assignment[indexes['rot']], widths, heights)
+
+    return int((decode_order_encoding(assignment, indexes['py']) + heights).max())
+
+
+def write_dimacs(instance, backend, dimacs_path, index):
+    '''
+    Writing the DIMACS encoding of an instance, with the activation literal of every probed height in the comments,
+    so that it can be solved again under the assumption of a height without encoding it. "-" writes to the standard output.
+    '''
+    comments = [f'instance {index + 1}: plate width {instance.get_plate_width()}, height in [{instance.get_min_height()}, {instance.get_max_height()}]']
+    comments += [f'height {h} {instance.get_height_flag(h)}' for h in range(instance.get_min_height(), instance.get_max_height() + 1) if instance.has_height_flag(h)]
+
+    if dimacs_path == '-':
+        backend.write_dimacs(sys.stdout.buffer, comments)
+        sys.stdout.buffer.flush()
+    else:
+        os.makedirs(dimacs_path, exist_ok=True)
+        with open(os.path.join(dimacs_path, f'ins-{index + 1}.cnf'), 'wb') as output:
+            backend.write_dimacs(output, comments)
 
 
 # Method used to plot the solution
 # EX: plot_solution(9, 12, [[3, 3, 4, 0],[2, 4, 7, 0],[2, 8, 7, 4],[3, 9, 4, 3],[4, 12, 0, 0 ]])
 # To save the image plotted, add a location to the file argument. Note: image will not be shown when saved.
 def plot_solution(width, height, circuits, file=None):
+    # matplotlib is only loaded when an image is drawn with it
+    if file is not None:
+        # the image is drawn without pyplot, whose global state is shared by all the threads (see run_instances)
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure()
+        FigureCanvasAgg(fig)
+    else:
+        import matplotlib.pyplot as plt
+        fig = plt.figure()
+
     SIZE = 10
-    fig, ax = plt.subplots()
+    ax = fig.subplots()
 
     # fig.set_size_inches(SIZE, SIZE * height / width)
     fig.set_size_inches(SIZE, SIZE * height / width)
@@ -146,8 +311,7 @@ def plot_solution(width, height, circuits, file=None):
     ax.grid(color='b', linewidth = 1)
 
     if file is not None:
-        plt.savefig(file)
-        plt.close()
+        fig.savefig(file)
     else:
         plt.show()
 
@@ -171,54 +335,3 @@ def output_solution(circuits, plate_width, plate_height, output_path):
         for item in solution:
             output.write(item)
             output.write('\n')
-
-def save_times_to_csv(rotation, simmetry_breaking, timings, n_instances):
-        '''
-        Saving time needed to solve the instances into 'timing.csv' file
-        '''
-    # Path to the existing CSV file
-        timings_csv = './SAT/timing.csv'
-
-        try:
-            # Read the CSV file into a DataFrame
-            df = pd.read_csv(timings_csv)
-        
-            # If the csv file is empty, add all the instances as the first column
-            if df.empty:
-                first_column = [f'Instance {i+1}' for i in range(n_instances)]
-                # Add the new column to the DataFrame
-                df['Instances'] = first_column
-                df.to_csv(timings_csv, index=False)  # Write the updated DataFrame back to the CSV file
-
-        except pd.errors.EmptyDataError:
-            
-            # If here, the dataframe is empty and causes some problems to be imported into pandas
-            df = pd.DataFrame()
-            first_column = [f'Instance {i+1}' for i in range(n_instances)]
-            # Add the new column to the DataFrame
-            df['Instances'] = first_column
-            df.to_csv(timings_csv, index=False)  # Write the updated DataFrame back to the CSV file
-        
-
-        # Setting new column name
-        if rotation:
-
-            column_name = 'Rotation '
-            if simmetry_breaking:
-                column_name += 'SB'
-            else:
-                column_name += 'No SB'
-        else:
-            column_name = 'No Rotation '
-            if simmetry_breaking:
-                column_name += 'SB'
-            else:
-                column_name += 'No SB'
-
-        # Add the new column to the DataFrame
-        df[column_name] = timings
-
-        # Write the updated DataFrame back to the CSV file
-        df.to_csv(timings_csv, index=False)
-
-        print("CSV file up-to-date")
\ No newline at end of file
@@ -0,0 +1,74 @@
+import json
+import os
+import time
+from datetime import datetime
+
+
+class Incumbent():
+    '''
+    Best placement found so far by an anytime run, with the improvement curve: the time since the start of the
+    run and the height of every improving placement. If a path is given, every improving placement is written
+    there at once (as JSON, replacing the previous one atomically), so a layout survives a timeout or a killed run.
+    '''
+
+    def __init__(self, instance, path=None):
+        self._instance = instance
+        self._path = path
+        self._start = time.perf_counter()
+        self._best = None
+        self._curve = []
+
+    def update(self, circuits, height):
+        '''
+        Recording a placement ([width, height, x, y] circuits) using a plate of the given height,
+        if it is lower than the best one. It returns True if the placement improved the best one.
+        '''
+        if self._best is not None and height >= self._best[1]:
+            return False
+
+        self._best = (circuits, height)
+        self._curve.append((time.perf_counter() - self._start, height))
+        if self._path is not None:
+            self._write()
+        return True
+
+    def get_best(self):
+        '''
+        Returning the best placement as (circuits, height), None if no placement was found
+        '''
+        return self._best
+
+    def get_curve(self):
+        '''
+        Returning the improvement curve as a list of (seconds, height)
+        '''
+        return list(self._curve)
+
+    def get_gap(self):
+        '''
+        Returning the gap of the best height to the lower bound of the instance, as (absolute, relative to the height)
+        '''
+        if self._best is None:
+            return None
+        gap = self._best[1] - self._instance.get_min_height()
+        return gap, gap / self._best[1]
+
+    def _write(self):
+        circuits, height = self._best
+        absolute_gap, relative_gap = self.get_gap()
+        record = {
+            'instance': self._instance.get_name(),
+            'plate_width': self._instance.get_plate_width(),
+            'height': int(height),
+            'min_height': self._instance.get_min_height(),
+            'gap': absolute_gap,
+            'relative_gap': relative_gap,
+            'seconds': self._curve[-1][0],
+            'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+            'circuits': [[int(value) for value in circuit] for circuit in circuits],
+            'curve': self._curve,
+        }
+        temporary_path = self._path + '.tmp'
+        with open(temporary_path, 'w') as output:
+            json.dump(record, output)
+        os.replace(temporary_path, self._path)
@@ -21,8 +21,12 @@ def height_constraints(instance, solver):
     solver.add(min_height <= height)
     solver.add(height <= max_height)
 
-    # Objective Function
-    solver.minimize(height)
+
+def set_objective(instance, solver):
+    '''
+    Minimizing the plate height, for the solvers optimizing it (z3 Optimize)
+    '''
+    solver.minimize(instance.get_height())
 
 
 def check_rot_flags(instance, solver):
@@ -50,6 +54,43 @@ def check_rot_flags(instance, solver):
         s.add(Implies(instance.get_circuit(cir)[1] > instance.get_height(), rot_flags[cir]))
 
 
+def get_relation_table(instance):
+    '''
+    Returning the relative positions allowed to every pair of circuits, as a (n, n, 2) numpy boolean table:
+        -) [i, j, 0] is True if circuit i can be on the left of circuit j (lr[i][j]);
+        -) [i, j, 1] is True if circuit i can be below circuit j (ud[i][j]).
+    Two circuits cannot be side by side if their smallest widths, among the orientations fitting the plate, exceed
+    the plate width together, and cannot be one above the other if their smallest heights exceed the maximum height.
+    The relations not allowed can never hold, so the difference encoding skips them. The generic encoding keeps
+    every pair in its 4-way disjunction: pruning its clauses slowed z3 Optimize down on the rotation instances.
+    The diagonal is False.
+    '''
+    n = instance.get_n_circuits()
+    plate_width = instance.get_plate_width()
+    max_height = instance.get_max_height()
+    widths, heights = np.array([instance.get_circuit(cir) for cir in range(n)]).reshape(n, 2).T
+
+    if instance.get_rotation():
+        # a circuit is kept in the orientations fitting the plate (see check_rot_flags), the largest value marks the others
+        unfit = max(plate_width, max_height) + 1
+        upright = (widths <= plate_width) & (heights <= max_height)
+        rotated = (heights <= plate_width) & (widths <= max_height)
+        widths, heights = (np.minimum(np.where(upright, widths, unfit), np.where(rotated, heights, unfit)),
+                           np.minimum(np.where(upright, heights, unfit), np.where(rotated, widths, unfit)))
+
+    table = np.stack([widths[:, None] + widths[None, :] <= plate_width,
+                      heights[:, None] + heights[None, :] <= max_height], axis=2)
+    table[np.arange(n), np.arange(n)] = False
+    return table
+
+
+def get_widest(instance):
+    '''
+    Returning the index of the biggest circuit by area, the one moved by the simmetry breaking
+    '''
+    return int(np.argmax([instance.get_circuit(r)[0] * instance.get_circuit(r)[1] for r in range(instance.get_n_circuits())]))
+
+
 # domain constraint
 def set_domain_constraints(instance, solver):
 
@@ -125,4 +166,144 @@ def set_non_overlap_constraints(instance, s):
 
                 # Large Rectangles (vertical)
                 s.add(Implies(heights[cir] + heights[j] > instance.get_height(), ud[cir][j] == False))
-                s.add(Implies(heights[j] + heights[cir] > instance.get_height(), ud[j][cir] == False))
\ No newline at end of file
+                s.add(Implies(heights[j] + heights[cir] > instance.get_height(), ud[j][cir] == False))
+
+
+def get_logic(instance):
+    '''
+    Returning the logic of the difference encoding of an instance: every constraint is a bound or a difference
+    x - y <= c (QF_IDL), except the vertical slide of the widest circuit, 2 * y + h <= height (QF_LIA)
+    '''
+    if instance.get_simmetry_breaking() and not instance.get_rotation():
+        return 'QF_LIA'
+    return 'QF_IDL'
+
+
+def get_sizes(instance, cir):
+    '''
+    Returning the possible sizes of a circuit as a list of (conditions, width, height), with constant width and height:
+    the circuit size without rotation, the two orientations selected by the rotation flag otherwise
+    '''
+    width, height = instance.get_circuit(cir)
+    if not instance.get_rotation():
+        return [([], width, height)]
+    rot_flag = instance.get_rotation_flags()[cir]
+    return [([Not(rot_flag)], width, height), ([rot_flag], height, width)]
+
+
+def when(conditions, constraint):
+    '''
+    Returning the constraint holding under all the conditions
+    '''
+    return Implies(And(conditions), constraint) if conditions else constraint
+
+
+# domain constraint of the difference encoding
+def set_difference_domain_constraints(instance, solver):
+    '''
+    Setting the same domain constraints of set_domain_constraints, with the circuit sizes folded in as constants
+    (one constraint per orientation) and the conditions on the plate height written as bounds
+    '''
+    s = solver
+    corners = instance.get_corners()
+    plate_width = instance.get_plate_width()
+    plate_height = instance.get_height()
+
+    lr = instance.lr
+    ud = instance.ud
+
+    for cir in range(instance.get_n_circuits()):
+        s.add(corners[cir][0] >= 0)
+        s.add(corners[cir][1] >= 0)
+        for conditions, width, height in get_sizes(instance, cir):
+            s.add(when(conditions, corners[cir][0] + width <= plate_width))
+            s.add(when(conditions, corners[cir][1] + height <= plate_height))
+
+    # simmetry breaking in case of no rotation
+    if not instance.get_rotation() and instance.get_simmetry_breaking():
+        # Biggest circuit by Area
+        widest_idx = get_widest(instance)
+        widest_width, widest_height = instance.get_circuit(widest_idx)
+        relations = get_relation_table(instance)
+
+        # the widest circuit is in the bottom-left quarter of its slide: y <= (height - h) / 2, the only non-difference constraint
+        s.add(corners[widest_idx][0] <= (plate_width - widest_width) // 2)
+        s.add(2 * corners[widest_idx][1] + widest_height <= plate_height)
+
+        for cir in range(instance.get_n_circuits()):
+            if cir == widest_idx:
+                continue
+            if relations[cir, widest_idx, 0] and instance.get_circuit(cir)[0] > (plate_width - widest_width) // 2:
+                s.add(Not(lr[cir][widest_idx]))
+
+            # height > (plate height - widest height) / 2 holds exactly when plate height < 2 * height + widest height
+            if relations[cir, widest_idx, 1]:
+                s.add(Implies(plate_height < 2 * instance.get_circuit(cir)[1] + widest_height, Not(ud[cir][widest_idx])))
+
+
+# non-overlapping constraint of the difference encoding
+def set_difference_non_overlap_constraints(instance, s):
+    '''
+    Setting the same non-overlapping constraints of set_non_overlap_constraints, with the circuit sizes folded
+    in as constants: every relative position is a difference x_i + c <= x_j, one per orientation of the circuit.
+    The large rectangles simmetry breaking is decided for every pair of orientations, on the plate height bound.
+    The relative positions not allowed by the relation table (see get_relation_table) are skipped.
+    '''
+    corners = instance.get_corners()
+    plate_width = instance.get_plate_width()
+    plate_height = instance.get_height()
+    simmetry_breaking = instance.get_simmetry_breaking()
+
+    lr = instance.lr
+    ud = instance.ud
+    sizes = [get_sizes(instance, cir) for cir in range(instance.get_n_circuits())]
+    relations = get_relation_table(instance)
+    min_height = instance.get_min_height()
+
+    # Pairwise constraints
+    for cir in range(instance.get_n_circuits()):
+
+        for j in range(cir+1, instance.get_n_circuits()):
+
+            # Non overlapping constraints
+            disjuncts = []
+            for first, second in [(cir, j), (j, cir)]:
+                for relation, flags, axis in [(0, lr, 0), (1, ud, 1)]:
+                    if relations[first, second, relation]:
+                        for conditions, width, height in sizes[first]:
+                            size = width if axis == 0 else height
+                            s.add(when(conditions, (corners[first][axis] + size <= corners[second][axis]) == flags[first][second]))
+                        disjuncts.append(flags[first][second])
+
+            s.add(Or(disjuncts) if disjuncts else BoolVal(False, instance.get_context()))
+
+            if simmetry_breaking:
+                for conditions_cir, width_cir, height_cir in sizes[cir]:
+                    for conditions_j, width_j, height_j in sizes[j]:
+                        conditions = conditions_cir + conditions_j
+
+                        # Large Rectangles (horizontal)
+                        if relations[cir, j, 0] and width_cir + width_j > plate_width:
+                            s.add(when(conditions, And(Not(lr[cir][j]), Not(lr[j][cir]))))
+
+                        # Large Rectangles (vertical), never holding if the heights fit the minimum height together
+                        if relations[cir, j, 1] and height_cir + height_j > min_height:
+                            s.add(when(conditions + [plate_height < height_cir + height_j], And(Not(ud[cir][j]), Not(ud[j][cir]))))
+
+
+def set_initial_values(instance, solver):
+    '''
+    Starting the search from the placement of the skyline heuristic (Instance.get_hint).
+    The values only guide the solver, they are not constraints. Initial values are only accepted by
+    z3 Optimize and the SMT core of z3 (SimpleSolver, SolverFor most logics, see main.make_solver)
+    '''
+    corners = instance.get_corners()
+    rot_flags = instance.get_rotation_flags()
+
+    for cir, (width, _, x, y) in enumerate(instance.get_hint()):
+        solver.set_initial_value(corners[cir][0], x)
+        solver.set_initial_value(corners[cir][1], y)
+        if instance.get_rotation():
+            solver.set_initial_value(rot_flags[cir], width != instance.get_circuit(cir)[0])
+
+    solver.set_initial_value(instance.get_height(), instance.get_max_height())
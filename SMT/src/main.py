@@ -1,102 +1,355 @@
 import argparse
-from tqdm import tqdm
+from functools import partial
+import os
 import time
 from instance import Instance
 from z3 import *
-from constraints import set_domain_constraints, set_non_overlap_constraints, check_rot_flags, rotation_switch, height_constraints
+from constraints import set_domain_constraints, set_non_overlap_constraints, check_rot_flags, rotation_switch, height_constraints, set_objective, set_initial_values
+from constraints import set_difference_domain_constraints, set_difference_non_overlap_constraints, get_logic
+from search import search_height
+from formula_cache import FormulaCache, DEFAULT_CACHE_SIZE
+from verifier import check_placement
+from renderer import RENDERERS
+from results import ResultsStore
+from phases import PhaseTimer
+from anytime import Incumbent
 from utils import *
 
 
-def solve_instance(instance, solver):
+# results store and timing.csv exported from it
+RESULTS_PATH = './SMT/results.db'
+TIMING_PATH = './SMT/timing.csv'
 
-    if rotation:
+# folder of the best placements written by the anytime runs
+ANYTIME_PATH = './SMT/anytime/'
+
+# modules building the encoding, part of the formula cache keys
+ENCODING_SOURCES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), module) for module in ['constraints.py', 'instance.py']]
+
+# Optimization modes of the plate height: z3 Optimize minimizing it, or a plain incremental Solver probing
+# height bounds upward from the lower bound, downward from the upper bound or by bisection (see search.search_height)
+OPTIMIZATION_MODES = {'optimize': None, 'linear': 'linear-up', 'descending': 'linear-down', 'bisect': 'bisect'}
+
+# Encodings of the constraints: the generic one, with the circuit sizes as variables when rotating, and the difference one,
+# with the sizes folded in as constants, so that every constraint is a bound or a difference (see constraints.get_logic)
+ENCODINGS = {
+    'generic': (set_domain_constraints, set_non_overlap_constraints),
+    'difference': (set_difference_domain_constraints, set_difference_non_overlap_constraints),
+}
+
+# Logics whose z3 solver rejects initial values, the skyline hint is not given to them
+UNHINTED_LOGICS = ['QF_IDL']
+
+# Arithmetic solvers of z3 (smt.arith.solver) for the difference encoding, the default is the choice of z3 for the logic
+ARITH_SOLVERS = {'bellman-ford': 1, 'floyd-warshall': 3, 'utvpi': 4, 'simplex': 6}
+
+
+def encode_instance(instance, solver, formula_cache=None, encoding='generic'):
+    '''
+    Adding the constraints of an instance to the solver, with the plate height as a variable, so that the same
+    encoding is optimized by z3 Optimize or bounded by the height probes. encoding is one of ENCODINGS.
+    If a formula cache is given, the SMT-LIB2 script of the formula is read from it when possible.
+    '''
+    set_domain, set_non_overlap = ENCODINGS[encoding]
+
+    if formula_cache is not None:
+        key = formula_cache.get_key(instance, 'SMT' if encoding == 'generic' else f'SMT-{encoding}', ENCODING_SOURCES)
+        data = formula_cache.load(key)
+        if data is not None:
+            solver.from_string(data.decode())
+            print("formula cache hit")
+            return
+
+    height_constraints(instance, solver)
+
+    if instance.get_rotation():
         check_rot_flags(instance, solver)
         rotation_switch(instance, solver)
 
-    set_domain_constraints(instance, solver)
-    set_non_overlap_constraints(instance, solver)
+    set_domain(instance, solver)
+    set_non_overlap(instance, solver)
+
+    if formula_cache is not None:
+        # the solver options (e.g. the timeout) are not part of the formula
+        script = [line for line in solver.sexpr().splitlines() if not line.startswith(('(set-option', ';'))]
+        formula_cache.store(key, '\n'.join(script).encode())
+
+
+def make_solver(opt='optimize', time_limit=300, logic=None, arith_solver=None, ctx=None):
+    '''
+    Returning the solver of an optimization mode: z3 Optimize, with the time limit, or the SMT core of z3 (SimpleSolver),
+    whose timeout is set before every probe. If a logic is given, the solver is created for it (SolverFor), z3 Optimize
+    cannot declare one. arith_solver is one of ARITH_SOLVERS, None for the default of z3.
+    The solver lives in the z3 context ctx, the one of the instance variables (None for the global context).
+    '''
+    if OPTIMIZATION_MODES[opt] is None:
+        solver = Optimize(ctx=ctx)
+        solver.set(timeout = int(time_limit * 1000))
+    else:
+        solver = SolverFor(logic, ctx=ctx) if logic is not None else SimpleSolver(ctx=ctx)
+
+    if arith_solver is not None:
+        solver.set('smt.arith.solver', ARITH_SOLVERS[arith_solver])
+    return solver
+
 
+def accepts_hint(opt='optimize', logic=None):
+    '''
+    Returning True if the solver of make_solver accepts the initial values of the skyline hint (see set_initial_values)
+    '''
+    return OPTIMIZATION_MODES[opt] is None or logic not in UNHINTED_LOGICS
+
+
+def probe_height(instance, solver, plate_height, deadline):
+    '''
+    Checking if the circuits fit a plate of the given height. The height bound lives in its own scope,
+    which is removed after the check, so all the probes share the encoding.
+    '''
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        return unknown, None
+    solver.set(timeout = int(remaining * 1000))
+
+    solver.push()
+    solver.add(instance.get_height() <= plate_height)
     result = solver.check()
 
+    # Check if the solution exists
+    model = solver.model() if result == sat else None
+
+    solver.pop()
+    return result, model
+
+
+def get_model_height(instance, m):
+    '''
+    Returning the height of the plate actually used by the circuits placed by a model
+    '''
+    corners = instance.get_corners()
+    heights = instance.get_circuit_heights()
+    return max(m.evaluate(corners[h][1] + heights[h], model_completion = True).as_long() for h in range(instance.get_n_circuits()))
+
+
+def solve_instance(instance, solver, formula_cache=None, timer=None, opt='optimize', time_limit=300, encoding='generic', incumbent=None, hint=True):
+    '''
+    Encoding the instance with "encoding" (see ENCODINGS) and minimizing the plate height with the optimization mode
+    "opt" (see OPTIMIZATION_MODES).
+    If a PhaseTimer is given, the encoding is timed as its 'encode' phase and the optimization, or every height
+    probe, as a lap of its 'solve' phase.
+    If an anytime.Incumbent is given, it is updated with every model found along the way: the intermediate
+    models of z3 Optimize (on_model callback) or the feasible height probes.
+    If hint is True, the search starts from the skyline placement, the solver must accept it (see accepts_hint).
+
+    It returns the tuple (output, probes), as search.search_height: output is (model, height, optimal) for the lowest
+    height found, optimal being False if the time expired during the height probes, or a string describing the failure,
+    probes is the list of (height, result, seconds) of the height probes (empty for z3 Optimize).
+    '''
+    if timer is None:
+        timer = PhaseTimer()
+
+    deadline = time.time() + time_limit
+    strategy = OPTIMIZATION_MODES[opt]
+
+    with timer.phase('encode'):
+        encode_instance(instance, solver, formula_cache, encoding)
+        if strategy is None:
+            set_objective(instance, solver)
+        if hint:
+            set_initial_values(instance, solver)
+
+    def on_model(model):
+        incumbent.update(get_circuits(instance, model), get_model_height(instance, model))
+
+    def anytime_probe(plate_height):
+        result, model = probe_height(instance, solver, plate_height, deadline)
+        if result == sat and incumbent is not None:
+            on_model(model)
+        return result, model
+
+    if strategy is not None:
+        return search_height(anytime_probe,
+                             instance.get_min_height(), instance.get_max_height(), strategy,
+                             model_height=lambda model: get_model_height(instance, model), timer=timer)
+
+    if incumbent is not None:
+        solver.set_on_model(on_model)
+
+    with timer.phase('solve'):
+        result = solver.check()
+
     # check if the solving time is higher than 300 seconds
     if result == unknown:
-        return "Time Expired"
+        return "Time Expired", []
     
     # Check if the solution exists
     elif result == sat:
-        model = s.model()
-        return model
+        model = solver.model()
+        return (model, model.evaluate(instance.get_height()).as_long(), True), []
     else:
-        return "Unsolvable"
+        return "Unsolvable", []
 
 
-if __name__ == '__main__':
+def get_placement(instance, time_limit=300, opt='optimize', encoding='generic', arith_solver=None):
+    '''
+    Solving an instance and returning (circuits, height, optimal), with the circuits placed as [width, height, x, y].
+    The optimizer only answers sat once the minimum height is proven, and the height searches are exact, so the
+    solution is optimal unless the time expired during the height probes, in which case the lowest placement found
+    is returned as not proven optimal. It returns None if no solution is found.
+    '''
+    logic = get_logic(instance) if encoding == 'difference' else None
+    solver = make_solver(opt, time_limit, logic, arith_solver, instance.get_context())
+    output, _ = solve_instance(instance, solver, opt=opt, time_limit=time_limit, encoding=encoding, hint=accepts_hint(opt, logic))
+    if type(output) == str:
+        return None
+    return get_circuits(instance, output[0]), output[1], output[2]
 
-    # Create an argument parser
-    parser = argparse.ArgumentParser(description='SAT argument parsing')
 
-    # Add arguments
-    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instance folder name')
-    parser.add_argument('--rotation', action='store_true', help='Set circuit rotation to True')
-    parser.add_argument('--simmetry_breaking', action='store_true', help='Set solving simmetry breaking to True')
-    args = parser.parse_args()
+def run_instance(i, raw_instance, rotation, simmetry_breaking, output_paths, formula_cache=None, renderer='matplotlib', results=None, opt='optimize',
+                 encoding='generic', arith_solver=None, anytime=None):
+    '''
+    Solving the i-th instance and writing its solution, returning the time needed to solve it ('-' if it failed).
+    output_paths is the tuple (output_txt_path, output_img_path, output_failure_path).
+    renderer is the renderer of the solution image (see renderer.RENDERERS), None to write only the textual solution.
+    opt is the optimization mode of the plate height (see OPTIMIZATION_MODES), encoding the encoding of the constraints
+    (see ENCODINGS), solved by a solver for its logic, and arith_solver the arithmetic solver of z3 (see ARITH_SOLVERS).
+    If anytime is a folder, the run is anytime: every improving placement is written there as soon as it is found,
+    and if the time expires the best placement is written as a solution which is not proven optimal.
+    If a results store is given, the run is appended to it, with the times of its phases (see phases.PhaseTimer).
+    The time needed to solve the instance is the time of the encode, solve and decode phases.
+    '''
+    output_txt_path, output_img_path, output_failure_path = output_paths
+    timer = PhaseTimer()
 
-    folder_name = args.folder_name
-    rotation = args.rotation
-    simmetry_breaking = args.simmetry_breaking
-    output_txt_path, output_img_path, output_failure_path = set_environment(rotation, simmetry_breaking, 'SMT')
+    name_instance = f'{i}_instance'
+    # every instance has its own z3 context, so that instances can be solved on threads (see utils.run_instances)
+    with timer.phase('parse'):
+        instance = Instance(raw_instance, name_instance, rotation, simmetry_breaking, Context())
+
+    # Solver initialization
+    # 5 minutes (300 sec) time limit for each instance to be solved, shared by all the height probes
+    with timer.phase('encode'):
+        logic = get_logic(instance) if encoding == 'difference' else None
+        s = make_solver(opt, 300, logic, arith_solver, instance.get_context())
     
-    instances = import_instances(folder_name)
+    incumbent = None
+    if anytime is not None:
+        # the placement of the skyline heuristic is the first one, so there is always a layout to ship
+        incumbent = Incumbent(instance, os.path.join(anytime, f'out-{i + 1}.json'))
+        hint = instance.get_hint()
+        incumbent.update(hint, max(y + height for _, height, _, y in hint))
+    hint = accepts_hint(opt, logic)
+    output, probes = solve_instance(instance, s, formula_cache, timer, opt, time_limit=300, encoding=encoding, incumbent=incumbent, hint=hint)
 
-    # list of all timing measures for each instance
-    timings = []
+    for probe in probes:
+        print(f"height {probe[0]}: {probe[1]} ({probe[2]:.3f} s)")
+    statistics = dict(get_statistics(s), opt=opt, encoding=encoding, logic=logic, arith_solver=arith_solver, hint=hint, probes=[[probe[0], str(probe[1]), probe[2]] for probe in probes])
 
-    for i in tqdm(range(len(instances))):
-    
-        name_instance = f'{i}_instance'
-        instance = Instance(instances[i], name_instance, rotation, simmetry_breaking)
-        
-        plate_width = instance.get_plate_width()
+    optimal = type(output) != str and output[2]
+    if not optimal and incumbent is not None and incumbent.get_best() is not None:
+        # the time expired: the best placement found is shipped, with its gap to the lower bound
+        circuits, height = incumbent.get_best()
+        gap, relative_gap = incumbent.get_gap()
+        statistics.update(improvements=incumbent.get_curve(), gap=gap, relative_gap=relative_gap)
+        print(f"\nTime expired for instance {i + 1}, best height found is {height} (gap {gap}, {relative_gap:.1%}, to the lower bound)")
+        output = (None, height, False)
+
+    elif type(output) == str:
 
-        # starting timing operation
-        start_time = time.time()
+        # write the instance in failures file
+        with open(output_failure_path, 'a') as output:
+            output.write(f'Instance {i + 1} failed')
+            output.write('\n')
+        print("\nFailed to solve instance %i" % (i + 1))
+        if results is not None:
+            results.append('SMT', i, instance, times=timer.get_times(), statistics=statistics)
+        return '-'
 
-        # Solver initialization
-        s = Optimize()
+    m, height, _ = output
 
-        height_constraints(instance, s)
+    # the placement of a model is decoded, the one of the incumbent is already decoded
+    if m is not None:
+        with timer.phase('decode'):
+            circuits = get_circuits(instance, m)
+        if incumbent is not None:
+            incumbent.update(circuits, height)
+            statistics.update(improvements=incumbent.get_curve())
 
-        # 5 minutes (300 sec) time limit for each instance to be solved
-        tmout = 300 * 1000
-        s.set(timeout = tmout)
-        
-        output = solve_instance(instance, s)
+    # the solution is timed without checking, writing it and drawing its image
+    solve_time = timer.get_solve_time()
 
-        end_time = time.time()
+    # the placement is checked before it is written
+    with timer.phase('verify'):
+        problems = check_placement(instance, circuits, height)
+    if problems:
 
-        if type(output) == str:
+        # write the instance in failures file
+        with open(output_failure_path, 'a') as output:
+            output.write(f'Instance {i + 1} failed verification: {"; ".join(problems)}')
+            output.write('\n')
+        print(f"\nWrong solution for instance {i + 1}: {'; '.join(problems)}")
+        if results is not None:
+            results.append('SMT', i, instance, times=timer.get_times(), statistics=dict(statistics, problems=problems))
+        return '-'
 
-            timings.append('-')
+    if m is not None:
+        decode_circuits(instance, m, height, output_txt_path, output_img_path, renderer, timer)
+    else:
+        write_solution(instance, circuits, height, output_txt_path, output_img_path, renderer, timer)
+
+    print(f"Solution found for instance {i + 1}")
+    print(f"lower bound of the height is: {instance.get_min_height()} ({instance.get_lower_bound_name()} bound{', tight' if height == instance.get_min_height() else ''})")
+    print(f"minimum height found is: {height}{'' if optimal else ' (not proven optimal)'}")
+    print(f"The time requested for this instance was: {solve_time}")
+    print(f"phases: {timer.summary()}")
+    print("\n\n\n\n\n")
+
+    if results is not None:
+        results.append('SMT', i, instance, height, optimal, solve_time, timer.get_times(), statistics)
+
+    return solve_time
 
-            # write the instance in failures file
-            with open(output_failure_path, 'a') as output:
-                output.write(f'Instance {i + 1} failed')
-                output.write('\n')
-            print("\nFailed to solve instance %i" % (i + 1))
 
-        else:
+if __name__ == '__main__':
 
-            m = output
+    # Create an argument parser
+    parser = argparse.ArgumentParser(description='SAT argument parsing')
 
-            height = decode_circuits(instance, m, output_txt_path, output_img_path)
+    # Add arguments
+    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instances: a folder, a glob pattern, a bundle file or - for the standard input')
+    parser.add_argument('--rotation', action='store_true', help='Set circuit rotation to True')
+    parser.add_argument('--simmetry_breaking', action='store_true', help='Set solving simmetry breaking to True')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes solving the instances in parallel')
+    parser.add_argument('--threads', action='store_true', help='Solve the jobs on threads of this process instead of processes')
+    parser.add_argument('--renderer', type=str, default='matplotlib', choices=RENDERERS, help='Renderer of the solution images: matplotlib, fast (numpy PNG) or svg')
+    parser.add_argument('--no_render', '--no-render', action='store_true', help='Do not draw the solution images, they can be drawn later by render.py')
+    parser.add_argument('--results', type=str, default=RESULTS_PATH, help='SQLite database where every run is appended')
+    parser.add_argument('--export_timing', '--export-timing', action='store_true', help='Export timing.csv from the results store after the run')
+    parser.add_argument('--formula_cache', type=str, default=None, help='Folder of the cache of encoded formulas, disabled if not given')
+    parser.add_argument('--formula_cache_size', type=float, default=DEFAULT_CACHE_SIZE, help='Size cap of the formula cache, in MB')
+    parser.add_argument('--opt', type=str, default='optimize', choices=list(OPTIMIZATION_MODES), help='Optimization of the plate height: z3 Optimize, or incremental height probes upward (linear), downward (descending) or by bisection (bisect)')
+    parser.add_argument('--anytime', type=str, nargs='?', const=ANYTIME_PATH, default=None, help=f'Write every improving placement to a folder (default {ANYTIME_PATH}) and ship the best one when the time expires')
+    parser.add_argument('--encoding', type=str, default='generic', choices=list(ENCODINGS), help='Encoding of the constraints: generic, or difference (QF_IDL/QF_LIA, solved by a solver for its logic)')
+    parser.add_argument('--arith_solver', '--arith-solver', type=str, default=None, choices=list(ARITH_SOLVERS), help='Arithmetic solver of z3 (default the choice of z3)')
+    args = parser.parse_args()
 
-            timings.append(end_time - start_time)
+    folder_name = args.folder_name
+    rotation = args.rotation
+    simmetry_breaking = args.simmetry_breaking
+    formula_cache = FormulaCache(args.formula_cache, args.formula_cache_size) if args.formula_cache is not None else None
+    results = ResultsStore(args.results)
+    if args.anytime is not None:
+        os.makedirs(args.anytime, exist_ok=True)
+    output_txt_path, output_img_path, output_failure_path = set_environment(rotation, simmetry_breaking, 'SMT')
+    
+    instances = iter_instances(folder_name)
 
-            print(f"Solution found for instance {i + 1}")
-            print(f"optimum height is: {instance.get_min_height()}")
-            print(f"minimum height found is: {height}")
-            print(f"The time requested for this instance was: {end_time - start_time}")
-            print("\n\n\n\n\n")
+    # the instances are solved in parallel by "jobs" processes (or threads), the timings are collected in instance order
+    solve = partial(run_instance, rotation=rotation, simmetry_breaking=simmetry_breaking,
+                    output_paths=(output_txt_path, output_img_path, output_failure_path), formula_cache=formula_cache,
+                    renderer=None if args.no_render else args.renderer, results=results, opt=args.opt,
+                    encoding=args.encoding, arith_solver=args.arith_solver, anytime=args.anytime)
+    timings = run_instances(solve, instances, args.jobs, args.threads)
 
-    # Saving time needed to solve the instances into 'timing.csv' file
-    save_times_to_csv(rotation, simmetry_breaking, timings, len(instances))
+    # Exporting the latest time of every instance and configuration into 'timing.csv' file
+    if args.export_timing:
+        results.export_timing_csv(TIMING_PATH, 'SMT', len(timings))
@@ -0,0 +1,113 @@
+import argparse
+import csv
+import json
+import sqlite3
+import time
+from contextlib import closing
+
+# Columns of timing.csv, one per configuration (rotation, simmetry_breaking)
+CONFIGURATIONS = {
+    (False, False): 'No Rotation No SB',
+    (False, True): 'No Rotation SB',
+    (True, False): 'Rotation No SB',
+    (True, True): 'Rotation SB',
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp REAL NOT NULL,
+    approach TEXT NOT NULL,
+    instance INTEGER NOT NULL,
+    rotation INTEGER NOT NULL,
+    simmetry_breaking INTEGER NOT NULL,
+    height INTEGER,
+    optimal INTEGER,
+    solve_time REAL,
+    times TEXT NOT NULL,
+    statistics TEXT NOT NULL
+)
+'''
+
+
+class ResultsStore():
+    '''
+    Append-only log of the runs, one row per solved (or failed) instance, in an SQLite database in WAL mode.
+    Every row holds the approach, the instance number, the flags, the height found, its optimality, the solve time,
+    the time of the single phases and the solver statistics. Rows are only inserted, so concurrent runs
+    (and the processes of a single run) can write to the same database, and timing.csv is exported from it.
+    '''
+
+    def __init__(self, path):
+        self._path = path
+        with closing(self._connect()) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(SCHEMA)
+            connection.commit()
+
+    def _connect(self):
+        # a connection is opened for every operation, so that the store can be shared with worker processes
+        return sqlite3.connect(self._path, timeout=60)
+
+    def append(self, approach, index, instance, height=None, optimal=None, solve_time=None, times=None, statistics=None):
+        '''
+        Recording the run of the index-th instance. height and solve_time are None if the instance was not solved.
+        times is a dictionary of phase times (e.g. encode, solve, decode) and statistics a dictionary of solver
+        statistics, both stored as JSON.
+        '''
+        row = (time.time(), approach, index, int(instance.get_rotation()), int(instance.get_simmetry_breaking()),
+               None if height is None else int(height), None if optimal is None else int(optimal), solve_time,
+               json.dumps(times or {}), json.dumps(statistics or {}, default=str))
+        with closing(self._connect()) as connection, connection:
+            connection.execute('INSERT INTO results (timestamp, approach, instance, rotation, simmetry_breaking, height, '
+                               'optimal, solve_time, times, statistics) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+
+    def get_runs(self, approach=None):
+        '''
+        Returning the recorded runs (of an approach, or all of them) as dictionaries, in insertion order
+        '''
+        query = 'SELECT * FROM results' + (' WHERE approach = ?' if approach is not None else '') + ' ORDER BY id'
+        with closing(self._connect()) as connection:
+            connection.row_factory = sqlite3.Row
+            rows = connection.execute(query, () if approach is None else (approach,)).fetchall()
+
+        runs = [dict(row) for row in rows]
+        for run in runs:
+            run['times'] = json.loads(run['times'])
+            run['statistics'] = json.loads(run['statistics'])
+        return runs
+
+    def export_timing_csv(self, path, approach=None, n_instances=None):
+        '''
+        Writing timing.csv: one row per instance and one column per configuration, holding the solve time
+        of the latest run ('-' if it failed). n_instances defaults to the highest instance number recorded.
+        '''
+        latest = {}
+        for run in self.get_runs(approach):
+            latest[(run['instance'], bool(run['rotation']), bool(run['simmetry_breaking']))] = run['solve_time']
+
+        if n_instances is None:
+            n_instances = max((instance + 1 for instance, _, _ in latest), default=0)
+        columns = [flags for flags in CONFIGURATIONS if any(key[1:] == flags for key in latest)]
+
+        with open(path, 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(['Instances'] + [CONFIGURATIONS[flags] for flags in columns])
+            for i in range(n_instances):
+                row = [latest.get((i,) + flags, '') for flags in columns]
+                writer.writerow([f'Instance {i + 1}'] + ['-' if value is None else value for value in row])
+
+
+if __name__ == '__main__':
+
+    # Create an argument parser
+    parser = argparse.ArgumentParser(description='Results store argument parsing')
+
+    # Add arguments
+    parser.add_argument('database', type=str, help='SQLite database of the results')
+    parser.add_argument('output', type=str, help='Path of the exported timing.csv file')
+    parser.add_argument('--approach', type=str, default=None, help='Export only the runs of an approach')
+    parser.add_argument('--n_instances', type=int, default=None, help='Number of instance rows (default the highest instance recorded)')
+    args = parser.parse_args()
+
+    ResultsStore(args.database).export_timing_csv(args.output, args.approach, args.n_instances)
@@ -114,4 +114,20 @@ def set_non_overlap_constraints(instance, s, plate_height):
                 s.add(Implies(widths[j] + widths[cir] > plate_width, lr[j][cir] == False))
                 # LR (vertical)
                 s.add(Implies(heights[cir] + heights[j] > plate_height, ud[cir][j] == False))
-                s.add(Implies(heights[j] + heights[cir] > plate_height, ud[j][cir] == False))
\ No newline at end of file
+                s.add(Implies(heights[j] + heights[cir] > plate_height, ud[j][cir] == False))
+
+
+def set_initial_values(instance, solver):
+    '''
+    Starting the search from the placement of the skyline heuristic (Instance.get_hint).
+    The values only guide the solver, they are not constraints. Initial values are only accepted by
+    the SMT core of z3 (SimpleSolver), the default combined solver rejects them
+    '''
+    corners = instance.get_corners()
+    rot_flags = instance.get_rotation_flags()
+
+    for cir, (width, _, x, y) in enumerate(instance.get_hint()):
+        solver.set_initial_value(corners[cir][0], x)
+        solver.set_initial_value(corners[cir][1], y)
+        if instance.get_rotation():
+            solver.set_initial_value(rot_flags[cir], width != instance.get_circuit(cir)[0])
@@ -0,0 +1,60 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def skyline_pack(plate_width, sizes, order, rotation, best_fit):
+    '''
+    Placing the circuits one at a time, in the given order, on the skyline of the plate.
+    Every circuit goes to the lowest position where it fits (leftmost in case of ties);
+    with best_fit the lowest top of the circuit is preferred instead.
+    It returns the positions and sizes of the circuits, indexed like "sizes", and the plate height.
+    '''
+    skyline = np.zeros(plate_width, dtype=np.int64)
+    placement = np.zeros((len(sizes), 4), dtype=np.int64)
+
+    for c in order:
+        width, height = sizes[c]
+        orientations = [(width, height)]
+        if rotation and width != height:
+            orientations.append((height, width))
+
+        best = None
+        for width, height in orientations:
+            if width > plate_width:
+                continue
+            # lowest y at which the circuit can sit for every x
+            bases = sliding_window_view(skyline, width).max(axis=1)
+            scores = bases + height if best_fit else bases
+            x = int(np.argmin(scores))
+            candidate = (int(scores[x]), int(bases[x]), x, width, height)
+            if best is None or candidate < best:
+                best = candidate
+
+        _, y, x, width, height = best
+        skyline[x:x + width] = y + height
+        placement[c] = (width, height, x, y)
+
+    return placement, int(skyline.max())
+
+
+def skyline_heuristic(instance):
+    '''
+    Skyline / bottom-left heuristic packing of an instance, with rotation if the instance allows it.
+    A few circuit orderings and placement rules are tried and the lowest placement is kept.
+    It returns (circuits, height), the circuits placed as [width, height, x, y] in the instance order.
+    '''
+    plate_width = instance.get_plate_width()
+    sizes = np.array([instance.get_circuit(c) for c in range(instance.get_n_circuits())], dtype=np.int64).reshape(-1, 2)
+    widths, heights = sizes[:, 0], sizes[:, 1]
+
+    # decreasing height, width, area and longest side (stable, so the ties keep the instance order)
+    orderings = [np.argsort(-key, kind='stable') for key in [heights, widths, widths * heights, np.maximum(widths, heights)]]
+
+    best = None
+    for order in orderings:
+        for best_fit in [False, True]:
+            placement, height = skyline_pack(plate_width, sizes, order, instance.get_rotation(), best_fit)
+            if best is None or height < best[1]:
+                best = (placement, height)
+
+    return best[0].tolist(), best[1]
@@ -1,6 +1,8 @@
 import math
 from pathlib import Path
 from typing import List, Tuple
+from heuristic import skyline_heuristic
+from bounds import lower_bound
 from z3 import *
 
 class Instance():
@@ -13,18 +15,20 @@ class Instance():
     _name : str
     _rotation: bool
 
-    def __init__(self, raw_instance, name_instance, rotation=False, simmetry_breaking=True):
+    def __init__(self, raw_instance, name_instance, rotation=False, simmetry_breaking=True, ctx=None):
         
-        # getting the width of the silicon plate
-        self._plate_width = int(raw_instance[0])
+        # z3 context of the variables, None for the global one. Instances solved on different threads need their own context
+        self._ctx = ctx
+
+        # getting the width of the silicon plate and the circuits from the instance record (see utils.iter_instances)
+        plate_width, circuits = raw_instance
+        self._plate_width = int(plate_width)
 
         # getting the number of circuits to place inside the plate
-        self._n_circuits = int(raw_instance[1])
+        self._n_circuits = len(circuits)
 
         # Getting circuits width and height
-        values = raw_instance[2:]
-
-        circuits = [(int(width), int(height)) for value in values for width, height in [value.split(' ')]]
+        circuits = [(int(width), int(height)) for width, height in circuits]
         self._circuits = sorted(circuits, reverse=True)
 
         # Getting instance name
@@ -44,6 +48,13 @@ class Instance():
 
         self._simmetry_breaking = simmetry_breaking
 
+        # Best lower bound of the plate height (area, tallest circuit, wide circuits, dual feasible functions, bar relaxation)
+        self._min_height, self._lower_bound_name = lower_bound(self)
+
+        # Upper bound of the plate height given by the skyline heuristic. Its placement is used as a solution hint
+        self._hint_circuits, hint_height = skyline_heuristic(self)
+        self._max_height = min(self._max_height, hint_height)
+
 
         # Declaration of the integer bottom-left corner of each circuit
         # Dictionary of tuples:
@@ -51,27 +62,33 @@ class Instance():
         #   -) the value is a tuple:
         #     -) first element --> integer variable, x coordinate
         #     -) second element --> integer variable, y coordinate
-        self._corners = {circuit_index: (Int(f"circuit_{circuit_index}_X"), Int(f"circuit_{circuit_index}_Y")) for circuit_index in range(self.get_n_circuits())}
+        self._corners = {circuit_index: (Int(f"circuit_{circuit_index}_X", self._ctx), Int(f"circuit_{circuit_index}_Y", self._ctx)) for circuit_index in range(self.get_n_circuits())}
 
         # Circuit width and height
         if rotation:
             # If rotation is enabled, widths and height must be declared as encoded variables, because they can change depending on the constraints
-            self._widths = [Int(str(f) + "_w") for f in range(self.get_n_circuits())]
-            self._heights = [Int(str(f) + "_h") for f in range(self.get_n_circuits())]
+            self._widths = [Int(str(f) + "_w", self._ctx) for f in range(self.get_n_circuits())]
+            self._heights = [Int(str(f) + "_h", self._ctx) for f in range(self.get_n_circuits())]
         else:
             # If rotation is disabled, widths and heights are defined by the input file, so it is not needed to rotate them
             self._widths = [self._circuits[index][0] for index in range(len(self._circuits))]
             self._heights = [self._circuits[index][1] for index in range(len(self._circuits))]
 
         # List of boolean flags, in order to understand if a specific circuit at a certain position is rotated or not.
-        self._rot_flags = [Bool(str(circuit_index)+"_rotation") for circuit_index in range(self.get_n_circuits())]
+        self._rot_flags = [Bool(str(circuit_index)+"_rotation", self._ctx) for circuit_index in range(self.get_n_circuits())]
 
         # list of booleans. If True, the circuit at index 1 is placed at the left of the circuit at index 2. False otherwise.
-        self.lr = [[Bool(f"LeftRight_{circuit_index_1+1}_{circuit_index_2+1}") if circuit_index_1 != circuit_index_2 else 0 for circuit_index_2 in range(self.get_n_circuits())] for circuit_index_1 in range(self.get_n_circuits())]
+        self.lr = [[Bool(f"LeftRight_{circuit_index_1+1}_{circuit_index_2+1}", self._ctx) if circuit_index_1 != circuit_index_2 else 0 for circuit_index_2 in range(self.get_n_circuits())] for circuit_index_1 in range(self.get_n_circuits())]
         # list of booleans. If True, the circuit at index 1 is placed at the bottom of the circuit at index 2. False otherwise
-        self.ud = [[Bool(f"DownUp_{circuit_index_1+1}_{circuit_index_2+1}") if circuit_index_1 != circuit_index_2 else 0 for circuit_index_2 in range(self.get_n_circuits())] for circuit_index_1 in range(self.get_n_circuits())]
+        self.ud = [[Bool(f"DownUp_{circuit_index_1+1}_{circuit_index_2+1}", self._ctx) if circuit_index_1 != circuit_index_2 else 0 for circuit_index_2 in range(self.get_n_circuits())] for circuit_index_1 in range(self.get_n_circuits())]
     
     
+    def get_context(self):
+        '''
+        Returning the z3 context of the variables (None for the global context)
+        '''
+        return self._ctx
+
     def get_name(self):
         '''
         Returning the instance name
@@ -110,11 +127,23 @@ class Instance():
         '''
         return self._min_height
     
+    def get_lower_bound_name(self):
+        '''
+        Returning the name of the bound giving the minimum height (see bounds.LOWER_BOUNDS)
+        '''
+        return self._lower_bound_name
+    
     def get_max_height(self):
         '''
         Returning the maximum height
         '''
         return self._max_height
+
+    def get_hint(self):
+        '''
+        Returning the circuits placed by the skyline heuristic, as [width, height, x, y]
+        '''
+        return self._hint_circuits
     
     ####################################
     # Get Rotation / Simmetry_Breaking #
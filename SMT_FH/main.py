@@ -1,42 +1,165 @@
 import argparse
-from tqdm import tqdm
+from functools import partial
 import time
 from instance import Instance
 from z3 import *
-from constraints import set_domain_constraints, set_non_overlap_constraints, check_rot_flags, rotation_switch
+from constraints import set_domain_constraints, set_non_overlap_constraints, check_rot_flags, rotation_switch, set_initial_values
+from search import search_height, SEARCH_STRATEGIES
+from verifier import check_placement
+from renderer import RENDERERS
+from results import ResultsStore
+from phases import PhaseTimer
 from utils import *
 
 
-def solve_instance(instance, solver, plate_height, add_constraints=True):
+# results store and timing.csv exported from it
+RESULTS_PATH = './SMT_FH/results.db'
+TIMING_PATH = './SMT_FH/timing.csv'
 
-    # It enters here only if it is the first call. Otherwise, it is useless, because
-    # the constraints are already added to the solver.
-    if add_constraints:
 
-        if rotation:
-            check_rot_flags(instance, solver, plate_height)
-            rotation_switch(instance, solver, plate_height)
+def probe_height(instance, solver, plate_height, deadline):
+    '''
+    Checking if the circuits fit a plate of the given height. The constraints depending on the
+    height live in their own scope, which is removed after the check.
+    '''
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        return unknown, None
+    solver.set(timeout = int(remaining * 1000))
 
-        set_domain_constraints(instance, solver, plate_height)
-        set_non_overlap_constraints(instance, solver, plate_height)
+    solver.push()
+
+    if instance.get_rotation():
+        check_rot_flags(instance, solver, plate_height)
+
+    set_domain_constraints(instance, solver, plate_height)
+    set_non_overlap_constraints(instance, solver, plate_height)
 
     result = solver.check()
 
-    # check if the solving time is higher than 300 seconds
-    if result == unknown:
-        return "Time Expired"
-    
     # Check if the solution exists
-    elif result == sat:
-        model = s.model()
-        return model, plate_height
-    else:
-        plate_height += 1
-        if plate_height < instance.get_max_height():
-            return solve_instance(instance, solver, plate_height, add_constraints=False)
-        else:
-            return "Maximum Height exceeded"
-
+    model = solver.model() if result == sat else None
+
+    solver.pop()
+    return result, model
+
+
+def get_model_height(instance, m):
+    '''
+    Returning the height of the plate actually used by the circuits placed by a model
+    '''
+    corners = instance.get_corners()
+    heights = instance.get_circuit_heights()
+    return max(m.evaluate(corners[h][1] + heights[h], model_completion = True).as_long() for h in range(instance.get_n_circuits()))
+
+
+def solve_instance(instance, solver, strategy='linear-up', time_limit=300, timer=None):
+    '''
+    Encoding the constraints shared by all the heights and looking for the minimum height. If a PhaseTimer is given,
+    the shared constraints are timed as its 'encode' phase and every height probe, with its own constraints,
+    as a lap of its 'solve' phase.
+    '''
+    if timer is None:
+        timer = PhaseTimer()
+
+    deadline = time.time() + time_limit
+
+    with timer.phase('encode'):
+        # Rotation constraints do not depend on the height, they are shared by all the probes
+        if instance.get_rotation():
+            rotation_switch(instance, solver, instance.get_max_height())
+        set_initial_values(instance, solver)
+
+    return search_height(lambda plate_height: probe_height(instance, solver, plate_height, deadline),
+                         instance.get_min_height(), instance.get_max_height(), strategy,
+                         model_height=lambda model: get_model_height(instance, model), timer=timer)
+
+
+def get_placement(instance, time_limit=300, strategy='linear-up'):
+    '''
+    Solving an instance and returning (circuits, height, optimal), with the circuits placed as [width, height, x, y].
+    The height search is exact, so the solution is optimal unless the time expired before the search completed,
+    in which case the lowest placement found is returned as not proven optimal. It returns None if no solution is found.
+    '''
+    output, _ = solve_instance(instance, SimpleSolver(ctx=instance.get_context()), strategy, time_limit)
+    if type(output) == str:
+        return None
+    return get_circuits(instance, output[0]), output[1], output[2]
+
+
+def run_instance(i, raw_instance, rotation, simmetry_breaking, output_paths, strategy='linear-up', renderer='matplotlib', results=None):
+    '''
+    Solving the i-th instance and writing its solution, returning the time needed to solve it ('-' if it failed).
+    output_paths is the tuple (output_txt_path, output_img_path, output_failure_path).
+    renderer is the renderer of the solution image (see renderer.RENDERERS), None to write only the textual solution.
+    If a results store is given, the run is appended to it, with the times of its phases (see phases.PhaseTimer).
+    The time needed to solve the instance is the time of the encode, solve and decode phases.
+    '''
+    output_txt_path, output_img_path, output_failure_path = output_paths
+    timer = PhaseTimer()
+
+    name_instance = f'{i}_instance'
+    # every instance has its own z3 context, so that instances can be solved on threads (see utils.run_instances)
+    with timer.phase('parse'):
+        instance = Instance(raw_instance, name_instance, rotation, simmetry_breaking, Context())
+
+    # Solver initialization: the SMT core of z3, which accepts the initial values of the skyline hint
+    with timer.phase('encode'):
+        s = SimpleSolver(ctx=instance.get_context())
+
+    # 5 minutes (300 sec) time limit for each instance to be solved, shared by all the height probes
+    output, probes = solve_instance(instance, s, strategy, time_limit=300, timer=timer)
+
+    for probe in probes:
+        print(f"height {probe[0]}: {probe[1]} ({probe[2]:.3f} s)")
+    statistics = dict(get_statistics(s), strategy=strategy, probes=[[probe[0], str(probe[1]), probe[2]] for probe in probes])
+
+    if type(output) == str:
+
+        # write the instance in failures file
+        with open(output_failure_path, 'a') as output:
+            output.write(f'Instance {i + 1} failed')
+            output.write('\n')
+        print("\nFailed to solve instance %i" % (i + 1))
+        if results is not None:
+            results.append('SMT_FH', i, instance, times=timer.get_times(), statistics=statistics)
+        return '-'
+
+    m, height, optimal = output
+
+    with timer.phase('decode'):
+        circuits = get_circuits(instance, m)
+
+    # the solution is timed without checking, writing it and drawing its image
+    solve_time = timer.get_solve_time()
+
+    # the placement is checked before it is written
+    with timer.phase('verify'):
+        problems = check_placement(instance, circuits, height)
+    if problems:
+
+        # write the instance in failures file
+        with open(output_failure_path, 'a') as output:
+            output.write(f'Instance {i + 1} failed verification: {"; ".join(problems)}')
+            output.write('\n')
+        print(f"\nWrong solution for instance {i + 1}: {'; '.join(problems)}")
+        if results is not None:
+            results.append('SMT_FH', i, instance, times=timer.get_times(), statistics=dict(statistics, problems=problems))
+        return '-'
+
+    decode_circuits(instance, m, height, output_txt_path, output_img_path, renderer, timer)
+
+    print(f"Solution found for instance {i + 1}")
+    print(f"lower bound of the height is: {instance.get_min_height()} ({instance.get_lower_bound_name()} bound{', tight' if height == instance.get_min_height() else ''})")
+    print(f"minimum height found is: {height}{'' if optimal else ' (not proven optimal)'}")
+    print(f"The time requested for this instance was: {solve_time}")
+    print(f"phases: {timer.summary()}")
+    print("\n\n\n\n\n")
+
+    if results is not None:
+        results.append('SMT_FH', i, instance, height, optimal, solve_time, timer.get_times(), statistics)
+
+    return solve_time
 
 
 if __name__ == '__main__':
@@ -45,68 +168,33 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='SAT argument parsing')
 
     # Add arguments
-    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instance folder name')
+    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instances: a folder, a glob pattern, a bundle file or - for the standard input')
     parser.add_argument('--rotation', action='store_true', help='Set circuit rotation to True')
     parser.add_argument('--simmetry_breaking', action='store_true', help='Set solving simmetry breaking to True')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes solving the instances in parallel')
+    parser.add_argument('--threads', action='store_true', help='Solve the jobs on threads of this process instead of processes')
+    parser.add_argument('--renderer', type=str, default='matplotlib', choices=RENDERERS, help='Renderer of the solution images: matplotlib, fast (numpy PNG) or svg')
+    parser.add_argument('--no_render', '--no-render', action='store_true', help='Do not draw the solution images, they can be drawn later by render.py')
+    parser.add_argument('--results', type=str, default=RESULTS_PATH, help='SQLite database where every run is appended')
+    parser.add_argument('--export_timing', '--export-timing', action='store_true', help='Export timing.csv from the results store after the run')
+    parser.add_argument('--search', type=str, default='linear-up', choices=SEARCH_STRATEGIES, help='Strategy used to look for the minimum height')
     args = parser.parse_args()
 
     folder_name = args.folder_name
     rotation = args.rotation
     simmetry_breaking = args.simmetry_breaking
+    strategy = args.search
+    results = ResultsStore(args.results)
     output_txt_path, output_img_path, output_failure_path = set_environment(rotation, simmetry_breaking, 'SMT')
     
-    instances = import_instances(folder_name)
-
-    # list of all timing measures for each instance
-    timings = []
-
-    for i in tqdm(range(len(instances))):
-    
-        name_instance = f'{i}_instance'
-        instance = Instance(instances[i], name_instance, rotation, simmetry_breaking)
-
-        plate_height = instance.get_min_height()
-        
-        plate_width = instance.get_plate_width()
-
-        # starting timing operation
-        start_time = time.time()
-
-        # Solver initialization
-        s = Solver()
-        # 5 minutes (300 sec) time limit for each instance to be solved
-        tmout = 300 * 1000
-        s.set(timeout = tmout)
-        
-        output = solve_instance(instance, s, plate_height)
-
-        if type(output) == str:
-
-            end_time = time.time()
-            timings.append('-')
-
-            # write the instance in failures file
-            with open(output_failure_path, 'a') as output:
-                output.write(f'Instance {i + 1} failed')
-                output.write('\n')
-            print("\nFailed to solve instance %i" % (i + 1))
-
-        else:
-
-            m = output[0]
-            height = output[1]
-
-            decode_circuits(instance, m, height, output_txt_path, output_img_path)
-
-            end_time = time.time()
-
-            timings.append(end_time - start_time)
+    instances = iter_instances(folder_name)
 
-            print(f"Solution found for instance {i + 1}")
-            print(f"optimum height is: {instance.get_min_height()}")
-            print(f"minimum height found is: {height}")
-            print(f"The time requested for this instance was: {end_time - start_time}")
-            print("\n\n\n\n\n")
+    # the instances are solved in parallel by "jobs" processes (or threads), the timings are collected in instance order
+    solve = partial(run_instance, rotation=rotation, simmetry_breaking=simmetry_breaking,
+                    output_paths=(output_txt_path, output_img_path, output_failure_path), strategy=strategy,
+                    renderer=None if args.no_render else args.renderer, results=results)
+    timings = run_instances(solve, instances, args.jobs, args.threads)
 
-    # Saving time needed to solve the instances into 'timing.csv' file
-    save_times_to_csv(rotation, simmetry_breaking, timings, len(instances))
+    # Exporting the latest time of every instance and configuration into 'timing.csv' file
+    if args.export_timing:
+        results.export_timing_csv(TIMING_PATH, 'SMT_FH', len(timings))
@@ -0,0 +1,62 @@
+import time
+from contextlib import contextmanager
+
+# Phases of a run, in order: building the instance (with its bounds and heuristic placement), encoding it,
+# solving it (every height probe is a lap), decoding and checking the placement, writing and drawing it
+PHASES = ['parse', 'encode', 'solve', 'decode', 'verify', 'write', 'render']
+
+# Phases making up the time reported for an instance
+SOLVE_PHASES = ['encode', 'solve', 'decode']
+
+
+class PhaseTimer():
+    '''
+    Recording the duration of the phases of a run, with the monotonic wall clock (perf_counter) and the CPU time
+    of the process (process_time, which excludes the solvers running as separate processes, e.g. MiniZinc).
+    A phase can be timed several times (laps), e.g. once per height probe: its durations are summed.
+    '''
+
+    def __init__(self):
+        self._laps = {}
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        Timing the block of code of a with statement as a lap of the phase "name"
+        '''
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall_start, time.process_time() - cpu_start)
+
+    def add(self, name, wall, cpu=0.0):
+        self._laps.setdefault(name, []).append((wall, cpu))
+
+    def get_time(self, *names):
+        '''
+        Returning the wall time of the given phases, summed over their laps
+        '''
+        return sum(wall for name in names for wall, _ in self._laps.get(name, []))
+
+    def get_solve_time(self):
+        return self.get_time(*SOLVE_PHASES)
+
+    def get_times(self):
+        '''
+        Returning the times of the phases as a dictionary: {phase: {'wall', 'cpu', 'laps'}}, with the wall times
+        of the laps listed when a phase was timed more than once
+        '''
+        times = {}
+        for name in sorted(self._laps, key=lambda name: PHASES.index(name) if name in PHASES else len(PHASES)):
+            laps = self._laps[name]
+            times[name] = {'wall': sum(wall for wall, _ in laps), 'cpu': sum(cpu for _, cpu in laps), 'laps': len(laps)}
+            if len(laps) > 1:
+                times[name]['lap_times'] = [wall for wall, _ in laps]
+        return times
+
+    def summary(self):
+        '''
+        Returning a line with the wall and CPU time of every phase
+        '''
+        return ', '.join(f"{name} {phase['wall']:.3f} s (cpu {phase['cpu']:.3f} s)" for name, phase in self.get_times().items())
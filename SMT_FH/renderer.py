@@ -0,0 +1,159 @@
+import struct
+import zlib
+import numpy as np
+
+# Renderers of the solution images: matplotlib (plot_solution), a numpy rasterizer writing PNG files and an SVG writer
+RENDERERS = ['matplotlib', 'fast', 'svg']
+
+# Same look of plot_solution: 100 dpi, 10 inches wide, default subplot margins, colors of the circuits and of the grid
+DPI = 100
+SIZE = 10
+MARGINS = (0.125, 0.9, 0.11, 0.88)
+COLORS = [(214, 39, 40), (255, 127, 14), (255, 255, 0), (44, 160, 44), (31, 119, 180), (148, 103, 189), (140, 86, 75), (127, 127, 127)]
+GRID_COLOR = (0, 0, 255)
+EDGE_WIDTH = 3
+TICK_LENGTH = 5
+
+# 3x5 bitmap font of the tick labels
+DIGITS = {
+    '0': ['111', '101', '101', '101', '111'],
+    '1': ['010', '110', '010', '010', '111'],
+    '2': ['111', '001', '111', '100', '111'],
+    '3': ['111', '001', '111', '001', '111'],
+    '4': ['101', '101', '111', '001', '001'],
+    '5': ['111', '100', '111', '001', '111'],
+    '6': ['111', '100', '111', '101', '111'],
+    '7': ['111', '001', '001', '001', '001'],
+    '8': ['111', '101', '111', '101', '111'],
+    '9': ['111', '101', '111', '001', '111'],
+}
+FONT_SCALE = 2
+GLYPHS = {digit: np.kron(np.array([[int(bit) for bit in row] for row in rows], dtype=bool), np.ones((FONT_SCALE, FONT_SCALE), dtype=bool))
+          for digit, rows in DIGITS.items()}
+
+
+def get_geometry(width, height):
+    '''
+    Returning the size of the image in pixels and the functions mapping the plate coordinates to pixel columns and rows
+    '''
+    image_width = SIZE * DPI
+    image_height = int(SIZE * height / width * DPI)
+    left, right, bottom, top = MARGINS
+    x0, x1 = left * image_width, right * image_width
+    y0, y1 = (1 - bottom) * image_height, (1 - top) * image_height
+
+    def column(x):
+        return int(round(x0 + x * (x1 - x0) / width))
+
+    def row(y):
+        return int(round(y0 - y * (y0 - y1) / height))
+
+    return image_width, image_height, column, row
+
+
+def encode_png(pixels):
+    '''
+    Encoding an RGB image (numpy array of shape (rows, columns, 3), uint8) as PNG bytes
+    '''
+    rows, columns, _ = pixels.shape
+    # every scanline starts with the filter type, 0 (no filter)
+    scanlines = np.zeros((rows, columns * 3 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = pixels.reshape(rows, -1)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', columns, rows, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 6)) + chunk(b'IEND', b'')
+
+
+def draw_text(pixels, text, column, row, align):
+    '''
+    Drawing a number with the bitmap font. The text is centered on the column (align 'center')
+    or ends at it (align 'right'), and vertically centered on the row
+    '''
+    glyph_height, glyph_width = GLYPHS['0'].shape
+    text_width = len(text) * (glyph_width + FONT_SCALE) - FONT_SCALE
+    left = column - text_width // 2 if align == 'center' else column - text_width
+    top = row - glyph_height // 2
+    for character in text:
+        region = pixels[max(top, 0):top + glyph_height, max(left, 0):left + glyph_width]
+        glyph = GLYPHS[character][max(-top, 0):, max(-left, 0):][:region.shape[0], :region.shape[1]]
+        region[glyph] = 0
+        left += glyph_width + FONT_SCALE
+
+
+def render_png(width, height, circuits, file):
+    '''
+    Drawing the placed circuits ([width, height, x, y]) straight into a pixel buffer and writing it as a PNG file
+    '''
+    image_width, image_height, column, row = get_geometry(width, height)
+    pixels = np.full((image_height, image_width, 3), 255, dtype=np.uint8)
+    half_edge = EDGE_WIDTH // 2
+
+    # circuits, with their black edges
+    for i, (i_width, i_height, x, y) in enumerate(circuits):
+        left, right, top, bottom = column(x), column(x + i_width), row(y + i_height), row(y)
+        pixels[max(top - half_edge, 0):bottom + half_edge + 1, max(left - half_edge, 0):right + half_edge + 1] = 0
+        pixels[top + half_edge + 1:bottom - half_edge, left + half_edge + 1:right - half_edge] = COLORS[i % len(COLORS)]
+
+    # grid lines, drawn above the circuits like in matplotlib
+    left, right, top, bottom = column(0), column(width), row(height), row(0)
+    for x in range(width + 1):
+        pixels[top:bottom + 1, column(x)] = GRID_COLOR
+    for y in range(height + 1):
+        pixels[row(y), left:right + 1] = GRID_COLOR
+
+    # frame of the plate, ticks and their labels
+    pixels[top, left:right + 1] = pixels[bottom, left:right + 1] = 0
+    pixels[top:bottom + 1, left] = pixels[top:bottom + 1, right] = 0
+    glyph_height = GLYPHS['0'].shape[0]
+    for x in range(width + 1):
+        pixels[bottom:bottom + TICK_LENGTH + 1, column(x)] = 0
+        draw_text(pixels, str(x), column(x), bottom + TICK_LENGTH + 5 + glyph_height // 2, 'center')
+    for y in range(height + 1):
+        pixels[row(y), max(left - TICK_LENGTH, 0):left + 1] = 0
+        draw_text(pixels, str(y), left - TICK_LENGTH - 5, row(y), 'right')
+
+    with open(file, 'wb') as output:
+        output.write(encode_png(pixels))
+
+
+def render_svg(width, height, circuits, file):
+    '''
+    Writing the placed circuits ([width, height, x, y]) as an SVG file, with the same layout of the PNG images
+    '''
+    image_width, image_height, column, row = get_geometry(width, height)
+    left, right, top, bottom = column(0), column(width), row(height), row(0)
+
+    elements = []
+    for i, (i_width, i_height, x, y) in enumerate(circuits):
+        color = '#%02x%02x%02x' % COLORS[i % len(COLORS)]
+        elements.append(f'<rect x="{column(x)}" y="{row(y + i_height)}" width="{column(x + i_width) - column(x)}" '
+                        f'height="{row(y) - row(y + i_height)}" fill="{color}" stroke="black" stroke-width="{EDGE_WIDTH}"/>')
+    for x in range(width + 1):
+        elements.append(f'<line x1="{column(x)}" y1="{top}" x2="{column(x)}" y2="{bottom}" stroke="blue"/>')
+        elements.append(f'<line x1="{column(x)}" y1="{bottom}" x2="{column(x)}" y2="{bottom + TICK_LENGTH}" stroke="black"/>')
+        elements.append(f'<text x="{column(x)}" y="{bottom + TICK_LENGTH + 15}" text-anchor="middle">{x}</text>')
+    for y in range(height + 1):
+        elements.append(f'<line x1="{left}" y1="{row(y)}" x2="{right}" y2="{row(y)}" stroke="blue"/>')
+        elements.append(f'<line x1="{left - TICK_LENGTH}" y1="{row(y)}" x2="{left}" y2="{row(y)}" stroke="black"/>')
+        elements.append(f'<text x="{left - TICK_LENGTH - 4}" y="{row(y) + 4}" text-anchor="end">{y}</text>')
+    elements.append(f'<rect x="{left}" y="{top}" width="{right - left}" height="{bottom - top}" fill="none" stroke="black"/>')
+
+    with open(file, 'w') as output:
+        output.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{image_width}" height="{image_height}" '
+                     f'font-family="sans-serif" font-size="13">\n<rect width="100%" height="100%" fill="white"/>\n')
+        output.write('\n'.join(elements))
+        output.write('\n</svg>\n')
+
+
+def render_solution(width, height, circuits, file, renderer='fast'):
+    '''
+    Writing the image of the placed circuits ([width, height, x, y]) with a fast renderer: 'fast' writes a PNG file,
+    'svg' an SVG file (the extension of the file name is replaced)
+    '''
+    if renderer == 'svg':
+        render_svg(width, height, circuits, file.rsplit('.', 1)[0] + '.svg')
+    else:
+        render_png(width, height, circuits, file)
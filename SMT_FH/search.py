@@ -0,0 +1,106 @@
+import time
+from z3 import sat, unsat, unknown
+from phases import PhaseTimer
+
+# Available strategies to look for the minimum plate height
+SEARCH_STRATEGIES = ['linear-up', 'linear-down', 'bisect', 'galloping']
+
+
+def search_height(probe, lower_bound, upper_bound, strategy='linear-up', model_height=None, timer=None):
+    '''
+    Looking for the minimum feasible plate height in [lower_bound, upper_bound], calling "probe" on
+    the candidate heights. "probe" takes a height and returns a tuple (result, model), where result is
+    sat, unsat or unknown. The search is iterative and relies on the monotonicity of the problem:
+    if a height is feasible, all the greater heights are feasible as well.
+    If "model_height" is given, it is used to read the height actually used by a model, which
+    can be lower than the probed one and shrinks the interval further.
+    If a PhaseTimer is given, every probe is timed as a lap of its 'solve' phase.
+
+    If the time expires (a probe returns unknown) after a feasible height is found, the lowest one is returned
+    as not proven optimal.
+
+    It returns the tuple (output, probes):
+        -) output is (model, height, optimal) for the lowest feasible height found, optimal being False if the
+           search was stopped by the time limit, or a string describing the failure;
+        -) probes is the list of (height, result, seconds) of every probe, in order.
+    '''
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"Unknown search strategy '{strategy}', choose one of {SEARCH_STRATEGIES}")
+
+    probes = []
+    if timer is None:
+        timer = PhaseTimer()
+
+    def expired():
+        # the lowest placement found so far is not lost on timeout
+        if best is None:
+            return "Time Expired", probes
+        return (*best, False), probes
+
+    def timed_probe(plate_height):
+        probe_start = time.perf_counter()
+        with timer.phase('solve'):
+            result, model = probe(plate_height)
+        probes.append((plate_height, result, time.perf_counter() - probe_start))
+        # the model can fit a lower plate than the probed one
+        if result == sat and model_height is not None:
+            plate_height = min(plate_height, model_height(model))
+        return result, model, plate_height
+
+    # lowest height proven feasible and its model
+    best = None
+    # every height below "low" is infeasible, every height above "high" is feasible (or out of range)
+    low = lower_bound
+    high = upper_bound
+
+    if strategy == 'linear-up':
+        for plate_height in range(low, high + 1):
+            result, model, plate_height = timed_probe(plate_height)
+            if result == unknown:
+                return expired()
+            if result == sat:
+                return (model, plate_height, True), probes
+
+    elif strategy == 'linear-down':
+        plate_height = high
+        while plate_height >= low:
+            result, model, found_height = timed_probe(plate_height)
+            if result == unknown:
+                return expired()
+            if result == unsat:
+                break
+            best = (model, found_height)
+            plate_height = found_height - 1
+
+    else:
+        if strategy == 'galloping':
+            # Exponentially growing steps from the lower bound, until a feasible height is found
+            step = 1
+            plate_height = low
+            while plate_height <= high:
+                result, model, found_height = timed_probe(plate_height)
+                if result == unknown:
+                    return expired()
+                if result == sat:
+                    best = (model, found_height)
+                    high = found_height - 1
+                    break
+                low = plate_height + 1
+                plate_height = low + step
+                step *= 2
+
+        # Bisection of the remaining interval
+        while low <= high:
+            plate_height = (low + high) // 2
+            result, model, found_height = timed_probe(plate_height)
+            if result == unknown:
+                return expired()
+            if result == sat:
+                best = (model, found_height)
+                high = found_height - 1
+            else:
+                low = plate_height + 1
+
+    if best is None:
+        return "Maximum Height exceeded", probes
+    return (*best, True), probes
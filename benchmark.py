@@ -0,0 +1,199 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from portfolio import APPROACHES, is_available, parse_options, start_worker, kill_worker
+from utils import iter_instances
+
+# Configurations of the approaches, as (rotation, simmetry_breaking), named like the columns of timing.csv
+CONFIGURATIONS = {
+    'base': (False, False, 'No Rotation No SB'),
+    'sb': (False, True, 'No Rotation SB'),
+    'rot': (True, False, 'Rotation No SB'),
+    'rot_sb': (True, True, 'Rotation SB'),
+}
+
+
+def get_prefix(approach, variant, name):
+    '''
+    Returning the prefix of the result keys of an approach, with the options of a variant, and a configuration
+    '''
+    return f'{approach}[{variant}]/{name}' if variant else f'{approach}/{name}'
+
+
+def run_once(approach, raw_instance, rotation, simmetry_breaking, time_limit, log_file=subprocess.DEVNULL, options=None):
+    '''
+    Solving an instance with an approach in a fresh worker process (see portfolio.run_worker), passing it the options.
+    It returns the result of the worker ({'circuits', 'height', 'optimal', 'time'}), None if the worker failed.
+    '''
+    process = start_worker(approach, raw_instance, rotation, simmetry_breaking, time_limit, log_file, options)
+    # the instance is already written and the standard input closed
+    process.stdin = None
+    try:
+        # the workers stop by themselves at the time limit, a grace period is given for the model building
+        output, _ = process.communicate(timeout=time_limit + 30)
+    except subprocess.TimeoutExpired:
+        kill_worker(process)
+        return None
+
+    lines = output.strip().splitlines()
+    if process.returncode != 0 or not lines:
+        return None
+    return json.loads(lines[-1])
+
+
+def summarize(times):
+    '''
+    Returning the median, the 10th and 90th percentiles, the mean, the variance, the minimum and the maximum of the times
+    '''
+    deciles = statistics.quantiles(times, n=10, method='inclusive') if len(times) > 1 else [times[0]] * 9
+    return {
+        'median': statistics.median(times),
+        'p10': deciles[0],
+        'p90': deciles[-1],
+        'mean': statistics.mean(times),
+        'variance': statistics.pvariance(times),
+        'min': min(times),
+        'max': max(times),
+    }
+
+
+def benchmark(approach, raw_instance, rotation, simmetry_breaking, repeat=5, time_limit=300, log_file=subprocess.DEVNULL, options=None):
+    '''
+    Solving an instance "repeat" times with an approach. It returns the summary of the solve times of the runs
+    (see summarize) with the height found, the number of failed runs and the times of every run.
+    If a run fails or does not prove the height optimal, the instance is not run again and its summary has no times.
+    '''
+    times = []
+    heights = set()
+    for _ in range(repeat):
+        result = run_once(approach, raw_instance, rotation, simmetry_breaking, time_limit, log_file, options)
+        if result is None or result['circuits'] is None or not result['optimal']:
+            return {'failures': 1, 'height': min(heights, default=None), 'times': times}
+        times.append(result['time'])
+        heights.add(result['height'])
+
+    summary = summarize(times)
+    summary.update({'failures': 0, 'height': min(heights), 'times': times})
+    return summary
+
+
+def compare_variants(results, variants):
+    '''
+    Comparing the variants of an approach and configuration (the keys of the results are "prefix/Instance N", see get_prefix):
+    it returns, for every variant, the number of instances solved and the sum of the median times over the instances
+    solved by all the variants
+    '''
+    instances = {}
+    for key, result in results.items():
+        variant, instance = key.rsplit('/', 1)
+        instances.setdefault(instance, {})[variant] = result
+
+    common = [runs for runs in instances.values() if all(variant in runs and runs[variant]['failures'] == 0 for variant in variants)]
+    return {variant: {'solved': sum(1 for runs in instances.values() if variant in runs and runs[variant]['failures'] == 0),
+                      'common_time': sum(runs[variant]['median'] for runs in common), 'common_instances': len(common)}
+            for variant in variants}
+
+
+def compare(results, baseline, tolerance=0.25, min_delta=0.05):
+    '''
+    Comparing the results with a baseline of a previous run. It returns the regressions: the instances whose median
+    time grew by more than tolerance (and by more than min_delta seconds, below which the differences are noise),
+    the ones solved in the baseline and failed now, and the ones whose height grew.
+    '''
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        previous = baseline[key]
+        if result['failures'] > 0 and previous['failures'] == 0:
+            regressions.append(f"{key}: solved in the baseline, failed now")
+        elif result['failures'] == 0 and previous['failures'] == 0:
+            if result['height'] > previous['height']:
+                regressions.append(f"{key}: height went from {previous['height']} to {result['height']}")
+            if result['median'] > previous['median'] * (1 + tolerance) and result['median'] - previous['median'] > min_delta:
+                regressions.append(f"{key}: median time went from {previous['median']:.3f} s to {result['median']:.3f} s")
+    return regressions
+
+
+if __name__ == '__main__':
+
+    # Create an argument parser
+    parser = argparse.ArgumentParser(description='Benchmark argument parsing')
+
+    # Add arguments
+    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instances: a folder, a glob pattern, a bundle file or - for the standard input')
+    parser.add_argument('--instances', type=int, nargs='+', default=None, help='Numbers of the instances to run, starting from 1 (default all of them)')
+    parser.add_argument('--approaches', type=str, nargs='+', default=['SAT'], choices=list(APPROACHES), help='Approaches to run')
+    parser.add_argument('--configurations', type=str, nargs='+', default=['base'], choices=list(CONFIGURATIONS), help='Configurations to run: base, sb (simmetry breaking), rot (rotation) and rot_sb')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs of every instance')
+    parser.add_argument('--time_limit', type=float, default=300, help='Time limit for each run, in seconds')
+    parser.add_argument('--log', type=str, default=None, help='File collecting the output of the workers')
+    parser.add_argument('--output', type=str, default=None, help='JSON file where the results are written')
+    parser.add_argument('--baseline', type=str, default=None, help='JSON file of the results of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown of the median time with respect to the baseline (0.25 = 25%%)')
+    parser.add_argument('--min_delta', type=float, default=0.05, help='Slowdowns smaller than this, in seconds, are ignored')
+    parser.add_argument('--save_baseline', action='store_true', help='Write the results to the baseline file')
+    parser.add_argument('--variants', type=str, nargs='+', default=[''], help='Options of the approaches to compare, one comma separated list of KEY=VALUE per variant (e.g. encoding=generic encoding=difference,opt=linear)')
+    args = parser.parse_args()
+
+    approaches = [approach for approach in args.approaches if is_available(approach)]
+    for approach in args.approaches:
+        if approach not in approaches:
+            print(f"{approach} is not available, the packages {APPROACHES[approach][1]} are needed")
+    if not approaches:
+        sys.exit("No approach available")
+
+    baseline = {}
+    if args.baseline is not None and not args.save_baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    log_file = open(args.log, 'a') if args.log is not None else subprocess.DEVNULL
+    selected = set(args.instances) if args.instances is not None else None
+    variants = {variant: parse_options(item for item in variant.split(',') if item) for variant in args.variants}
+
+    results = {}
+    for i, raw_instance in enumerate(iter_instances(args.folder_name)):
+        if selected is not None and i + 1 not in selected:
+            continue
+        for approach in approaches:
+            for configuration in args.configurations:
+                rotation, simmetry_breaking, name = CONFIGURATIONS[configuration]
+                for variant, options in variants.items():
+                    key = f'{get_prefix(approach, variant, name)}/Instance {i + 1}'
+                    results[key] = result = benchmark(approach, raw_instance, rotation, simmetry_breaking, args.repeat, args.time_limit, log_file, options)
+
+                    if result['failures'] > 0:
+                        print(f"{key}: failed")
+                    else:
+                        print(f"{key}: height {result['height']}, median {result['median']:.3f} s "
+                              f"(p10 {result['p10']:.3f} s, p90 {result['p90']:.3f} s, variance {result['variance']:.2e})")
+
+    if log_file is not subprocess.DEVNULL:
+        log_file.close()
+
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
+    if args.save_baseline and args.baseline is not None:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=4)
+
+    # the variants of every approach and configuration are compared on the instances all of them solved
+    if len(variants) > 1:
+        for approach in approaches:
+            for configuration in args.configurations:
+                name = CONFIGURATIONS[configuration][2]
+                prefixes = [get_prefix(approach, variant, name) for variant in variants]
+                selected_results = {key: result for key, result in results.items() if key.rsplit('/', 1)[0] in prefixes}
+                comparison = compare_variants(selected_results, prefixes)
+                for prefix, summary in comparison.items():
+                    print(f"{prefix}: {summary['solved']} solved, {summary['common_time']:.3f} s on the {summary['common_instances']} instances solved by all the variants")
+
+    regressions = compare(results, baseline, args.tolerance, args.min_delta)
+    for regression in regressions:
+        print(regression)
+    if regressions:
+        sys.exit(1)
@@ -0,0 +1,111 @@
+import argparse
+import csv
+import math
+import os
+import random
+
+
+def can_cut(length, across, max_aspect):
+    '''
+    Checking if a side of the given length can be cut in two pieces whose aspect ratio, with respect to the other side
+    ("across"), is at most max_aspect
+    '''
+    return 2 * math.ceil(across / max_aspect) <= length
+
+
+def guillotine_cuts(n, width, height, max_aspect=4.0, duplicates=0.0, rng=random):
+    '''
+    Cutting a width x height plate into n circuits with guillotine cuts: at every step a piece, chosen with probability
+    proportional to its area, is cut in two across one of its sides, at a random position keeping the aspect ratio of
+    both pieces at most max_aspect (the longer side is cut when no cut keeps it). With probability "duplicates" the
+    piece is cut in two equal halves, giving two identical circuits.
+    The circuits fill the plate, so the optimal height of the instance is the plate height.
+    '''
+    if n > width * height:
+        raise ValueError(f"a {width}x{height} plate cannot be cut into {n} circuits")
+
+    pieces = [(width, height)]
+    while len(pieces) < n:
+        cuttable = [i for i, (w, h) in enumerate(pieces) if w * h > 1]
+        i = rng.choices(cuttable, weights=[pieces[i][0] * pieces[i][1] for i in cuttable])[0]
+        w, h = pieces.pop(i)
+
+        # a vertical cut splits the width, a horizontal one the height
+        sides = [vertical for vertical, length, across in [(True, w, h), (False, h, w)] if can_cut(length, across, max_aspect)]
+        vertical = rng.choice(sides) if sides else w >= h
+        length, across = (w, h) if vertical else (h, w)
+
+        if length % 2 == 0 and rng.random() < duplicates:
+            cut = length // 2
+        elif sides:
+            smallest = math.ceil(across / max_aspect)
+            cut = rng.randint(smallest, length - smallest)
+        else:
+            cut = rng.randint(1, length - 1)
+
+        pieces += [(cut, h), (w - cut, h)] if vertical else [(w, cut), (w, h - cut)]
+
+    rng.shuffle(pieces)
+    return pieces
+
+
+def write_instance(path, width, circuits):
+    '''
+    Writing an instance in the ins-N.txt format: plate width, number of circuits and one "width height" line per circuit
+    '''
+    with open(path, 'w') as output:
+        output.write('\n'.join([str(width), str(len(circuits))] + [f'{w} {h}' for w, h in circuits]))
+
+
+def generate_instances(output_folder, sizes, widths, count=1, aspect=1.0, max_aspect=4.0, duplicates=0.0, seed=0, start=1):
+    '''
+    Writing "count" instances for every number of circuits and plate width, as ins-N.txt files numbered from "start".
+    Every instance has its own random generator, seeded by the seed and the instance number, so it can be generated
+    again alone. The plate height is the width times "aspect". It returns the list of (file name, optimal height).
+    '''
+    os.makedirs(output_folder, exist_ok=True)
+    optima = []
+    number = start
+    for n in sizes:
+        for width in widths:
+            height = max(1, round(width * aspect))
+            for _ in range(count):
+                rng = random.Random(seed * 1000003 + number)
+                circuits = guillotine_cuts(n, width, height, max_aspect, duplicates, rng)
+                write_instance(os.path.join(output_folder, f'ins-{number}.txt'), width, circuits)
+                optima.append((f'ins-{number}.txt', height))
+                number += 1
+    return optima
+
+
+if __name__ == '__main__':
+
+    # Create an argument parser
+    parser = argparse.ArgumentParser(description='Instance generator argument parsing')
+
+    # Add arguments
+    parser.add_argument('output_folder', type=str, help='Folder where the ins-N.txt files are written')
+    parser.add_argument('--n', type=int, nargs='+', default=[50], help='Numbers of circuits of the instances')
+    parser.add_argument('--width', type=int, nargs='+', default=[40], help='Plate widths of the instances')
+    parser.add_argument('--count', type=int, default=1, help='Number of instances for every number of circuits and plate width')
+    parser.add_argument('--aspect', type=float, default=1.0, help='Optimal plate height divided by the plate width')
+    parser.add_argument('--max_aspect', '--max-aspect', type=float, default=4.0, help='Maximum aspect ratio of the circuits, when the cuts allow it')
+    parser.add_argument('--duplicates', type=float, default=0.0, help='Probability of cutting a piece in two identical circuits')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generators')
+    parser.add_argument('--start', type=int, default=1, help='Number of the first instance file')
+    parser.add_argument('--optima', type=str, default=None, help='CSV file of the optimal heights (default the output folder name followed by _optima.csv)')
+    args = parser.parse_args()
+
+    try:
+        optima = generate_instances(args.output_folder, args.n, args.width, args.count, args.aspect, args.max_aspect,
+                                    args.duplicates, args.seed, args.start)
+    except ValueError as error:
+        parser.error(str(error))
+
+    # the optimal heights are written outside the instance folder, which only holds instances
+    optima_path = args.optima or os.path.normpath(args.output_folder) + '_optima.csv'
+    with open(optima_path, 'w', newline='') as output:
+        writer = csv.writer(output)
+        writer.writerow(['Instances', 'Optimal Height'])
+        writer.writerows(optima)
+    print(f"{len(optima)} instances written to {args.output_folder}, optimal heights in {optima_path}")
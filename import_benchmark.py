@@ -0,0 +1,108 @@
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Source folder of every driver module, and the packages it needs to be imported
+DRIVERS = {
+    'SAT': (os.path.join(ROOT, 'SAT', 'src'), 'main', ['z3', 'numpy']),
+    'SMT': (os.path.join(ROOT, 'SMT', 'src'), 'main', ['z3']),
+    'SMT_FH': (os.path.join(ROOT, 'SMT_FH'), 'main', ['z3']),
+    'CP': (os.path.join(ROOT, 'CP', 'src'), 'main', ['minizinc']),
+    'MIP': (os.path.join(ROOT, 'MIP', 'src'), 'main', ['gurobipy']),
+    'MIP_rot': (os.path.join(ROOT, 'MIP', 'src'), 'main_rot', ['gurobipy']),
+}
+
+# Baseline of the import times, measured on this machine by the first run
+BASELINE_PATH = os.path.join(ROOT, 'import_times.json')
+
+# Modules that must not be loaded by importing a driver: they are only needed to write the timings and draw images
+LAZY_MODULES = ['pandas', 'matplotlib']
+
+# Fresh interpreter importing a driver, printing the import time and the lazy modules it loaded
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"time": elapsed, "loaded": [name for name in {lazy_modules!r} if name in sys.modules]}}))
+'''
+
+
+def measure_import(driver, repeat=5):
+    '''
+    Importing the module of a driver in "repeat" fresh interpreters.
+    It returns (median import time in seconds, lazy modules loaded by the import).
+    '''
+    folder, module, _ = DRIVERS[driver]
+    times = []
+    loaded = set()
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-c', PROBE.format(module=module, lazy_modules=LAZY_MODULES)],
+                                 cwd=folder, capture_output=True, text=True, check=True)
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        times.append(result['time'])
+        loaded.update(result['loaded'])
+    return statistics.median(times), sorted(loaded)
+
+
+if __name__ == '__main__':
+
+    # Create an argument parser
+    parser = argparse.ArgumentParser(description='Import time benchmark argument parsing')
+
+    # Add arguments
+    parser.add_argument('--drivers', type=str, nargs='+', default=list(DRIVERS), choices=list(DRIVERS), help='Drivers to import')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of imports of every driver, the median time is kept')
+    parser.add_argument('--max_time', type=float, default=None, help='Maximum import time of a driver, in seconds (default no limit, the import times depend on the machine)')
+    parser.add_argument('--baseline', type=str, default=BASELINE_PATH, help='JSON file of the import times of a previous run, written by the first run if it does not exist')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown with respect to the baseline (0.25 = 25%%)')
+    parser.add_argument('--min_delta', type=float, default=0.05, help='Slowdowns smaller than this, in seconds, are ignored')
+    parser.add_argument('--save_baseline', action='store_true', help='Write the measured times to the baseline file')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    elif not args.save_baseline:
+        # the first run measures the baseline of this machine
+        print(f"No baseline in {args.baseline}, the measured times are saved as the baseline")
+        args.save_baseline = True
+
+    times = {}
+    failures = []
+    for driver in args.drivers:
+        packages = DRIVERS[driver][2]
+        if not all(importlib.util.find_spec(package) is not None for package in packages):
+            print(f"{driver}: skipped, the packages {packages} are needed")
+            continue
+
+        times[driver], loaded = measure_import(driver, args.repeat)
+        print(f"{driver}: {times[driver]:.3f} s" + (f" (baseline {baseline[driver]:.3f} s)" if driver in baseline else ""))
+
+        if loaded:
+            failures.append(f"{driver} loads {loaded} at import time")
+        if args.max_time is not None and times[driver] > args.max_time:
+            failures.append(f"{driver} takes {times[driver]:.3f} s to import, more than {args.max_time} s")
+        if driver in baseline and times[driver] > baseline[driver] * (1 + args.tolerance) and times[driver] - baseline[driver] > args.min_delta:
+            failures.append(f"{driver} import time went from {baseline[driver]:.3f} s to {times[driver]:.3f} s")
+
+    if args.save_baseline:
+        # the drivers skipped in this run keep their previous baseline
+        previous = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                previous = json.load(file)
+        with open(args.baseline, 'w') as file:
+            json.dump(dict(previous, **times), file, indent=4)
+
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,257 @@
+import argparse
+import importlib.util
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from tqdm import tqdm
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Source folder of every approach, and the packages it needs to run
+APPROACHES = {
+    'SAT': (os.path.join(ROOT, 'SAT', 'src'), ['z3', 'numpy']),
+    'SMT': (os.path.join(ROOT, 'SMT', 'src'), ['z3']),
+    'SMT_FH': (os.path.join(ROOT, 'SMT_FH'), ['z3']),
+    'CP': (os.path.join(ROOT, 'CP', 'src'), ['minizinc']),
+    'MIP': (os.path.join(ROOT, 'MIP', 'src'), ['gurobipy']),
+}
+
+# The output writers of the SAT approach take the placed circuits as [width, height, x, y]
+sys.path.insert(0, APPROACHES['SAT'][0])
+from utils import iter_instances, output_solution, plot_solution
+from verifier import check_solution
+from renderer import RENDERERS, render_solution
+
+
+def set_environment(rotation, simmetry_breaking):
+    '''
+    Setting the output folders of the portfolio, depending on the rotation flag and the simmetry_breaking flag
+    '''
+    subfolder = '/simmetry_breaking/' if simmetry_breaking else '/no_simmetry_breaking/'
+    output_folder = './portfolio/outRot' if rotation else './portfolio/out'
+
+    output_txt_path = output_folder + '/txt' + subfolder
+    output_img_path = output_folder + '/img' + subfolder
+    output_failure_path = output_folder + '/failures.txt'
+    os.makedirs(output_txt_path, exist_ok=True)
+    os.makedirs(output_img_path, exist_ok=True)
+
+    # write the heading in failures file
+    with open(output_failure_path, 'a') as output:
+        output.write(f'\nSYMMETRY BREAKING: {simmetry_breaking}\n')
+
+    return output_txt_path, output_img_path, output_failure_path
+
+
+def is_available(approach):
+    '''
+    Checking if the packages needed by an approach are installed
+    '''
+    return all(importlib.util.find_spec(package) is not None for package in APPROACHES[approach][1])
+
+
+def parse_options(items):
+    '''
+    Returning the dictionary of the KEY=VALUE options of a worker
+    '''
+    options = {}
+    for item in items:
+        key, separator, value = item.partition('=')
+        if not separator:
+            raise ValueError(f"option '{item}' is not in the KEY=VALUE form")
+        options[key] = value
+    return options
+
+
+def run_worker(approach, rotation, simmetry_breaking, time_limit, options=None):
+    '''
+    Worker process: solving the instance read from the standard input with one approach, and writing the
+    result as a JSON line to the standard output. Everything printed by the approach goes to the standard error.
+    The options are passed to the get_placement function of the approach (e.g. {'encoding': 'difference'} for SMT).
+    The result holds the time spent building and solving the instance, without the start of the process.
+    '''
+    raw_instance = json.load(sys.stdin)
+
+    result_output = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    # the approach modules are imported from their own folder, where the relative paths of the models hold
+    source_folder = APPROACHES[approach][0]
+    os.chdir(source_folder)
+    sys.path.insert(0, source_folder)
+    for module in ['utils', 'instance', 'main']:
+        sys.modules.pop(module, None)
+
+    from instance import Instance
+    if approach == 'MIP' and rotation:
+        from main_rot import get_placement
+    else:
+        from main import get_placement
+
+    start_time = time.perf_counter()
+    instance = Instance(raw_instance, '0_instance', rotation, simmetry_breaking)
+    placement = get_placement(instance, time_limit, **(options or {}))
+    solve_time = time.perf_counter() - start_time
+
+    if placement is None:
+        result = {'circuits': None, 'time': solve_time}
+    else:
+        circuits, height, optimal = placement
+        result = {'circuits': [[int(value) for value in circuit] for circuit in circuits], 'height': int(height), 'optimal': bool(optimal),
+                  'time': solve_time}
+    result_output.write(json.dumps(result) + '\n')
+    result_output.close()
+
+
+def start_worker(approach, raw_instance, rotation, simmetry_breaking, time_limit, log_file, options=None):
+    '''
+    Starting the worker process of an approach, in its own process group so that it can be killed with its children.
+    The options ({name: value}) are passed to the get_placement function of the approach.
+    '''
+    command = [sys.executable, os.path.abspath(__file__), '--worker', approach, '--time_limit', str(time_limit)]
+    for key, value in (options or {}).items():
+        command += ['--option', f'{key}={value}']
+    if rotation:
+        command.append('--rotation')
+    if simmetry_breaking:
+        command.append('--simmetry_breaking')
+
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=log_file, text=True, start_new_session=True)
+    process.stdin.write(json.dumps(raw_instance))
+    process.stdin.close()
+    return process
+
+
+def kill_worker(process, grace=1.0):
+    '''
+    Terminating a worker and all the processes it started (e.g. the MiniZinc solver)
+    '''
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(grace)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def race(approaches, raw_instance, rotation, simmetry_breaking, time_limit, log_file=subprocess.DEVNULL):
+    '''
+    Racing the approaches on an instance. The first proven optimal placement wins and the other workers are killed.
+    If no worker proves optimality within the time limit, the lowest placement found is returned.
+    It returns (approach, circuits, height, optimal), or None if no placement is found.
+    '''
+    plate_width, sizes = raw_instance
+
+    workers = {approach: start_worker(approach, raw_instance, rotation, simmetry_breaking, time_limit, log_file) for approach in approaches}
+    # the workers stop by themselves at the time limit, a small grace period is given for the model building
+    deadline = time.time() + time_limit + 10
+    best = None
+
+    try:
+        while workers and time.time() < deadline:
+            for approach, process in list(workers.items()):
+                if process.poll() is None:
+                    continue
+                del workers[approach]
+
+                try:
+                    result = json.loads(process.stdout.read() or '{}')
+                except json.JSONDecodeError:
+                    result = {}
+                process.stdout.close()
+                if result.get('circuits') is None:
+                    continue
+
+                # a placement is accepted only if it is a solution of the instance
+                problems = check_solution(plate_width, result['height'], result['circuits'], sizes, rotation)
+                if problems:
+                    print(f"\nWrong solution from {approach}: {'; '.join(problems)}")
+                    continue
+
+                if best is None or result['height'] < best[2]:
+                    best = (approach, result['circuits'], result['height'], result['optimal'])
+                if result['optimal']:
+                    return best
+            time.sleep(0.02)
+    finally:
+        for process in workers.values():
+            kill_worker(process)
+
+    return best
+
+
+if __name__ == '__main__':
+
+    # Create an argument parser
+    parser = argparse.ArgumentParser(description='Portfolio argument parsing')
+
+    # Add arguments
+    parser.add_argument('--folder_name', type=str, default='./input/', help='Input instances: a folder, a glob pattern, a bundle file or - for the standard input')
+    parser.add_argument('--rotation', action='store_true', help='Set circuit rotation to True')
+    parser.add_argument('--simmetry_breaking', action='store_true', help='Set solving simmetry breaking to True')
+    parser.add_argument('--approaches', type=str, nargs='+', default=list(APPROACHES), choices=list(APPROACHES), help='Approaches raced on every instance')
+    parser.add_argument('--time_limit', type=float, default=300, help='Time limit for each instance, in seconds')
+    parser.add_argument('--log', type=str, default=None, help='File collecting the output of the workers')
+    parser.add_argument('--renderer', type=str, default='matplotlib', choices=RENDERERS, help='Renderer of the solution images: matplotlib, fast (numpy PNG) or svg')
+    parser.add_argument('--no_render', '--no-render', action='store_true', help='Do not draw the solution images, they can be drawn later by render.py')
+    parser.add_argument('--worker', type=str, default=None, choices=list(APPROACHES), help=argparse.SUPPRESS)
+    parser.add_argument('--option', type=str, action='append', default=[], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        run_worker(args.worker, args.rotation, args.simmetry_breaking, args.time_limit, parse_options(args.option))
+        sys.exit(0)
+
+    rotation = args.rotation
+    simmetry_breaking = args.simmetry_breaking
+    renderer = None if args.no_render else args.renderer
+
+    approaches = [approach for approach in args.approaches if is_available(approach)]
+    for approach in args.approaches:
+        if approach not in approaches:
+            print(f"{approach} is not available, the packages {APPROACHES[approach][1]} are needed")
+    if not approaches:
+        sys.exit("No approach available")
+
+    output_txt_path, output_img_path, output_failure_path = set_environment(rotation, simmetry_breaking)
+    log_file = open(args.log, 'a') if args.log is not None else subprocess.DEVNULL
+
+    for i, raw_instance in enumerate(tqdm(iter_instances(args.folder_name))):
+
+        # starting timing operation
+        start_time = time.time()
+
+        best = race(approaches, raw_instance, rotation, simmetry_breaking, args.time_limit, log_file)
+
+        end_time = time.time()
+
+        if best is None:
+            # write the instance in failures file
+            with open(output_failure_path, 'a') as output:
+                output.write(f'Instance {i + 1} failed')
+                output.write('\n')
+            print("\nFailed to solve instance %i" % (i + 1))
+            continue
+
+        approach, circuits, height, optimal = best
+        plate_width = raw_instance.plate_width
+
+        if renderer == 'matplotlib':
+            plot_solution(plate_width, height, circuits, output_img_path + f'out-{i + 1}.png')
+        elif renderer is not None:
+            render_solution(plate_width, height, circuits, output_img_path + f'out-{i + 1}.png', renderer)
+        output_solution(circuits, plate_width, height, output_txt_path + f'out-{i + 1}.txt')
+
+        print(f"\nSolution found for instance {i + 1} by {approach}")
+        print(f"minimum height found is: {height}{'' if optimal else ' (not proven optimal)'}")
+        print(f"The time requested for this instance was: {end_time - start_time}")
+
+    if log_file is not subprocess.DEVNULL:
+        log_file.close()
@@ -0,0 +1,79 @@
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# The readers and the renderers of the SAT approach take the placed circuits as [width, height, x, y]
+sys.path.insert(0, os.path.join(ROOT, 'SAT', 'src'))
+from renderer import RENDERERS, render_solution
+from verifier import read_solution
+
+
+def get_render_jobs(folders, renderer, force=False):
+    '''
+    Listing the images to draw, as (txt_path, image_path) pairs. Every out-N.txt file of the txt tree of an output
+    folder has its image in the same place of the img tree. Images newer than their textual solution are skipped,
+    unless force is True.
+    '''
+    extension = '.svg' if renderer == 'svg' else '.png'
+    jobs = []
+    for folder in folders:
+        txt_folder = os.path.join(folder, 'txt')
+        for txt_path in sorted(glob.glob(os.path.join(txt_folder, '**', 'out-*.txt'), recursive=True)):
+            relative_path = os.path.relpath(txt_path, txt_folder)
+            image_path = os.path.join(folder, 'img', os.path.splitext(relative_path)[0] + extension)
+            if not force and os.path.exists(image_path) and os.path.getmtime(image_path) >= os.path.getmtime(txt_path):
+                continue
+            jobs.append((txt_path, image_path))
+    return jobs
+
+
+def render_file(job, renderer):
+    '''
+    Drawing the image of a textual solution. It returns the path of the textual solution and the error, None if it succeeded
+    '''
+    txt_path, image_path = job
+    try:
+        width, height, circuits = read_solution(txt_path)
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        if renderer == 'matplotlib':
+            # matplotlib is only loaded by the processes drawing with it
+            from utils import plot_solution
+            plot_solution(width, height, circuits.tolist(), image_path)
+        else:
+            render_solution(width, height, circuits.tolist(), image_path, renderer)
+    except (OSError, ValueError) as error:
+        return txt_path, str(error)
+    return txt_path, None
+
+
+if __name__ == '__main__':
+
+    # Create an argument parser
+    parser = argparse.ArgumentParser(description='Render argument parsing')
+
+    # Add arguments
+    parser.add_argument('folders', type=str, nargs='*', help='Output folders holding a txt folder (default: every out* folder of the approaches)')
+    parser.add_argument('--renderer', type=str, default='fast', choices=RENDERERS, help='Renderer of the solution images: matplotlib, fast (numpy PNG) or svg')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Number of processes drawing the images in parallel')
+    parser.add_argument('--force', action='store_true', help='Draw again the images newer than their textual solution')
+    args = parser.parse_args()
+
+    folders = args.folders or sorted(os.path.dirname(folder) for folder in glob.glob(os.path.join('*', 'out*', 'txt')))
+    jobs = get_render_jobs(folders, args.renderer, args.force)
+    print(f"{len(jobs)} images to draw in {len(folders)} folders")
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=max(args.jobs, 1)) as executor:
+        results = executor.map(render_file, jobs, [args.renderer] * len(jobs), chunksize=16)
+        for txt_path, error in tqdm(results, total=len(jobs)):
+            if error is not None:
+                failures += 1
+                print(f"\nFailed to draw {txt_path}: {error}")
+
+    if failures > 0:
+        sys.exit(1)